@@ -37,9 +37,17 @@ del sys.argv[1]
 extensionName = re.sub("\.pyx", "", fileToCompile)
 
 
+# OpenMP is used by the prange loops, the compilers not supporting -fopenmp, e.g., the default one on macOS,
+# compile them as sequential loops
+if sys.platform == "darwin":
+    openmp_args = []
+else:
+    openmp_args = ['-fopenmp']
+
 ext_modules = Extension(extensionName,
                 [fileToCompile],
-                extra_compile_args=['-O2'],
+                extra_compile_args=['-O2'] + openmp_args,
+                extra_link_args=openmp_args,
                 include_dirs=[numpy.get_include(),],
                 )
 
@@ -9,13 +9,14 @@ Created on 26/06/18
 import numpy as np
 import scipy.sparse as sps
 import time, sys, copy
+import multiprocessing
 import pandas as pd
 
 from enum import Enum
 from Utils.seconds_to_biggest_unit import seconds_to_biggest_unit
 
-from Evaluation.metrics import precision, precision_recall_min_denominator, recall, MAP, MAP_MIN_DEN, MRR, HIT_RATE, \
-    ndcg, arhr_all_hits, \
+from Evaluation.metrics import precision_batch, precision_recall_min_denominator_batch, recall_batch, MAP, MAP_MIN_DEN, MRR, HIT_RATE, \
+    ndcg_batch, arhr_all_hits_batch, \
     Novelty, Coverage_Item, Coverage_Item_Correct, _Metrics_Object, Coverage_User, Coverage_User_Correct, \
     Gini_Diversity, Shannon_Entropy, Diversity_MeanInterList, \
     Diversity_Herfindahl, AveragePopularity, Ratio_Diversity_Gini, Ratio_Diversity_Herfindahl, Ratio_Shannon_Entropy, \
@@ -53,17 +54,44 @@ class EvaluatorMetrics(Enum):
     RATIO_NOVELTY = "RATIO_NOVELTY"
 
 
+# Metrics whose objects are built from URM_train, which is expensive for the Ratio_* ones
+_TRAIN_DEPENDENT_METRICS = [EvaluatorMetrics.NOVELTY, EvaluatorMetrics.AVERAGE_POPULARITY,
+                            EvaluatorMetrics.RATIO_DIVERSITY_GINI, EvaluatorMetrics.RATIO_DIVERSITY_HERFINDAHL,
+                            EvaluatorMetrics.RATIO_SHANNON_ENTROPY, EvaluatorMetrics.RATIO_AVERAGE_POPULARITY,
+                            EvaluatorMetrics.RATIO_NOVELTY]
+
+
+def _get_metrics_list(metrics_list):
+    """
+    Checks the selected metrics, either EvaluatorMetrics or their string values, None selects all of them.
+    F1 is computed from PRECISION and RECALL, which are therefore added if needed.
+    :return: list of EvaluatorMetrics, in the order they are defined in the enum
+    """
+
+    if metrics_list is None:
+        return list(EvaluatorMetrics)
+
+    metrics_list = [EvaluatorMetrics(metric) for metric in metrics_list]
+
+    if EvaluatorMetrics.F1 in metrics_list:
+        metrics_list.extend([EvaluatorMetrics.PRECISION, EvaluatorMetrics.RECALL])
+
+    return [metric for metric in EvaluatorMetrics if metric in metrics_list]
+
+
 def _create_empty_metrics_dict(cutoff_list, n_items, n_users, URM_train, URM_test, ignore_items, ignore_users,
-                               diversity_similarity_object):
+                               diversity_similarity_object, metrics_list=None):
     empty_dict = {}
 
     # global_RMSE_object = RMSE(URM_train + URM_test)
 
+    metrics_list = _get_metrics_list(metrics_list)
+
     for cutoff in cutoff_list:
 
         cutoff_dict = {}
 
-        for metric in EvaluatorMetrics:
+        for metric in metrics_list:
             if metric == EvaluatorMetrics.COVERAGE_ITEM:
                 cutoff_dict[metric.value] = Coverage_Item(n_items, ignore_items)
 
@@ -148,6 +176,15 @@ def get_result_string_df(results_run_df, n_decimals=7):
     return output_str
 
 
+def _is_same_URM(URM_1, URM_2):
+
+    URM_1 = sps.csr_matrix(URM_1)
+
+    return URM_1.shape == URM_2.shape and URM_1.nnz == URM_2.nnz and \
+           np.array_equal(URM_1.indptr, URM_2.indptr) and np.array_equal(URM_1.indices, URM_2.indices) and \
+           np.array_equal(URM_1.data, URM_2.data)
+
+
 def _remove_item_interactions(URM, item_list):
     URM = sps.csc_matrix(URM.copy())
 
@@ -163,6 +200,28 @@ def _remove_item_interactions(URM, item_list):
     return URM
 
 
+# Set by the parent process before forking the evaluation workers
+_parallel_evaluator = None
+_parallel_recommender_object = None
+_parallel_empty_metrics_dict = None
+
+
+def _evaluate_users_in_subprocess(users_to_evaluate):
+
+    evaluator = _parallel_evaluator
+
+    # Progress is reported by the parent process once the partial results are merged
+    evaluator.verbose = False
+    evaluator._n_users_evaluated = 0
+    evaluator._start_time_print = time.time()
+
+    # Each process has its own copy of the metrics dictionary built by the parent
+    results_dict = evaluator._run_evaluation_on_selected_users(_parallel_recommender_object, users_to_evaluate,
+                                                               empty_metrics_dict=_parallel_empty_metrics_dict)
+
+    return results_dict, evaluator._n_users_evaluated
+
+
 class Evaluator(object):
     """Abstract Evaluator"""
 
@@ -172,11 +231,29 @@ class Evaluator(object):
                  diversity_object=None,
                  ignore_items=None,
                  ignore_users=None,
-                 verbose=True):
+                 verbose=True,
+                 n_processes=1,
+                 metrics_list=None):
+        """
+        :param n_processes:     number of processes among which the users to evaluate are split. The processes are
+                                forked, so they share the fitted recommender without copying it, and their partial
+                                results are merged with merge_with_other. Requires the "fork" start method.
+        :param metrics_list:    list of EvaluatorMetrics (or their string values) to compute, None computes all of them.
+                                Only the selected metric objects are built and updated.
+        """
 
         super(Evaluator, self).__init__()
 
         self.verbose = verbose
+        self.n_processes = n_processes
+        self.metrics_list = _get_metrics_list(metrics_list)
+
+        # The metrics built from URM_train are created only when needed and reused while URM_train does not change
+        self._empty_metrics_dict_URM_train = None
+        self._empty_metrics_dict = None
+
+        assert n_processes >= 1, "{}: n_processes must be a positive integer, provided value was {}".format(
+            self.EVALUATOR_NAME, n_processes)
 
         if ignore_items is None:
             self.ignore_items_flag = False
@@ -262,7 +339,10 @@ class Evaluator(object):
         self._start_time_print = time.time()
         self._n_users_evaluated = 0
 
-        results_dict = self._run_evaluation_on_selected_users(recommender_object, self.users_to_evaluate)
+        if self.n_processes > 1 and len(self.users_to_evaluate) > 1:
+            results_dict = self._run_evaluation_on_selected_users_parallel(recommender_object, self.users_to_evaluate)
+        else:
+            results_dict = self._run_evaluation_on_selected_users(recommender_object, self.users_to_evaluate)
 
         if self._n_users_evaluated > 0:
 
@@ -304,6 +384,85 @@ class Evaluator(object):
 
         return results_df, results_run_string
 
+    def _get_empty_metrics_dict(self, recommender_object):
+        """
+        Creates the metric objects of the selected metrics. The ones depending on URM_train are built at the first
+        evaluation that needs them and then copied as long as the recommender has the same URM_train
+        """
+
+        if not any(metric in _TRAIN_DEPENDENT_METRICS for metric in self.metrics_list):
+            return _create_empty_metrics_dict(self.cutoff_list, self.n_items, self.n_users, None, self.URM_test,
+                                              self.ignore_items_ID, self.ignore_users_ID, self.diversity_object,
+                                              metrics_list=self.metrics_list)
+
+        URM_train = recommender_object.URM_train
+
+        if self._empty_metrics_dict is None or not _is_same_URM(URM_train, self._empty_metrics_dict_URM_train):
+
+            URM_train = recommender_object.get_URM_train()
+
+            self._empty_metrics_dict = _create_empty_metrics_dict(self.cutoff_list, self.n_items, self.n_users,
+                                                                  URM_train, self.URM_test,
+                                                                  self.ignore_items_ID, self.ignore_users_ID,
+                                                                  self.diversity_object,
+                                                                  metrics_list=self.metrics_list)
+            self._empty_metrics_dict_URM_train = sps.csr_matrix(URM_train, copy=True)
+
+        return copy.deepcopy(self._empty_metrics_dict)
+
+    def _run_evaluation_on_selected_users_parallel(self, recommender_object, users_to_evaluate):
+        """
+        Splits the users among n_processes forked processes, each one evaluates its users with
+        _run_evaluation_on_selected_users and the partial results are then merged
+        """
+
+        global _parallel_evaluator, _parallel_recommender_object, _parallel_empty_metrics_dict
+
+        users_to_evaluate_split = [users_split.tolist() for users_split in
+                                   np.array_split(np.array(users_to_evaluate), min(self.n_processes, len(users_to_evaluate)))]
+
+        # The forked processes inherit the evaluator, the fitted recommender and the metric objects through these
+        # module variables, so the metrics depending on URM_train are built once rather than in each process
+        _parallel_evaluator = self
+        _parallel_recommender_object = recommender_object
+        _parallel_empty_metrics_dict = self._get_empty_metrics_dict(recommender_object)
+
+        try:
+            with multiprocessing.get_context("fork").Pool(processes=len(users_to_evaluate_split)) as pool:
+                partial_results_list = pool.map(_evaluate_users_in_subprocess, users_to_evaluate_split, chunksize=1)
+
+        finally:
+            _parallel_evaluator = None
+            _parallel_recommender_object = None
+            _parallel_empty_metrics_dict = None
+
+        results_dict, n_users_evaluated = partial_results_list[0]
+
+        for partial_results_dict, partial_n_users_evaluated in partial_results_list[1:]:
+            n_users_evaluated += partial_n_users_evaluated
+
+            for cutoff in results_dict.keys():
+                results_current_cutoff = results_dict[cutoff]
+
+                for key, partial_value in partial_results_dict[cutoff].items():
+                    if isinstance(partial_value, _Metrics_Object):
+                        results_current_cutoff[key].merge_with_other(partial_value)
+                    else:
+                        results_current_cutoff[key] += partial_value
+
+        self._n_users_evaluated = n_users_evaluated
+
+        elapsed_time = time.time() - self._start_time
+        new_time_value, new_time_unit = seconds_to_biggest_unit(elapsed_time)
+
+        self._print("Processed {} users with {} processes in {:.2f} {}. Users per second: {:.0f}".format(
+            self._n_users_evaluated,
+            len(users_to_evaluate_split),
+            new_time_value, new_time_unit,
+            float(self._n_users_evaluated) / elapsed_time))
+
+        return results_dict
+
     def get_user_relevant_items(self, user_id):
 
         assert self.URM_test.getformat() == "csr", "Evaluator_Base_Class: URM_test is not CSR, this will cause errors in getting relevant items"
@@ -316,6 +475,77 @@ class Evaluator(object):
 
         return self.URM_test.data[self.URM_test.indptr[user_id]:self.URM_test.indptr[user_id + 1]]
 
+    def _get_recommended_items_batch_array(self, recommended_items_batch_list):
+        """
+        Transforms the list of recommendation lists in an array (n_users, max_cutoff), padded with -1
+        """
+
+        recommended_items_batch = - np.ones((len(recommended_items_batch_list), self.max_cutoff), dtype=np.int64)
+
+        if len(recommended_items_batch_list) == 0:
+            return recommended_items_batch
+
+        list_length = np.array([min(len(recommended_items), self.max_cutoff) for recommended_items in recommended_items_batch_list])
+
+        if np.all(list_length == self.max_cutoff):
+            recommended_items_batch[:] = np.array([recommended_items[0:self.max_cutoff] for recommended_items in recommended_items_batch_list])
+            return recommended_items_batch
+
+        user_row = np.repeat(np.arange(len(list_length)), list_length)
+        user_col = np.arange(list_length.sum()) - np.repeat(np.cumsum(list_length) - list_length, list_length)
+
+        recommended_items_batch[user_row, user_col] = np.concatenate([np.asarray(recommended_items[0:self.max_cutoff], dtype=np.int64)
+                                                                      for recommended_items in recommended_items_batch_list])
+
+        return recommended_items_batch
+
+    def _get_relevance_batch(self, test_user_batch_array, recommended_items_batch, compute_ideal_scores=True):
+        """
+        Looks up the recommended items in the test data of all the users in the batch at once
+        :return: is_relevant_batch:     boolean array (n_users, max_cutoff)
+                 rank_scores_batch:     array (n_users, max_cutoff), test rating of each recommended item, 0.0 if not relevant
+                 ideal_scores_batch:    array (n_users, max_cutoff), test ratings of each user in decreasing order, 0.0 padded,
+                                        None if compute_ideal_scores is False
+                 n_test_items:          number of test items of each user
+        """
+
+        assert self.URM_test.getformat() == "csr", "Evaluator_Base_Class: URM_test is not CSR, this will cause errors in getting relevant items"
+
+        URM_test_batch = self.URM_test[test_user_batch_array]
+
+        n_test_items = np.ediff1d(URM_test_batch.indptr)
+        test_row = np.repeat(np.arange(len(test_user_batch_array), dtype=np.int64), n_test_items)
+
+        # Each (user, item) couple is encoded in a single key, sorted to allow a binary search
+        test_key = test_row * self.n_items + URM_test_batch.indices
+        test_key_sorting = np.argsort(test_key, kind="stable")
+        test_key = test_key[test_key_sorting]
+        test_rating = URM_test_batch.data[test_key_sorting].astype(np.float64)
+
+        recommended_key = np.arange(len(test_user_batch_array), dtype=np.int64)[:, None] * self.n_items + recommended_items_batch
+
+        test_position = np.minimum(np.searchsorted(test_key, recommended_key), max(len(test_key) - 1, 0))
+
+        if len(test_key) > 0:
+            is_relevant_batch = np.logical_and(test_key[test_position] == recommended_key, recommended_items_batch >= 0)
+            rank_scores_batch = np.where(is_relevant_batch, test_rating[test_position], 0.0)
+        else:
+            is_relevant_batch = np.zeros(recommended_items_batch.shape, dtype=np.bool_)
+            rank_scores_batch = np.zeros(recommended_items_batch.shape, dtype=np.float64)
+
+        if not compute_ideal_scores:
+            return is_relevant_batch, rank_scores_batch, None, n_test_items
+
+        # Sort the test ratings of each user in decreasing order and keep the first max_cutoff
+        rating_sorting = np.lexsort((-URM_test_batch.data, test_row))
+        rating_col = np.arange(len(test_row)) - np.repeat(URM_test_batch.indptr[:-1], n_test_items)
+        rating_mask = rating_col < self.max_cutoff
+
+        ideal_scores_batch = np.zeros(recommended_items_batch.shape, dtype=np.float64)
+        ideal_scores_batch[test_row[rating_mask], rating_col[rating_mask]] = URM_test_batch.data[rating_sorting][rating_mask]
+
+        return is_relevant_batch, rank_scores_batch, ideal_scores_batch, n_test_items
+
     def _compute_metrics_on_recommendation_list(self, test_user_batch_array, recommended_items_batch_list, scores_batch,
                                                 results_dict):
 
@@ -331,88 +561,83 @@ class Evaluator(object):
                    1] == self.n_items, "{}: scores_batch contained scores for {} items, expected was {}".format(
             self.EVALUATOR_NAME, scores_batch.shape[1], self.n_items)
 
-        # Compute recommendation quality for each user in batch
-        for batch_user_index in range(len(recommended_items_batch_list)):
+        test_user_batch_array = np.asarray(test_user_batch_array)
 
-            test_user = test_user_batch_array[batch_user_index]
+        # Compute recommendation quality for all users in batch
+        recommended_items_batch = self._get_recommended_items_batch_array(recommended_items_batch_list)
+        recommended_mask = recommended_items_batch >= 0
+        n_recommended = recommended_mask.sum(axis=1)
 
-            relevant_items = self.get_user_relevant_items(test_user)
+        is_relevant_batch, rank_scores_batch, ideal_scores_batch, n_test_items = self._get_relevance_batch(test_user_batch_array,
+                                                                                                          recommended_items_batch,
+                                                                                                          compute_ideal_scores=EvaluatorMetrics.NDCG in self.metrics_list)
 
-            # Add the RMSE to the global object, no need to loop through the various cutoffs
-            # This repository is not designed to ensure proper RMSE optimization
-            # relevant_items_rating = self.get_user_test_ratings(test_user)
-            #
-            # all_items_predicted_ratings = scores_batch[batch_user_index]
-            # global_RMSE_object = results_dict[self.cutoff_list[0]][EvaluatorMetrics.RMSE.value]
-            # global_RMSE_object.add_recommendations(all_items_predicted_ratings, relevant_items, relevant_items_rating)
+        # Add the RMSE to the global object, no need to loop through the various cutoffs
+        # This repository is not designed to ensure proper RMSE optimization
 
-            # Being the URM CSR, the indices are the non-zero column indexes
-            recommended_items = recommended_items_batch_list[batch_user_index]
-            is_relevant = np.in1d(recommended_items, relevant_items, assume_unique=True)
+        self._n_users_evaluated += len(test_user_batch_array)
 
-            self._n_users_evaluated += 1
+        for cutoff in self.cutoff_list:
 
-            for cutoff in self.cutoff_list:
+            results_current_cutoff = results_dict[cutoff]
 
-                results_current_cutoff = results_dict[cutoff]
+            is_relevant_current_cutoff = is_relevant_batch[:, 0:cutoff]
+            recommended_items_current_cutoff = recommended_items_batch[:, 0:cutoff]
+            n_recommended_current_cutoff = np.minimum(n_recommended, cutoff)
+
+            # Only the selected metrics are in the dictionary
+            if EvaluatorMetrics.PRECISION.value in results_current_cutoff:
+                results_current_cutoff[EvaluatorMetrics.PRECISION.value] += np.sum(precision_batch(is_relevant_current_cutoff, n_recommended_current_cutoff))
 
-                is_relevant_current_cutoff = is_relevant[0:cutoff]
-                recommended_items_current_cutoff = recommended_items[0:cutoff]
-
-                results_current_cutoff[EvaluatorMetrics.PRECISION.value] += precision(is_relevant_current_cutoff)
-                results_current_cutoff[
-                    EvaluatorMetrics.PRECISION_RECALL_MIN_DEN.value] += precision_recall_min_denominator(
-                    is_relevant_current_cutoff, len(relevant_items))
-                results_current_cutoff[EvaluatorMetrics.RECALL.value] += recall(is_relevant_current_cutoff,
-                                                                                relevant_items)
-                results_current_cutoff[EvaluatorMetrics.NDCG.value] += ndcg(recommended_items_current_cutoff,
-                                                                            relevant_items,
-                                                                            relevance=self.get_user_test_ratings(
-                                                                                test_user), at=cutoff)
-                results_current_cutoff[EvaluatorMetrics.ARHR.value] += arhr_all_hits(is_relevant_current_cutoff)
-
-                results_current_cutoff[EvaluatorMetrics.MRR.value].add_recommendations(is_relevant_current_cutoff)
-                results_current_cutoff[EvaluatorMetrics.MAP.value].add_recommendations(is_relevant_current_cutoff,
-                                                                                       relevant_items)
-                results_current_cutoff[EvaluatorMetrics.MAP_MIN_DEN.value].add_recommendations(
-                    is_relevant_current_cutoff, relevant_items)
-                results_current_cutoff[EvaluatorMetrics.HIT_RATE.value].add_recommendations(is_relevant_current_cutoff)
-
-                results_current_cutoff[EvaluatorMetrics.NOVELTY.value].add_recommendations(
-                    recommended_items_current_cutoff)
-                results_current_cutoff[EvaluatorMetrics.AVERAGE_POPULARITY.value].add_recommendations(
-                    recommended_items_current_cutoff)
-                results_current_cutoff[EvaluatorMetrics.DIVERSITY_GINI.value].add_recommendations(
-                    recommended_items_current_cutoff)
-                results_current_cutoff[EvaluatorMetrics.SHANNON_ENTROPY.value].add_recommendations(
-                    recommended_items_current_cutoff)
-                results_current_cutoff[EvaluatorMetrics.COVERAGE_ITEM.value].add_recommendations(
-                    recommended_items_current_cutoff)
-                results_current_cutoff[EvaluatorMetrics.COVERAGE_ITEM_CORRECT.value].add_recommendations(
+            if EvaluatorMetrics.PRECISION_RECALL_MIN_DEN.value in results_current_cutoff:
+                results_current_cutoff[EvaluatorMetrics.PRECISION_RECALL_MIN_DEN.value] += np.sum(precision_recall_min_denominator_batch(
+                    is_relevant_current_cutoff, n_recommended_current_cutoff, n_test_items))
+
+            if EvaluatorMetrics.RECALL.value in results_current_cutoff:
+                results_current_cutoff[EvaluatorMetrics.RECALL.value] += np.sum(recall_batch(is_relevant_current_cutoff, n_test_items))
+
+            if EvaluatorMetrics.NDCG.value in results_current_cutoff:
+                results_current_cutoff[EvaluatorMetrics.NDCG.value] += np.sum(ndcg_batch(rank_scores_batch[:, 0:cutoff],
+                                                                                         ideal_scores_batch[:, 0:cutoff]))
+
+            if EvaluatorMetrics.ARHR.value in results_current_cutoff:
+                results_current_cutoff[EvaluatorMetrics.ARHR.value] += np.sum(arhr_all_hits_batch(is_relevant_current_cutoff))
+
+            if EvaluatorMetrics.MAP.value in results_current_cutoff:
+                results_current_cutoff[EvaluatorMetrics.MAP.value].add_recommendations_batch(is_relevant_current_cutoff,
+                                                                                             n_recommended_current_cutoff)
+
+            if EvaluatorMetrics.MAP_MIN_DEN.value in results_current_cutoff:
+                results_current_cutoff[EvaluatorMetrics.MAP_MIN_DEN.value].add_recommendations_batch(
+                    is_relevant_current_cutoff, n_recommended_current_cutoff, n_test_items)
+
+            # Metrics using only the relevance of the recommended items
+            for metric in [EvaluatorMetrics.MRR, EvaluatorMetrics.HIT_RATE]:
+                if metric.value in results_current_cutoff:
+                    results_current_cutoff[metric.value].add_recommendations_batch(is_relevant_current_cutoff)
+
+            if EvaluatorMetrics.COVERAGE_ITEM_CORRECT.value in results_current_cutoff:
+                results_current_cutoff[EvaluatorMetrics.COVERAGE_ITEM_CORRECT.value].add_recommendations_batch(
                     recommended_items_current_cutoff, is_relevant_current_cutoff)
-                results_current_cutoff[EvaluatorMetrics.COVERAGE_USER.value].add_recommendations(
-                    recommended_items_current_cutoff, test_user)
-                results_current_cutoff[EvaluatorMetrics.COVERAGE_USER_CORRECT.value].add_recommendations(
-                    is_relevant_current_cutoff, test_user)
-                results_current_cutoff[EvaluatorMetrics.DIVERSITY_MEAN_INTER_LIST.value].add_recommendations(
-                    recommended_items_current_cutoff)
-                results_current_cutoff[EvaluatorMetrics.DIVERSITY_HERFINDAHL.value].add_recommendations(
-                    recommended_items_current_cutoff)
-
-                results_current_cutoff[EvaluatorMetrics.RATIO_SHANNON_ENTROPY.value].add_recommendations(
-                    recommended_items_current_cutoff)
-                results_current_cutoff[EvaluatorMetrics.RATIO_DIVERSITY_HERFINDAHL.value].add_recommendations(
-                    recommended_items_current_cutoff)
-                results_current_cutoff[EvaluatorMetrics.RATIO_DIVERSITY_GINI.value].add_recommendations(
-                    recommended_items_current_cutoff)
-                results_current_cutoff[EvaluatorMetrics.RATIO_NOVELTY.value].add_recommendations(
-                    recommended_items_current_cutoff)
-                results_current_cutoff[EvaluatorMetrics.RATIO_AVERAGE_POPULARITY.value].add_recommendations(
-                    recommended_items_current_cutoff)
-
-                if EvaluatorMetrics.DIVERSITY_SIMILARITY.value in results_current_cutoff:
-                    results_current_cutoff[EvaluatorMetrics.DIVERSITY_SIMILARITY.value].add_recommendations(
-                        recommended_items_current_cutoff)
+
+            if EvaluatorMetrics.COVERAGE_USER.value in results_current_cutoff:
+                results_current_cutoff[EvaluatorMetrics.COVERAGE_USER.value].add_recommendations_batch(
+                    n_recommended_current_cutoff, test_user_batch_array)
+
+            if EvaluatorMetrics.COVERAGE_USER_CORRECT.value in results_current_cutoff:
+                results_current_cutoff[EvaluatorMetrics.COVERAGE_USER_CORRECT.value].add_recommendations_batch(
+                    is_relevant_current_cutoff, test_user_batch_array)
+
+            # Metrics using only the recommended items
+            for metric in [EvaluatorMetrics.NOVELTY, EvaluatorMetrics.AVERAGE_POPULARITY,
+                           EvaluatorMetrics.DIVERSITY_GINI, EvaluatorMetrics.SHANNON_ENTROPY,
+                           EvaluatorMetrics.COVERAGE_ITEM, EvaluatorMetrics.DIVERSITY_MEAN_INTER_LIST,
+                           EvaluatorMetrics.DIVERSITY_HERFINDAHL, EvaluatorMetrics.RATIO_SHANNON_ENTROPY,
+                           EvaluatorMetrics.RATIO_DIVERSITY_HERFINDAHL, EvaluatorMetrics.RATIO_DIVERSITY_GINI,
+                           EvaluatorMetrics.RATIO_NOVELTY, EvaluatorMetrics.RATIO_AVERAGE_POPULARITY,
+                           EvaluatorMetrics.DIVERSITY_SIMILARITY]:
+                if metric.value in results_current_cutoff:
+                    results_current_cutoff[metric.value].add_recommendations_batch(recommended_items_current_cutoff)
 
         if time.time() - self._start_time_print > 300 or self._n_users_evaluated == len(self.users_to_evaluate):
             elapsed_time = time.time() - self._start_time
@@ -441,27 +666,29 @@ class EvaluatorHoldout(Evaluator):
                  diversity_object=None,
                  ignore_items=None,
                  ignore_users=None,
-                 verbose=True):
+                 verbose=True,
+                 n_processes=1,
+                 metrics_list=None):
 
         super(EvaluatorHoldout, self).__init__(URM_test_list, cutoff_list,
                                                diversity_object=diversity_object,
                                                min_ratings_per_user=min_ratings_per_user, exclude_seen=exclude_seen,
                                                ignore_items=ignore_items, ignore_users=ignore_users,
-                                               verbose=verbose)
+                                               verbose=verbose,
+                                               n_processes=n_processes,
+                                               metrics_list=metrics_list)
 
-    def _run_evaluation_on_selected_users(self, recommender_object, users_to_evaluate, block_size=None):
+    def _run_evaluation_on_selected_users(self, recommender_object, users_to_evaluate, block_size=None,
+                                          empty_metrics_dict=None):
 
         if block_size is None:
             # Reduce block size if estimated memory requirement exceeds 4 GB
             block_size = min([1000, int(4 * 1e9 * 8 / 64 / self.n_items), len(users_to_evaluate)])
 
-        results_dict = _create_empty_metrics_dict(self.cutoff_list,
-                                                  self.n_items, self.n_users,
-                                                  recommender_object.get_URM_train(),
-                                                  self.URM_test,
-                                                  self.ignore_items_ID,
-                                                  self.ignore_users_ID,
-                                                  self.diversity_object)
+        if empty_metrics_dict is None:
+            results_dict = self._get_empty_metrics_dict(recommender_object)
+        else:
+            results_dict = empty_metrics_dict
 
         if self.ignore_items_flag:
             recommender_object.set_items_to_ignore(self.ignore_items_ID)
@@ -502,7 +729,9 @@ class EvaluatorNegativeItemSample(Evaluator):
     def __init__(self, URM_test_list, URM_test_negative, cutoff_list, min_ratings_per_user=1, exclude_seen=True,
                  diversity_object=None,
                  ignore_items=None,
-                 ignore_users=None):
+                 ignore_users=None,
+                 n_processes=1,
+                 metrics_list=None):
         """
 
         The EvaluatorNegativeItemSample computes the recommendations by sorting the test items as well as the test_negative items
@@ -521,7 +750,9 @@ class EvaluatorNegativeItemSample(Evaluator):
                                                           diversity_object=diversity_object,
                                                           min_ratings_per_user=min_ratings_per_user,
                                                           exclude_seen=exclude_seen,
-                                                          ignore_items=ignore_items, ignore_users=ignore_users)
+                                                          ignore_items=ignore_items, ignore_users=ignore_users,
+                                                          n_processes=n_processes,
+                                                          metrics_list=metrics_list)
 
         self.URM_items_to_rank = sps.csr_matrix(self.URM_test.copy().astype(np.bool)) + sps.csr_matrix(
             URM_test_negative.copy().astype(np.bool))
@@ -537,15 +768,13 @@ class EvaluatorNegativeItemSample(Evaluator):
 
         return items_to_compute
 
-    def _run_evaluation_on_selected_users(self, recommender_object, users_to_evaluate, block_size=None):
+    def _run_evaluation_on_selected_users(self, recommender_object, users_to_evaluate, block_size=None,
+                                          empty_metrics_dict=None):
 
-        results_dict = _create_empty_metrics_dict(self.cutoff_list,
-                                                  self.n_items, self.n_users,
-                                                  recommender_object.get_URM_train(),
-                                                  self.URM_test,
-                                                  self.ignore_items_ID,
-                                                  self.ignore_users_ID,
-                                                  self.diversity_object)
+        if empty_metrics_dict is None:
+            results_dict = self._get_empty_metrics_dict(recommender_object)
+        else:
+            results_dict = empty_metrics_dict
 
         if self.ignore_items_flag:
             recommender_object.set_items_to_ignore(self.ignore_items_ID)
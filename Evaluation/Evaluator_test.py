@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 18/10/26
+"""
+
+import unittest
+from unittest import mock
+
+import numpy as np
+import scipy.sparse as sps
+
+import Evaluation.Evaluator
+from Evaluation.Evaluator import EvaluatorHoldout, EvaluatorMetrics
+from Recommenders.BaseMatrixFactorizationRecommender import BaseMatrixFactorizationRecommender
+
+
+def get_recommender_and_URM_test(n_users=200, n_items=100, n_factors=10, random_seed=42):
+
+    random_state = np.random.RandomState(random_seed)
+
+    URM_all = sps.random(n_users, n_items, density=0.1, format="csr", random_state=random_state)
+    URM_all.data = np.ones_like(URM_all.data)
+
+    URM_train, URM_test = sps.csr_matrix(sps.triu(URM_all, k=1)), sps.csr_matrix(sps.tril(URM_all))
+
+    recommender = BaseMatrixFactorizationRecommender(URM_train, verbose=False)
+    recommender.USER_factors = random_state.normal(size=(n_users, n_factors))
+    recommender.ITEM_factors = random_state.normal(size=(n_items, n_factors))
+
+    return recommender, URM_test
+
+
+class MyTestCase(unittest.TestCase):
+
+    def test_parallel_same_as_sequential(self):
+
+        recommender, URM_test = get_recommender_and_URM_test()
+
+        metrics_list = [EvaluatorMetrics.MAP, EvaluatorMetrics.NDCG, EvaluatorMetrics.COVERAGE_USER,
+                        EvaluatorMetrics.DIVERSITY_MEAN_INTER_LIST, EvaluatorMetrics.NOVELTY,
+                        EvaluatorMetrics.RATIO_AVERAGE_POPULARITY]
+
+        evaluator = EvaluatorHoldout(URM_test, [5, 10], verbose=False, metrics_list=metrics_list)
+        results_df, _ = evaluator.evaluateRecommender(recommender)
+
+        evaluator_parallel = EvaluatorHoldout(URM_test, [5, 10], verbose=False, metrics_list=metrics_list, n_processes=3)
+
+        # The metrics depending on URM_train are built once, by the parent process
+        with mock.patch.object(Evaluation.Evaluator, "_create_empty_metrics_dict",
+                               wraps=Evaluation.Evaluator._create_empty_metrics_dict) as create_empty_metrics_dict:
+            results_parallel_df, _ = evaluator_parallel.evaluateRecommender(recommender)
+
+        self.assertEqual(create_empty_metrics_dict.call_count, 1)
+        self.assertTrue(np.allclose(results_df.values.astype(np.float64), results_parallel_df.values.astype(np.float64)))
+
+
+
+if __name__ == '__main__':
+
+    unittest.main()
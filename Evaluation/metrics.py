@@ -23,6 +23,9 @@ class _Metrics_Object(object):
     def add_recommendations(self, recommended_items_ids):
         raise NotImplementedError()
 
+    def add_recommendations_batch(self, *args):
+        raise NotImplementedError()
+
     def get_metric_value(self):
         raise NotImplementedError()
 
@@ -50,11 +53,15 @@ class MAP(_Metrics_Object):
         self.cumulative_AP += average_precision(is_relevant)
         self.n_users += 1
 
+    def add_recommendations_batch(self, is_relevant_batch, n_recommended):
+        self.cumulative_AP += np.sum(average_precision_batch(is_relevant_batch, n_recommended))
+        self.n_users += is_relevant_batch.shape[0]
+
     def get_metric_value(self):
         return self.cumulative_AP / self.n_users
 
     def merge_with_other(self, other_metric_object):
-        assert other_metric_object is MAP, "MAP: attempting to merge with a metric object of different type"
+        assert isinstance(other_metric_object, MAP), "MAP: attempting to merge with a metric object of different type"
 
         self.cumulative_AP += other_metric_object.cumulative_AP
         self.n_users += other_metric_object.n_users
@@ -71,6 +78,29 @@ def average_precision(is_relevant):
     return a_p
 
 
+def _precision_at_k_batch(is_relevant_batch):
+    """
+    :param is_relevant_batch:   boolean array (n_users, cutoff), positions beyond the recommendation list are False
+    :return:                    sum over the relevant positions of the precision at that position, for each user
+    """
+
+    p_at_k = is_relevant_batch * np.cumsum(is_relevant_batch, axis=1, dtype=np.float64) / (1 + np.arange(is_relevant_batch.shape[1]))
+
+    return np.sum(p_at_k, axis=1)
+
+
+def average_precision_batch(is_relevant_batch, n_recommended):
+    """
+    Batch version of average_precision
+    :param is_relevant_batch:   boolean array (n_users, cutoff), positions beyond the recommendation list are False
+    :param n_recommended:       length of the recommendation list of each user
+    :return:
+    """
+
+    return np.divide(_precision_at_k_batch(is_relevant_batch), n_recommended,
+                     out=np.zeros(is_relevant_batch.shape[0], dtype=np.float64), where=n_recommended > 0)
+
+
 class MAP_MIN_DEN(_Metrics_Object):
     """
     Mean Average Precision, defined as the mean of the AveragePrecision over all users
@@ -87,11 +117,15 @@ class MAP_MIN_DEN(_Metrics_Object):
         self.cumulative_AP += average_precision_min_denominator(is_relevant, pos_items)
         self.n_users += 1
 
+    def add_recommendations_batch(self, is_relevant_batch, n_recommended, n_test_items):
+        self.cumulative_AP += np.sum(average_precision_min_denominator_batch(is_relevant_batch, n_recommended, n_test_items))
+        self.n_users += is_relevant_batch.shape[0]
+
     def get_metric_value(self):
         return self.cumulative_AP / self.n_users
 
     def merge_with_other(self, other_metric_object):
-        assert other_metric_object is MAP_MIN_DEN, "MAP_MIN_DEN: attempting to merge with a metric object of different type"
+        assert isinstance(other_metric_object, MAP_MIN_DEN), "MAP_MIN_DEN: attempting to merge with a metric object of different type"
 
         self.cumulative_AP += other_metric_object.cumulative_AP
         self.n_users += other_metric_object.n_users
@@ -108,6 +142,14 @@ def average_precision_min_denominator(is_relevant, pos_items):
     return a_p
 
 
+def average_precision_min_denominator_batch(is_relevant_batch, n_recommended, n_test_items):
+
+    denominator = np.minimum(n_test_items, n_recommended)
+
+    return np.divide(_precision_at_k_batch(is_relevant_batch), denominator,
+                     out=np.zeros(is_relevant_batch.shape[0], dtype=np.float64), where=n_recommended > 0)
+
+
 class MRR(_Metrics_Object):
     """
     Mean Reciprocal Rank, defined as the mean of the Reciprocal Rank over all users
@@ -124,11 +166,15 @@ class MRR(_Metrics_Object):
         self.cumulative_RR += rr(is_relevant)
         self.n_users += 1
 
+    def add_recommendations_batch(self, is_relevant_batch):
+        self.cumulative_RR += np.sum(rr_batch(is_relevant_batch))
+        self.n_users += is_relevant_batch.shape[0]
+
     def get_metric_value(self):
         return self.cumulative_RR / self.n_users
 
     def merge_with_other(self, other_metric_object):
-        assert other_metric_object is MRR, "MRR: attempting to merge with a metric object of different type"
+        assert isinstance(other_metric_object, MRR), "MRR: attempting to merge with a metric object of different type"
 
         self.cumulative_RR += other_metric_object.cumulative_RR
         self.n_users += other_metric_object.n_users
@@ -149,6 +195,14 @@ def rr(is_relevant):
         return 0.0
 
 
+def rr_batch(is_relevant_batch):
+
+    has_relevant = np.any(is_relevant_batch, axis=1)
+    first_rank = np.argmax(is_relevant_batch, axis=1) + 1
+
+    return np.where(has_relevant, 1. / first_rank, 0.0)
+
+
 class HIT_RATE(_Metrics_Object):
     """
     Hit Rate, defined as the quota of users that received at least a correct recommendation.
@@ -170,6 +224,10 @@ class HIT_RATE(_Metrics_Object):
         self.cumulative_HR += np.any(is_relevant)
         self.n_users += 1
 
+    def add_recommendations_batch(self, is_relevant_batch):
+        self.cumulative_HR += np.sum(np.any(is_relevant_batch, axis=1))
+        self.n_users += is_relevant_batch.shape[0]
+
     def get_metric_value(self):
         if self.n_users == 0:
             return 0.0
@@ -177,7 +235,7 @@ class HIT_RATE(_Metrics_Object):
         return self.cumulative_HR / self.n_users
 
     def merge_with_other(self, other_metric_object):
-        assert other_metric_object is HIT_RATE, "HR: attempting to merge with a metric object of different type"
+        assert isinstance(other_metric_object, HIT_RATE), "HR: attempting to merge with a metric object of different type"
 
         self.cumulative_HR += other_metric_object.cumulative_HR
         self.n_users += other_metric_object.n_users
@@ -242,6 +300,13 @@ def arhr_all_hits(is_relevant):
     return arhr_score
 
 
+def arhr_all_hits_batch(is_relevant_batch):
+
+    p_reciprocal = 1 / np.arange(1, is_relevant_batch.shape[1] + 1, 1.0, dtype=np.float64)
+
+    return is_relevant_batch.dot(p_reciprocal)
+
+
 def precision(is_relevant):
     if len(is_relevant) == 0:
         precision_score = 0.0
@@ -252,6 +317,12 @@ def precision(is_relevant):
     return precision_score
 
 
+def precision_batch(is_relevant_batch, n_recommended):
+
+    return np.divide(np.sum(is_relevant_batch, axis=1, dtype=np.float64), n_recommended,
+                     out=np.zeros(is_relevant_batch.shape[0], dtype=np.float64), where=n_recommended > 0)
+
+
 def precision_recall_min_denominator(is_relevant, n_test_items):
     if len(is_relevant) == 0:
         precision_score = 0.0
@@ -262,6 +333,12 @@ def precision_recall_min_denominator(is_relevant, n_test_items):
     return precision_score
 
 
+def precision_recall_min_denominator_batch(is_relevant_batch, n_recommended, n_test_items):
+
+    return np.divide(np.sum(is_relevant_batch, axis=1, dtype=np.float64), np.minimum(n_test_items, n_recommended),
+                     out=np.zeros(is_relevant_batch.shape[0], dtype=np.float64), where=n_recommended > 0)
+
+
 def recall(is_relevant, pos_items):
     recall_score = np.sum(is_relevant, dtype=np.float64) / pos_items.shape[0]
 
@@ -269,6 +346,11 @@ def recall(is_relevant, pos_items):
     return recall_score
 
 
+def recall_batch(is_relevant_batch, n_test_items):
+
+    return np.sum(is_relevant_batch, axis=1, dtype=np.float64) / n_test_items
+
+
 def ndcg(ranked_list, pos_items, relevance=None, at=None):
     if relevance is None:
         relevance = np.ones_like(pos_items)
@@ -303,6 +385,26 @@ def dcg(scores):
                   dtype=np.float64)
 
 
+def ndcg_batch(rank_scores_batch, ideal_scores_batch):
+    """
+    Batch version of ndcg
+    :param rank_scores_batch:   array (n_users, cutoff), relevance of the item recommended in each position, 0.0 if not relevant
+    :param ideal_scores_batch:  array (n_users, cutoff), relevance of the test items sorted in decreasing order, 0.0 padded
+    :return:
+    """
+
+    rank_dcg = dcg_batch(rank_scores_batch)
+    ideal_dcg = dcg_batch(ideal_scores_batch)
+
+    return np.divide(rank_dcg, ideal_dcg, out=np.zeros(len(rank_dcg), dtype=np.float64),
+                     where=np.logical_and(rank_dcg != 0.0, ideal_dcg != 0.0))
+
+
+def dcg_batch(scores_batch):
+    return np.sum(np.divide(np.power(2, scores_batch) - 1, np.log2(np.arange(scores_batch.shape[1], dtype=np.float64) + 2)),
+                  axis=1, dtype=np.float64)
+
+
 ####################################################################################################################
 ###############                 ERROR METRICS
 ####################################################################################################################
@@ -378,6 +480,13 @@ class _Global_Item_Distribution_Counter(_Metrics_Object):
         if len(recommended_items_ids) > 0:
             self.recommended_counter[recommended_items_ids] += 1
 
+    def add_recommendations_batch(self, recommended_items_batch):
+        """
+        :param recommended_items_batch: array (n_users, cutoff), positions beyond the recommendation list are -1
+        """
+        recommended_items = recommended_items_batch[recommended_items_batch >= 0]
+        self.recommended_counter += np.bincount(recommended_items, minlength=len(self.recommended_counter))
+
     def _get_recommended_items_counter(self):
         recommended_counter = self.recommended_counter.copy()
 
@@ -426,6 +535,9 @@ class Coverage_Item_Correct(_Global_Item_Distribution_Counter):
     def add_recommendations(self, recommended_items_ids, is_relevant):
         super(Coverage_Item_Correct, self).add_recommendations(np.array(recommended_items_ids)[is_relevant])
 
+    def add_recommendations_batch(self, recommended_items_batch, is_relevant_batch):
+        super(Coverage_Item_Correct, self).add_recommendations_batch(np.where(is_relevant_batch, recommended_items_batch, -1))
+
     def get_metric_value(self):
         recommended_mask = self._get_recommended_items_counter() > 0
 
@@ -498,11 +610,14 @@ class Coverage_User(_Metrics_Object):
     def add_recommendations(self, recommended_items_ids, user_id):
         self.users_mask[user_id] = len(recommended_items_ids) > 0
 
+    def add_recommendations_batch(self, n_recommended, user_id_array):
+        self.users_mask[user_id_array] = n_recommended > 0
+
     def get_metric_value(self):
         return self.users_mask.sum() / (len(self.users_mask) - self.n_ignore_users)
 
     def merge_with_other(self, other_metric_object):
-        assert other_metric_object is Coverage_User, "Coverage_User: attempting to merge with a metric object of different type"
+        assert isinstance(other_metric_object, Coverage_User), "Coverage_User: attempting to merge with a metric object of different type"
 
         self.users_mask = np.logical_or(self.users_mask, other_metric_object.users_mask)
 
@@ -526,11 +641,14 @@ class Coverage_User_Correct(_Metrics_Object):
     def add_recommendations(self, is_relevant, user_id):
         self.users_mask[user_id] = np.any(is_relevant)
 
+    def add_recommendations_batch(self, is_relevant_batch, user_id_array):
+        self.users_mask[user_id_array] = np.any(is_relevant_batch, axis=1)
+
     def get_metric_value(self):
         return self.users_mask.sum() / (len(self.users_mask) - self.n_ignore_users)
 
     def merge_with_other(self, other_metric_object):
-        assert other_metric_object is Coverage_User, "Coverage_User_Correct: attempting to merge with a metric object of different type"
+        assert isinstance(other_metric_object, Coverage_User_Correct), "Coverage_User_Correct: attempting to merge with a metric object of different type"
 
         self.users_mask = np.logical_or(self.users_mask, other_metric_object.users_mask)
 
@@ -760,6 +878,16 @@ class Novelty(_Metrics_Object):
 
             self.novelty += np.sum(-np.log2(probability) / self.n_items)
 
+    def add_recommendations_batch(self, recommended_items_batch):
+
+        self.n_evaluated_users += recommended_items_batch.shape[0]
+
+        recommended_items = recommended_items_batch[recommended_items_batch >= 0]
+        probability = self.item_popularity[recommended_items] / self.n_interactions
+        probability = probability[probability != 0]
+
+        self.novelty += np.sum(-np.log2(probability) / self.n_items)
+
     def get_metric_value(self):
 
         if self.n_evaluated_users == 0:
@@ -768,7 +896,7 @@ class Novelty(_Metrics_Object):
         return self.novelty / self.n_evaluated_users
 
     def merge_with_other(self, other_metric_object):
-        assert other_metric_object is Novelty, "Novelty: attempting to merge with a metric object of different type"
+        assert isinstance(other_metric_object, Novelty), "Novelty: attempting to merge with a metric object of different type"
 
         self.novelty = self.novelty + other_metric_object.novelty
         self.n_evaluated_users = self.n_evaluated_users + other_metric_object.n_evaluated_users
@@ -795,6 +923,9 @@ class Ratio_Novelty(_Metrics_Object):
     def add_recommendations(self, recommended_items_ids):
         self.novelty_object_recommendations.add_recommendations(recommended_items_ids)
 
+    def add_recommendations_batch(self, recommended_items_batch):
+        self.novelty_object_recommendations.add_recommendations_batch(recommended_items_batch)
+
     def get_metric_value(self):
         novelty_recommendations = self.novelty_object_recommendations.get_metric_value()
 
@@ -803,7 +934,7 @@ class Ratio_Novelty(_Metrics_Object):
         return ratio_value
 
     def merge_with_other(self, other_metric_object):
-        assert other_metric_object is Ratio_Novelty, "Ratio_Novelty: attempting to merge with a metric object of different type"
+        assert isinstance(other_metric_object, Ratio_Novelty), "Ratio_Novelty: attempting to merge with a metric object of different type"
 
         self.novelty_object_recommendations.merge_with_other(other_metric_object.novelty_object_recommendations)
 
@@ -837,6 +968,18 @@ class AveragePopularity(_Metrics_Object):
 
             self.cumulative_popularity += np.sum(recommended_items_popularity) / len(recommended_items_ids)
 
+    def add_recommendations_batch(self, recommended_items_batch):
+
+        self.n_evaluated_users += recommended_items_batch.shape[0]
+
+        recommended_mask = recommended_items_batch >= 0
+        n_recommended = recommended_mask.sum(axis=1)
+
+        recommended_items_popularity = np.where(recommended_mask, self.item_popularity_normalized[np.maximum(recommended_items_batch, 0)], 0.0)
+
+        self.cumulative_popularity += np.sum(np.divide(recommended_items_popularity.sum(axis=1), n_recommended,
+                                                       out=np.zeros(len(n_recommended), dtype=np.float64), where=n_recommended > 0))
+
     def get_metric_value(self):
 
         if self.n_evaluated_users == 0:
@@ -845,7 +988,7 @@ class AveragePopularity(_Metrics_Object):
         return self.cumulative_popularity / self.n_evaluated_users
 
     def merge_with_other(self, other_metric_object):
-        assert other_metric_object is Novelty, "AveragePopularity: attempting to merge with a metric object of different type"
+        assert isinstance(other_metric_object, AveragePopularity), "AveragePopularity: attempting to merge with a metric object of different type"
 
         self.cumulative_popularity = self.cumulative_popularity + other_metric_object.cumulative_popularity
         self.n_evaluated_users = self.n_evaluated_users + other_metric_object.n_evaluated_users
@@ -872,6 +1015,9 @@ class Ratio_AveragePopularity(_Metrics_Object):
     def add_recommendations(self, recommended_items_ids):
         self.average_popularity_recommendations.add_recommendations(recommended_items_ids)
 
+    def add_recommendations_batch(self, recommended_items_batch):
+        self.average_popularity_recommendations.add_recommendations_batch(recommended_items_batch)
+
     def get_metric_value(self):
         average_popularity_recommendations = self.average_popularity_recommendations.get_metric_value()
 
@@ -880,9 +1026,9 @@ class Ratio_AveragePopularity(_Metrics_Object):
         return ratio_value
 
     def merge_with_other(self, other_metric_object):
-        assert other_metric_object is Ratio_AveragePopularity, "Ratio_AveragePopularity: attempting to merge with a metric object of different type"
+        assert isinstance(other_metric_object, Ratio_AveragePopularity), "Ratio_AveragePopularity: attempting to merge with a metric object of different type"
 
-        self.average_popularity_recommendations.merge_with_other(other_metric_object.novelty_object_recommendations)
+        self.average_popularity_recommendations.merge_with_other(other_metric_object.average_popularity_recommendations)
 
 
 class Diversity_similarity(_Metrics_Object):
@@ -924,6 +1070,11 @@ class Diversity_similarity(_Metrics_Object):
 
         self.n_evaluated_users += 1
 
+    def add_recommendations_batch(self, recommended_items_batch):
+
+        for recommended_items_ids in recommended_items_batch:
+            self.add_recommendations(recommended_items_ids[recommended_items_ids >= 0])
+
     def get_metric_value(self):
 
         if self.n_evaluated_users == 0:
@@ -932,7 +1083,7 @@ class Diversity_similarity(_Metrics_Object):
         return self.diversity / self.n_evaluated_users
 
     def merge_with_other(self, other_metric_object):
-        assert other_metric_object is Diversity_similarity, "Diversity: attempting to merge with a metric object of different type"
+        assert isinstance(other_metric_object, Diversity_similarity), "Diversity: attempting to merge with a metric object of different type"
 
         self.diversity = self.diversity + other_metric_object.diversity
         self.n_evaluated_users = self.n_evaluated_users + other_metric_object.n_evaluated_users
@@ -1016,6 +1167,15 @@ class Diversity_MeanInterList(_Metrics_Object):
         if len(recommended_items_ids) > 0:
             self.recommended_counter[recommended_items_ids] += 1
 
+    def add_recommendations_batch(self, recommended_items_batch):
+
+        assert recommended_items_batch.shape[1] <= self.cutoff, "Diversity_MeanInterList: recommended list is contains more elements than cutoff"
+
+        self.n_evaluated_users += recommended_items_batch.shape[0]
+
+        recommended_items = recommended_items_batch[recommended_items_batch >= 0]
+        self.recommended_counter += np.bincount(recommended_items, minlength=len(self.recommended_counter))
+
     def get_metric_value(self):
 
         # Requires to compute the number of common elements for all couples of users
@@ -1045,7 +1205,7 @@ class Diversity_MeanInterList(_Metrics_Object):
 
     def merge_with_other(self, other_metric_object):
 
-        assert other_metric_object is Diversity_MeanInterList, "Diversity_MeanInterList: attempting to merge with a metric object of different type"
+        assert isinstance(other_metric_object, Diversity_MeanInterList), "Diversity_MeanInterList: attempting to merge with a metric object of different type"
 
         assert np.all(
             self.recommended_counter >= 0.0), "Diversity_MeanInterList: self.recommended_counter contains negative counts"
@@ -1183,5 +1343,148 @@ class TestNDCG(unittest.TestCase):
         self.assertTrue(np.allclose(ndcg(ranked_list_3, pos_items, pos_relevances), 0.0))
 
 
+class TestBatchMetrics(unittest.TestCase):
+    """
+    Each batch metric must be equal to the per user one on random rankings, which may be shorter than the cutoff
+    and may belong to users with fewer relevant items than the cutoff
+    """
+
+    def setUp(self):
+        random_state = np.random.RandomState(42)
+
+        self.n_users, self.n_items, self.cutoff = 300, 40, 10
+
+        # Some lists are empty or shorter than the cutoff, as when the recommender has no more items to recommend
+        self.n_recommended = random_state.randint(0, self.cutoff + 1, size=self.n_users)
+        self.n_recommended[:self.n_users // 2] = self.cutoff
+
+        # Each user has between 1 and cutoff + 5 relevant items, with integer relevance
+        self.n_test_items = random_state.randint(1, self.cutoff + 6, size=self.n_users)
+
+        self.recommended_items_batch = np.full((self.n_users, self.cutoff), -1, dtype=np.int64)
+        self.is_relevant_batch = np.zeros((self.n_users, self.cutoff), dtype=np.bool_)
+        self.rank_scores_batch = np.zeros((self.n_users, self.cutoff), dtype=np.float64)
+        self.ideal_scores_batch = np.zeros((self.n_users, self.cutoff), dtype=np.float64)
+
+        self.recommended_items_list, self.pos_items_list, self.relevance_list = [], [], []
+
+        for user_id in range(self.n_users):
+            recommended_items = random_state.choice(self.n_items, self.n_recommended[user_id], replace=False)
+            pos_items = random_state.choice(self.n_items, self.n_test_items[user_id], replace=False)
+            relevance = random_state.randint(1, 6, size=len(pos_items)).astype(np.float64)
+
+            is_relevant = np.in1d(recommended_items, pos_items, assume_unique=True)
+            item_to_relevance = dict(zip(pos_items, relevance))
+            ideal_scores = np.sort(relevance)[::-1][:self.cutoff]
+
+            self.recommended_items_batch[user_id, :len(recommended_items)] = recommended_items
+            self.is_relevant_batch[user_id, :len(recommended_items)] = is_relevant
+            self.rank_scores_batch[user_id, :len(recommended_items)] = [item_to_relevance.get(item, 0.0) for item in recommended_items]
+            self.ideal_scores_batch[user_id, :len(ideal_scores)] = ideal_scores
+
+            self.recommended_items_list.append(recommended_items)
+            self.pos_items_list.append(pos_items)
+            self.relevance_list.append(relevance)
+
+        self.URM_train = sps.random(self.n_users, self.n_items, density=0.2, format="csr",
+                                    random_state=random_state)
+        self.URM_train.data = np.ones_like(self.URM_train.data)
+
+    def _is_relevant(self, user_id):
+        return self.is_relevant_batch[user_id, :self.n_recommended[user_id]]
+
+    def test_functions(self):
+
+        is_relevant_list = [self._is_relevant(user_id) for user_id in range(self.n_users)]
+
+        batch_and_user_values = [
+            (precision_batch(self.is_relevant_batch, self.n_recommended),
+             [precision(is_relevant) for is_relevant in is_relevant_list]),
+            (precision_recall_min_denominator_batch(self.is_relevant_batch, self.n_recommended, self.n_test_items),
+             [precision_recall_min_denominator(is_relevant, len(pos_items))
+              for is_relevant, pos_items in zip(is_relevant_list, self.pos_items_list)]),
+            (recall_batch(self.is_relevant_batch, self.n_test_items),
+             [recall(is_relevant, pos_items) for is_relevant, pos_items in zip(is_relevant_list, self.pos_items_list)]),
+            (average_precision_batch(self.is_relevant_batch, self.n_recommended),
+             [average_precision(is_relevant) for is_relevant in is_relevant_list]),
+            (average_precision_min_denominator_batch(self.is_relevant_batch, self.n_recommended, self.n_test_items),
+             [average_precision_min_denominator(is_relevant, pos_items)
+              for is_relevant, pos_items in zip(is_relevant_list, self.pos_items_list)]),
+            (rr_batch(self.is_relevant_batch),
+             [rr(is_relevant) for is_relevant in is_relevant_list]),
+            (arhr_all_hits_batch(self.is_relevant_batch),
+             [arhr_all_hits(is_relevant) for is_relevant in is_relevant_list]),
+            (ndcg_batch(self.rank_scores_batch, self.ideal_scores_batch),
+             [ndcg(recommended_items, pos_items, relevance, at=self.cutoff) for recommended_items, pos_items, relevance
+              in zip(self.recommended_items_list, self.pos_items_list, self.relevance_list)]),
+        ]
+
+        for batch_values, user_values in batch_and_user_values:
+            self.assertTrue(np.allclose(batch_values, user_values))
+
+    def test_objects(self):
+
+        all_users = np.arange(self.n_users)
+
+        metric_batch_and_user_args = [
+            (lambda: MAP(),
+             lambda: (self.is_relevant_batch, self.n_recommended),
+             lambda user_id: (self._is_relevant(user_id), self.pos_items_list[user_id])),
+            (lambda: MAP_MIN_DEN(),
+             lambda: (self.is_relevant_batch, self.n_recommended, self.n_test_items),
+             lambda user_id: (self._is_relevant(user_id), self.pos_items_list[user_id])),
+            (lambda: MRR(),
+             lambda: (self.is_relevant_batch,),
+             lambda user_id: (self._is_relevant(user_id),)),
+            (lambda: HIT_RATE(),
+             lambda: (self.is_relevant_batch,),
+             lambda user_id: (self._is_relevant(user_id),)),
+            (lambda: Coverage_Item(self.n_items, np.array([], dtype=np.int64)),
+             lambda: (self.recommended_items_batch,),
+             lambda user_id: (self.recommended_items_list[user_id],)),
+            (lambda: Coverage_Item_Correct(self.n_items, np.array([], dtype=np.int64)),
+             lambda: (self.recommended_items_batch, self.is_relevant_batch),
+             lambda user_id: (self.recommended_items_list[user_id], self._is_relevant(user_id))),
+            (lambda: Coverage_User(self.n_users, np.array([], dtype=np.int64)),
+             lambda: (self.n_recommended, all_users),
+             lambda user_id: (self.recommended_items_list[user_id], user_id)),
+            (lambda: Coverage_User_Correct(self.n_users, np.array([], dtype=np.int64)),
+             lambda: (self.is_relevant_batch, all_users),
+             lambda user_id: (self._is_relevant(user_id), user_id)),
+            (lambda: Gini_Diversity(self.n_items, np.array([], dtype=np.int64)),
+             lambda: (self.recommended_items_batch,),
+             lambda user_id: (self.recommended_items_list[user_id],)),
+            (lambda: Shannon_Entropy(self.n_items, np.array([], dtype=np.int64)),
+             lambda: (self.recommended_items_batch,),
+             lambda user_id: (self.recommended_items_list[user_id],)),
+            (lambda: Diversity_Herfindahl(self.n_items, np.array([], dtype=np.int64)),
+             lambda: (self.recommended_items_batch,),
+             lambda user_id: (self.recommended_items_list[user_id],)),
+            (lambda: Diversity_MeanInterList(self.n_items, self.cutoff),
+             lambda: (self.recommended_items_batch,),
+             lambda user_id: (self.recommended_items_list[user_id],)),
+            (lambda: Novelty(self.URM_train),
+             lambda: (self.recommended_items_batch,),
+             lambda user_id: (self.recommended_items_list[user_id],)),
+            (lambda: AveragePopularity(self.URM_train),
+             lambda: (self.recommended_items_batch,),
+             lambda user_id: (self.recommended_items_list[user_id],)),
+        ]
+
+        for metric_constructor, get_batch_args, get_user_args in metric_batch_and_user_args:
+
+            metric_batch = metric_constructor()
+            metric_batch.add_recommendations_batch(*get_batch_args())
+
+            metric_user = metric_constructor()
+            for user_id in range(self.n_users):
+                metric_user.add_recommendations(*get_user_args(user_id))
+
+            self.assertTrue(np.allclose(metric_batch.get_metric_value(), metric_user.get_metric_value()),
+                            "{}: batch value {}, per user value {}".format(metric_batch.__class__.__name__,
+                                                                          metric_batch.get_metric_value(),
+                                                                          metric_user.get_metric_value()))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -369,7 +369,7 @@ def runHyperparameterSearch_Hybrid(recommender_class, URM_train, W_train, ICM_ob
                 CONSTRUCTOR_POSITIONAL_ARGS=[URM_train],
                 CONSTRUCTOR_KEYWORD_ARGS={},
                 FIT_POSITIONAL_ARGS=[],
-                FIT_KEYWORD_ARGS={}
+                FIT_KEYWORD_ARGS={"use_svd_cache": True, "svd_cache_num_factors": 500}
             )
 
         ##########################################################################################################
@@ -886,11 +886,13 @@ def runHyperparameterSearch_Collaborative(recommender_class, URM_train, URM_trai
             if similarity_type_list is None:
                 similarity_type_list = ['cosine', 'jaccard', "asymmetric", "dice", "tversky"]
 
+            # The cases of a similarity type with the same feature weighting reuse the dot products,
+            # which do not depend on topK, shrink and the parameters of the similarity
             recommender_input_args = SearchInputRecommenderArgs(
                 CONSTRUCTOR_POSITIONAL_ARGS=[URM_train],
                 CONSTRUCTOR_KEYWORD_ARGS={},
                 FIT_POSITIONAL_ARGS=[],
-                FIT_KEYWORD_ARGS={}
+                FIT_KEYWORD_ARGS={"use_similarity_cache": True}
             )
 
             if URM_train_last_test is not None:
@@ -949,18 +951,24 @@ def runHyperparameterSearch_Collaborative(recommender_class, URM_train, URM_trai
         ##########################################################################################################
 
         if recommender_class is RP3betaRecommender:
+            rp3beta_alpha_values = [0.05, 0.1, 0.2, 0.3, 0.4, 0.5]
+
             hyperparameters_range_dictionary = {
                 "topK": Integer(10, 500),
-                "alpha": Real(low=0, high=0.5, prior='uniform'),
+                "alpha": Categorical(rp3beta_alpha_values),
                 "beta": Real(low=0, high=0.5, prior='uniform'),
                 "normalize_similarity": Categorical([True, False]),
             }
 
+            # alpha is taken from a grid so that the cases with the same alpha reuse the product, which does not depend
+            # on beta, topK and normalize_similarity. The product of each alpha keeps 4 times the largest topK values
+            # of each row, enough for the reweighting by the degree with beta <= 0.5
             recommender_input_args = SearchInputRecommenderArgs(
                 CONSTRUCTOR_POSITIONAL_ARGS=[URM_train],
                 CONSTRUCTOR_KEYWORD_ARGS={},
                 FIT_POSITIONAL_ARGS=[],
-                FIT_KEYWORD_ARGS={}
+                FIT_KEYWORD_ARGS={"use_product_cache": True, "product_topK": 2000,
+                                  "product_cache_size": len(rp3beta_alpha_values)}
             )
 
         ##########################################################################################################
@@ -1077,7 +1085,7 @@ def runHyperparameterSearch_Collaborative(recommender_class, URM_train, URM_trai
                 CONSTRUCTOR_POSITIONAL_ARGS=[URM_train],
                 CONSTRUCTOR_KEYWORD_ARGS={},
                 FIT_POSITIONAL_ARGS=[],
-                FIT_KEYWORD_ARGS={}
+                FIT_KEYWORD_ARGS={"use_svd_cache": True, "svd_cache_num_factors": 350}
             )
 
         ##########################################################################################################
@@ -1092,7 +1100,7 @@ def runHyperparameterSearch_Collaborative(recommender_class, URM_train, URM_trai
                 CONSTRUCTOR_POSITIONAL_ARGS=[URM_train],
                 CONSTRUCTOR_KEYWORD_ARGS={},
                 FIT_POSITIONAL_ARGS=[],
-                FIT_KEYWORD_ARGS={}
+                FIT_KEYWORD_ARGS={"use_svd_cache": True, "svd_cache_num_factors": 350}
             )
 
         ##########################################################################################################
@@ -1159,11 +1167,12 @@ def runHyperparameterSearch_Collaborative(recommender_class, URM_train, URM_trai
                 "l2_norm": Real(low=1e0, high=1e7, prior='log-uniform'),
             }
 
+            # The eigendecomposition of the Gram matrix does not depend on l2_norm and is computed only once
             recommender_input_args = SearchInputRecommenderArgs(
                 CONSTRUCTOR_POSITIONAL_ARGS=[URM_train],
                 CONSTRUCTOR_KEYWORD_ARGS={},
                 FIT_POSITIONAL_ARGS=[],
-                FIT_KEYWORD_ARGS={}
+                FIT_KEYWORD_ARGS={"solver": "eigen"}
             )
 
         ##########################################################################################################
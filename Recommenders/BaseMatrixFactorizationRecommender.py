@@ -8,6 +8,7 @@ Created on 16/09/2017
 
 from Recommenders.BaseRecommender import BaseRecommender
 from Recommenders.DataIO import DataIO
+from Recommenders.MatrixFactorization.IVFInnerProductIndex import IVFInnerProductIndex
 import numpy as np
 
 
@@ -24,6 +25,7 @@ class BaseMatrixFactorizationRecommender(BaseRecommender):
         super(BaseMatrixFactorizationRecommender, self).__init__(URM_train, verbose=verbose)
 
         self.use_bias = False
+        self.approximate_index = None
 
 
 
@@ -70,6 +72,217 @@ class BaseMatrixFactorizationRecommender(BaseRecommender):
         return item_scores
 
 
+    def build_approximate_index(self, n_lists=None, n_probe=None, n_iterations=10, random_seed=None,
+                                target_recall=0.95, cutoff=None, n_calibration_users=1000):
+        """
+        Builds an IVFInnerProductIndex on the current ITEM_factors, recommend_topk then scores only the items of the
+        n_probe lists nearest to each user. The index must be built again after each fit.
+        If n_probe is None it is the smallest one for which the index alone finds target_recall of the exact
+        top-cutoff items of a sample of n_calibration_users users, see IVFInnerProductIndex.calibrate_n_probe.
+        The recall/speed trade-off can be changed later by setting approximate_index.n_probe
+        """
+
+        self.approximate_index = IVFInnerProductIndex(self.ITEM_factors,
+                                                      ITEM_bias=self.ITEM_bias if self.use_bias else None,
+                                                      n_lists=n_lists, n_probe=n_probe,
+                                                      n_iterations=n_iterations, random_seed=random_seed)
+
+        warm_users = np.arange(self.n_users)[np.ediff1d(self.URM_train.indptr) > 0]
+
+        if n_probe is None and len(warm_users) > 0:
+            cutoff = self._get_cutoff(cutoff)
+
+            random_state = np.random.RandomState(random_seed)
+            user_id_array = np.sort(random_state.choice(warm_users, min(n_calibration_users, len(warm_users)), replace=False))
+
+            n_probe, recall = self.approximate_index.calibrate_n_probe(self.USER_factors[user_id_array],
+                                                                       self._recommend_topk_exact(user_id_array, cutoff),
+                                                                       target_recall=target_recall,
+                                                                       excluded_items_csr=self.URM_train[user_id_array])
+
+            self._print("Approximate index with {} lists, n_probe {} has recall@{} {:.4f} on {} users".format(
+                self.approximate_index.n_lists, n_probe, cutoff, recall, len(user_id_array)))
+
+    def clear_approximate_index(self):
+        self.approximate_index = None
+
+    def _get_seen_items_batch(self, user_id_array):
+        """
+        :return:    batch row and item of every seen item of the users in user_id_array, sorted by item
+        """
+
+        start_pos = self.URM_train.indptr[user_id_array]
+        n_seen = self.URM_train.indptr[user_id_array + 1] - start_pos
+
+        batch_row = np.repeat(np.arange(len(user_id_array), dtype=np.int32), n_seen)
+        indices_pos = np.arange(n_seen.sum()) + np.repeat(start_pos - (np.cumsum(n_seen) - n_seen), n_seen)
+        seen_items = self.URM_train.indices[indices_pos]
+
+        sorting = np.argsort(seen_items, kind="stable")
+
+        return batch_row[sorting], seen_items[sorting]
+
+
+    def recommend_topk(self, user_id_array, cutoff=None, remove_seen_flag=True, items_to_compute=None,
+                       remove_top_pop_flag=False, remove_custom_items_flag=False, item_tile_size=2048):
+        """
+        Computes the recommendations without building the dense score matrix. The scores are computed in float32
+        over tiles of item_tile_size items, the seen and excluded items of each tile are masked and the best items are
+        merged in a running top-cutoff, so only a (len(user_id_array), item_tile_size) block exists at any time.
+        User and global biases do not change the ranking and are not added.
+        Subclasses overriding _compute_item_score and items_to_compute use the dense path.
+        If an approximate index has been built on the current ITEM_factors the items are selected with the index,
+        the users for which the probed lists do not hold cutoff items are scored exactly.
+        :return:    int32 array (len(user_id_array), cutoff), see BaseRecommender.recommend_topk
+        """
+
+        compute_item_score_function = getattr(self._compute_item_score, "__func__", None)
+
+        if compute_item_score_function is not BaseMatrixFactorizationRecommender._compute_item_score or items_to_compute is not None:
+            return super(BaseMatrixFactorizationRecommender, self).recommend_topk(user_id_array, cutoff=cutoff,
+                                                                                  remove_seen_flag=remove_seen_flag,
+                                                                                  items_to_compute=items_to_compute,
+                                                                                  remove_top_pop_flag=remove_top_pop_flag,
+                                                                                  remove_custom_items_flag=remove_custom_items_flag)
+
+        user_id_array = np.atleast_1d(user_id_array)
+        cutoff = self._get_cutoff(cutoff)
+
+        assert self.USER_factors.shape[1] == self.ITEM_factors.shape[1], \
+            "{}: User and Item factors have inconsistent shape".format(self.RECOMMENDER_NAME)
+
+        assert self.USER_factors.shape[0] > np.max(user_id_array),\
+                "{}: Cold users not allowed. Users in trained model are {}, requested prediction for users up to {}".format(
+                self.RECOMMENDER_NAME, self.USER_factors.shape[0], np.max(user_id_array))
+
+        if self.approximate_index is not None:
+
+            if self.approximate_index.ITEM_factors is self.ITEM_factors:
+                return self._recommend_topk_approximate(user_id_array, cutoff,
+                                                        remove_seen_flag=remove_seen_flag,
+                                                        remove_top_pop_flag=remove_top_pop_flag,
+                                                        remove_custom_items_flag=remove_custom_items_flag)
+
+            self._print("The approximate index was built on different ITEM_factors, it will be ignored")
+            self.approximate_index = None
+
+        return self._recommend_topk_exact(user_id_array, cutoff,
+                                          remove_seen_flag=remove_seen_flag,
+                                          remove_top_pop_flag=remove_top_pop_flag,
+                                          remove_custom_items_flag=remove_custom_items_flag,
+                                          item_tile_size=item_tile_size)
+
+    def _recommend_topk_exact(self, user_id_array, cutoff, remove_seen_flag=True,
+                              remove_top_pop_flag=False, remove_custom_items_flag=False, item_tile_size=2048):
+
+        n_items = self.ITEM_factors.shape[0]
+
+        USER_factors = np.asarray(self.USER_factors[user_id_array], dtype=np.float32)
+        ITEM_factors = np.asarray(self.ITEM_factors, dtype=np.float32)
+        ITEM_bias = np.asarray(self.ITEM_bias, dtype=np.float32) if self.use_bias else None
+
+        excluded_items_mask = np.zeros(n_items, dtype=bool)
+
+        if remove_top_pop_flag:
+            excluded_items_mask[self.filterTopPop_ItemsID] = True
+
+        if remove_custom_items_flag:
+            excluded_items_mask[self.items_to_ignore_ID] = True
+
+        if remove_seen_flag:
+            seen_batch_row, seen_items = self._get_seen_items_batch(user_id_array)
+
+        ranking_scores = np.full((len(user_id_array), cutoff), -np.inf, dtype=np.float32)
+        ranking = np.full((len(user_id_array), cutoff), -1, dtype=np.int32)
+
+        for tile_start in range(0, n_items, item_tile_size):
+            tile_end = min(tile_start + item_tile_size, n_items)
+
+            tile_scores = np.dot(USER_factors, ITEM_factors[tile_start:tile_end].T)
+
+            if ITEM_bias is not None:
+                tile_scores += ITEM_bias[tile_start:tile_end]
+
+            tile_scores[:, excluded_items_mask[tile_start:tile_end]] = -np.inf
+
+            if remove_seen_flag:
+                seen_start, seen_end = np.searchsorted(seen_items, [tile_start, tile_end])
+                tile_scores[seen_batch_row[seen_start:seen_end], seen_items[seen_start:seen_end] - tile_start] = -np.inf
+
+            # The current top-cutoff are merged with the tile and the best cutoff of the union are kept
+            candidate_scores = np.concatenate((ranking_scores, tile_scores), axis=1)
+            candidate_items = np.concatenate((ranking, np.broadcast_to(np.arange(tile_start, tile_end, dtype=np.int32),
+                                                                       tile_scores.shape)), axis=1)
+
+            best = np.argpartition(candidate_scores, -cutoff, axis=1)[:, -cutoff:]
+
+            ranking_scores = np.take_along_axis(candidate_scores, best, axis=1)
+            ranking = np.take_along_axis(candidate_items, best, axis=1)
+
+        sorting = np.argsort(-ranking_scores, axis=1)
+
+        ranking = np.take_along_axis(ranking, sorting, axis=1)
+        ranking_scores = np.take_along_axis(ranking_scores, sorting, axis=1)
+
+        # -inf is a flag to indicate an item to remove
+        ranking[np.isneginf(ranking_scores)] = -1
+
+        return ranking
+
+
+    def _recommend_topk_approximate(self, user_id_array, cutoff, remove_seen_flag=True,
+                                    remove_top_pop_flag=False, remove_custom_items_flag=False):
+
+        excluded_items_mask = np.zeros(self.ITEM_factors.shape[0], dtype=bool)
+
+        if remove_top_pop_flag:
+            excluded_items_mask[self.filterTopPop_ItemsID] = True
+
+        if remove_custom_items_flag:
+            excluded_items_mask[self.items_to_ignore_ID] = True
+
+        ranking, _ = self.approximate_index.search(self.USER_factors[user_id_array], cutoff,
+                                                   excluded_items_mask=excluded_items_mask,
+                                                   excluded_items_csr=self.URM_train[user_id_array] if remove_seen_flag else None)
+
+        # The probed lists of some users may hold less than cutoff items that can be recommended,
+        # those users are scored exactly so that the lists are as long as without the index
+        short_ranking_mask = ranking[:, -1] == -1
+
+        if np.any(short_ranking_mask):
+            ranking[short_ranking_mask] = self._recommend_topk_exact(user_id_array[short_ranking_mask], cutoff,
+                                                                     remove_seen_flag=remove_seen_flag,
+                                                                     remove_top_pop_flag=remove_top_pop_flag,
+                                                                     remove_custom_items_flag=remove_custom_items_flag)
+
+        return ranking
+
+
+    def recommend(self, user_id_array, cutoff=None, remove_seen_flag=True, items_to_compute=None,
+                  remove_top_pop_flag=False, remove_custom_items_flag=False, return_scores=False):
+        """
+        When the scores are not requested the recommendations are computed with recommend_topk
+        """
+
+        if return_scores:
+            return super(BaseMatrixFactorizationRecommender, self).recommend(user_id_array, cutoff=cutoff,
+                                                                             remove_seen_flag=remove_seen_flag,
+                                                                             items_to_compute=items_to_compute,
+                                                                             remove_top_pop_flag=remove_top_pop_flag,
+                                                                             remove_custom_items_flag=remove_custom_items_flag,
+                                                                             return_scores=return_scores)
+
+        single_user = np.isscalar(user_id_array)
+
+        ranking = self.recommend_topk(np.atleast_1d(user_id_array), cutoff=cutoff,
+                                      remove_seen_flag=remove_seen_flag,
+                                      items_to_compute=items_to_compute,
+                                      remove_top_pop_flag=remove_top_pop_flag,
+                                      remove_custom_items_flag=remove_custom_items_flag)
+
+        return self._ranking_to_list(ranking, single_user)
+
+
     #########################################################################################################
     ##########                                                                                     ##########
     ##########                                LOAD AND SAVE                                        ##########
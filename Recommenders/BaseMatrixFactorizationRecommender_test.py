@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 18/10/26
+"""
+
+import unittest
+
+import numpy as np
+import scipy.sparse as sps
+
+from Recommenders.BaseRecommender import BaseRecommender
+from Recommenders.BaseMatrixFactorizationRecommender import BaseMatrixFactorizationRecommender
+
+
+def get_recommender(n_users=300, n_items=500, n_factors=20, use_bias=False, random_seed=42):
+
+    random_state = np.random.RandomState(random_seed)
+
+    URM_train = sps.random(n_users, n_items, density=0.05, format="csr", random_state=random_state)
+    URM_train.data = np.ones_like(URM_train.data)
+
+    # The first user has seen all the items but 3, so the ranking is shorter than the cutoff
+    URM_train = sps.lil_matrix(URM_train)
+    URM_train[0, 3:] = 1.0
+    URM_train = sps.csr_matrix(URM_train)
+
+    recommender = BaseMatrixFactorizationRecommender(URM_train, verbose=False)
+    recommender.USER_factors = random_state.normal(size=(n_users, n_factors))
+    recommender.ITEM_factors = random_state.normal(size=(n_items, n_factors))
+
+    if use_bias:
+        recommender.use_bias = True
+        recommender.USER_bias = random_state.normal(size=n_users)
+        recommender.ITEM_bias = random_state.normal(size=n_items)
+        recommender.GLOBAL_bias = 0.5
+
+    return recommender
+
+
+class MyTestCase(unittest.TestCase):
+
+    def assert_same_ranking(self, recommender, ranking, ranking_dense, user_id_array):
+        """
+        The float32 scores may swap items with almost the same score, so the rankings are compared on the scores
+        """
+
+        self.assertEqual(ranking.shape, ranking_dense.shape)
+        self.assertTrue(np.array_equal(ranking == -1, ranking_dense == -1))
+
+        item_scores = recommender._compute_item_score(user_id_array)
+        recommended_mask = ranking_dense != -1
+
+        ranking_scores = np.take_along_axis(item_scores, np.maximum(ranking, 0), axis=1)[recommended_mask]
+        ranking_dense_scores = np.take_along_axis(item_scores, np.maximum(ranking_dense, 0), axis=1)[recommended_mask]
+
+        self.assertTrue(np.allclose(ranking_scores, ranking_dense_scores, rtol=1e-5, atol=1e-5))
+
+
+    def test_recommend_topk_same_as_dense(self):
+
+        for use_bias in [False, True]:
+            recommender = get_recommender(use_bias=use_bias)
+            recommender.set_items_to_ignore(np.arange(10, 20))
+
+            user_id_array = np.arange(recommender.n_users)
+
+            for cutoff in [1, 10, 50]:
+                for remove_seen_flag in [False, True]:
+                    for remove_custom_items_flag in [False, True]:
+
+                        ranking_dense = BaseRecommender.recommend_topk(recommender, user_id_array, cutoff=cutoff,
+                                                                       remove_seen_flag=remove_seen_flag,
+                                                                       remove_custom_items_flag=remove_custom_items_flag)
+
+                        # Tiles smaller than the cutoff and not dividing the number of items
+                        for item_tile_size in [7, 64, 2048]:
+                            ranking = recommender.recommend_topk(user_id_array, cutoff=cutoff,
+                                                                 remove_seen_flag=remove_seen_flag,
+                                                                 remove_custom_items_flag=remove_custom_items_flag,
+                                                                 item_tile_size=item_tile_size)
+
+                            self.assert_same_ranking(recommender, ranking, ranking_dense, user_id_array)
+
+
+    def test_approximate_index_probing_all_lists_same_as_dense(self):
+
+        recommender = get_recommender()
+        user_id_array = np.arange(recommender.n_users)
+
+        recommender.build_approximate_index(n_lists=20, n_probe=20, random_seed=0)
+
+        ranking_dense = BaseRecommender.recommend_topk(recommender, user_id_array, cutoff=10)
+        ranking = recommender.recommend_topk(user_id_array, cutoff=10)
+
+        self.assert_same_ranking(recommender, ranking, ranking_dense, user_id_array)
+
+        # The lists of each user are as long as without the index
+        recommender.approximate_index.n_probe = 1
+        ranking = recommender.recommend_topk(user_id_array, cutoff=10)
+
+        self.assertTrue(np.array_equal(ranking == -1, ranking_dense == -1))
+
+
+
+if __name__ == '__main__':
+
+    unittest.main()
@@ -108,6 +108,28 @@ class BaseRecommender(object):
         scores[seen] = -np.inf
         return scores
 
+    def _remove_seen_on_scores_batch(self, user_id_array, scores_batch):
+        """
+        Masks the seen items of all the users in the batch with a single scatter, reading the
+        seen items directly from the indptr/indices of URM_train
+        :param user_id_array:   array of user indices, one for each row of scores_batch
+        :param scores_batch:    array (len(user_id_array), n_items), modified in place
+        :return:
+        """
+
+        assert self.URM_train.getformat() == "csr", "Recommender_Base_Class: URM_train is not CSR, this will cause errors in filtering seen items"
+
+        start_pos = self.URM_train.indptr[user_id_array]
+        n_seen = self.URM_train.indptr[user_id_array + 1] - start_pos
+
+        # Position in URM_train.indices of every seen item, built without looping on the users
+        # For each user the positions are start_pos, start_pos+1 ... start_pos+n_seen-1
+        batch_row = np.repeat(np.arange(len(user_id_array), dtype=np.int32), n_seen)
+        indices_pos = np.arange(n_seen.sum()) + np.repeat(start_pos - (np.cumsum(n_seen) - n_seen), n_seen)
+
+        scores_batch[batch_row, self.URM_train.indices[indices_pos]] = -np.inf
+        return scores_batch
+
     def _compute_item_score(self, user_id_array, items_to_compute=None):
         """
 
@@ -119,43 +141,23 @@ class BaseRecommender(object):
         raise NotImplementedError(
             "BaseRecommender: compute_item_score not assigned for current recommender, unable to compute prediction scores")
 
-    def recommend(self, user_id_array, cutoff=None, remove_seen_flag=True, items_to_compute=None,
-                  remove_top_pop_flag=False, remove_custom_items_flag=False, return_scores=False):
+    def _get_cutoff(self, cutoff):
 
         if cutoff is None:
             cutoff = 10
-        # If is a scalar transform it in a 1-cell array
-        if np.isscalar(user_id_array):
-            user_id_array = np.atleast_1d(user_id_array)
-            single_user = True
-        else:
-            single_user = False
 
-        if cutoff is None:
-            cutoff = self.URM_train.shape[1] - 1
+        return min(cutoff, self.URM_train.shape[1] - 1)
 
-        cutoff = min(cutoff, self.URM_train.shape[1] - 1)
-
-        # Compute the scores using the model-specific function
-        # Vectorize over all users in user_id_array
-        scores_batch = self._compute_item_score(user_id_array, items_to_compute=items_to_compute)
-
-        for user_index in range(len(user_id_array)):
-
-            user_id = user_id_array[user_index]
-
-            if remove_seen_flag:
-                scores_batch[user_index, :] = self._remove_seen_on_scores(user_id, scores_batch[user_index, :])
+    def _rank_scores_batch(self, user_id_array, scores_batch, cutoff, remove_seen_flag=True,
+                           remove_top_pop_flag=False, remove_custom_items_flag=False):
+        """
+        Filters the scores and selects the top-cutoff items of each row, sorted by decreasing score
+        Items with a -inf score are never recommended and their position in the ranking is set to -1
+        :return:    int32 array (len(user_id_array), cutoff)
+        """
 
-            # Sorting is done in three steps. Faster then plain np.argsort for higher number of items
-            # - Partition the data to extract the set of relevant items
-            # - Sort only the relevant items
-            # - Get the original item index
-            # relevant_items_partition = (-scores_user).argpartition(cutoff)[0:cutoff]
-            # relevant_items_partition_sorting = np.argsort(-scores_user[relevant_items_partition])
-            # ranking = relevant_items_partition[relevant_items_partition_sorting]
-            #
-            # ranking_list.append(ranking)
+        if remove_seen_flag:
+            scores_batch = self._remove_seen_on_scores_batch(user_id_array, scores_batch)
 
         if remove_top_pop_flag:
             scores_batch = self._remove_TopPop_on_scores(scores_batch)
@@ -163,35 +165,84 @@ class BaseRecommender(object):
         if remove_custom_items_flag:
             scores_batch = self._remove_custom_items_on_scores(scores_batch)
 
-        # relevant_items_partition is block_size x cutoff
-        relevant_items_partition = (-scores_batch).argpartition(cutoff, axis=1)[:, 0:cutoff]
+        # Sorting is done in three steps. Faster then plain np.argsort for higher number of items
+        # - Partition the data to extract the set of relevant items, the top-cutoff are the last columns
+        #   partitioning on -cutoff avoids allocating the negated copy of scores_batch
+        # - Sort only the relevant items, the block is only (block_size, cutoff)
+        # - Get the original item index
+        relevant_items_partition = np.argpartition(scores_batch, -cutoff, axis=1)[:, -cutoff:]
+        relevant_items_partition_original_value = np.take_along_axis(scores_batch, relevant_items_partition, axis=1)
 
-        # Get original value and sort it
-        # [:, None] adds 1 dimension to the array, from (block_size,) to (block_size,1)
-        # This is done to correctly get scores_batch value as [row, relevant_items_partition[row,:]]
-        relevant_items_partition_original_value = scores_batch[
-            np.arange(scores_batch.shape[0])[:, None], relevant_items_partition]
         relevant_items_partition_sorting = np.argsort(-relevant_items_partition_original_value, axis=1)
-        ranking = relevant_items_partition[
-            np.arange(relevant_items_partition.shape[0])[:, None], relevant_items_partition_sorting]
 
-        ranking_list = [None] * ranking.shape[0]
+        ranking = np.take_along_axis(relevant_items_partition, relevant_items_partition_sorting, axis=1).astype(np.int32)
+        ranking_scores = np.take_along_axis(relevant_items_partition_original_value, relevant_items_partition_sorting, axis=1)
 
-        # Remove from the recommendation list any item that has a -inf score
-        # Since -inf is a flag to indicate an item to remove
-        for user_index in range(len(user_id_array)):
-            user_recommendation_list = ranking[user_index]
-            user_item_scores = scores_batch[user_index, user_recommendation_list]
+        # -inf is a flag to indicate an item to remove
+        ranking[np.isneginf(ranking_scores)] = -1
 
-            not_inf_scores_mask = np.logical_not(np.isinf(user_item_scores))
+        return ranking
 
-            user_recommendation_list = user_recommendation_list[not_inf_scores_mask]
-            ranking_list[user_index] = user_recommendation_list.tolist()
+    def recommend_topk(self, user_id_array, cutoff=None, remove_seen_flag=True, items_to_compute=None,
+                       remove_top_pop_flag=False, remove_custom_items_flag=False):
+        """
+        Computes the recommendations as a compact array rather than a list of lists
+        :return:    int32 array (len(user_id_array), cutoff) with the recommended items sorted by decreasing score,
+                    if a user has less than cutoff items that can be recommended the remaining positions are -1
+        """
+
+        user_id_array = np.atleast_1d(user_id_array)
+        cutoff = self._get_cutoff(cutoff)
+
+        scores_batch = np.asarray(self._compute_item_score(user_id_array, items_to_compute=items_to_compute))
+
+        return self._rank_scores_batch(user_id_array, scores_batch, cutoff,
+                                       remove_seen_flag=remove_seen_flag,
+                                       remove_top_pop_flag=remove_top_pop_flag,
+                                       remove_custom_items_flag=remove_custom_items_flag)
+
+    def _ranking_to_list(self, ranking, single_user):
+        """
+        Converts the ranking computed by _rank_scores_batch or recommend_topk in the list of lists returned by recommend
+        """
+
+        # Removed items are flagged with -1 and, being sorted by score, are at the end of each ranking
+        n_valid_items = (ranking != -1).sum(axis=1)
+        ranking_list = ranking.tolist()
+
+        for user_index in np.arange(len(ranking_list))[n_valid_items < ranking.shape[1]]:
+            ranking_list[user_index] = ranking_list[user_index][:n_valid_items[user_index]]
 
         # Return single list for one user, instead of list of lists
         if single_user:
             ranking_list = ranking_list[0]
 
+        return ranking_list
+
+    def recommend(self, user_id_array, cutoff=None, remove_seen_flag=True, items_to_compute=None,
+                  remove_top_pop_flag=False, remove_custom_items_flag=False, return_scores=False):
+
+        # If is a scalar transform it in a 1-cell array
+        if np.isscalar(user_id_array):
+            user_id_array = np.atleast_1d(user_id_array)
+            single_user = True
+        else:
+            user_id_array = np.asarray(user_id_array)
+            single_user = False
+
+        cutoff = self._get_cutoff(cutoff)
+
+        # Compute the scores using the model-specific function
+        # Vectorize over all users in user_id_array
+        scores_batch = np.asarray(self._compute_item_score(user_id_array, items_to_compute=items_to_compute))
+
+        ranking = self._rank_scores_batch(user_id_array, scores_batch, cutoff,
+                                          remove_seen_flag=remove_seen_flag,
+                                          remove_top_pop_flag=remove_top_pop_flag,
+                                          remove_custom_items_flag=remove_custom_items_flag)
+
+        ranking_list = self._ranking_to_list(ranking, single_user)
+
         if return_scores:
             return ranking_list, scores_batch
 
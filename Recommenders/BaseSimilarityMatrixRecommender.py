@@ -9,6 +9,7 @@ Created on 16/09/2017
 from Recommenders.BaseRecommender import BaseRecommender
 from Recommenders.DataIO import DataIO
 import numpy as np
+import scipy.sparse as sps
 
 
 class BaseSimilarityMatrixRecommender(BaseRecommender):
@@ -87,6 +88,78 @@ class BaseItemSimilarityMatrixRecommender(BaseSimilarityMatrixRecommender):
 
         return item_scores
 
+    def recommend_topk(self, user_id_array, cutoff=None, remove_seen_flag=True, items_to_compute=None,
+                       remove_top_pop_flag=False, remove_custom_items_flag=False):
+        """
+        Computes the recommendations without building the dense score matrix. The product URM_train[user] * W_sparse is
+        computed one user at a time with a sparse accumulator keeping only the top-cutoff items, so all users can be
+        processed in a single call.
+        The score-free path is used only when the scores are computed from a sparse W_sparse, otherwise
+        (e.g., dense EASE_R, hybrids overriding _compute_item_score or items_to_compute) the dense path is used.
+        :return:    int32 array (len(user_id_array), cutoff), see BaseRecommender.recommend_topk
+        """
+
+        compute_item_score_function = getattr(self._compute_item_score, "__func__", None)
+
+        score_free_available = compute_item_score_function is BaseItemSimilarityMatrixRecommender._compute_item_score and \
+                               sps.issparse(self.W_sparse) and items_to_compute is None
+
+        if score_free_available:
+            try:
+                from Recommenders.Similarity.Cython.Compute_Item_Score_TopK_Cython import compute_item_score_topk
+
+            except ImportError:
+                self._print("Unable to load Cython compute_item_score_topk, reverting to dense scores")
+                score_free_available = False
+
+        if not score_free_available:
+            return super(BaseItemSimilarityMatrixRecommender, self).recommend_topk(user_id_array, cutoff=cutoff,
+                                                                                   remove_seen_flag=remove_seen_flag,
+                                                                                   items_to_compute=items_to_compute,
+                                                                                   remove_top_pop_flag=remove_top_pop_flag,
+                                                                                   remove_custom_items_flag=remove_custom_items_flag)
+
+        self._check_format()
+
+        items_to_exclude = []
+
+        if remove_top_pop_flag:
+            items_to_exclude.append(self.filterTopPop_ItemsID)
+
+        if remove_custom_items_flag:
+            items_to_exclude.append(self.items_to_ignore_ID)
+
+        items_to_exclude = np.concatenate(items_to_exclude) if len(items_to_exclude) > 0 else None
+
+        return compute_item_score_topk(self.URM_train, self.W_sparse, np.atleast_1d(user_id_array),
+                                       self._get_cutoff(cutoff),
+                                       remove_seen_flag=remove_seen_flag,
+                                       items_to_exclude=items_to_exclude)
+
+    def recommend(self, user_id_array, cutoff=None, remove_seen_flag=True, items_to_compute=None,
+                  remove_top_pop_flag=False, remove_custom_items_flag=False, return_scores=False):
+        """
+        When the scores are not requested the recommendations are computed with recommend_topk
+        """
+
+        if return_scores:
+            return super(BaseItemSimilarityMatrixRecommender, self).recommend(user_id_array, cutoff=cutoff,
+                                                                              remove_seen_flag=remove_seen_flag,
+                                                                              items_to_compute=items_to_compute,
+                                                                              remove_top_pop_flag=remove_top_pop_flag,
+                                                                              remove_custom_items_flag=remove_custom_items_flag,
+                                                                              return_scores=return_scores)
+
+        single_user = np.isscalar(user_id_array)
+
+        ranking = self.recommend_topk(np.atleast_1d(user_id_array), cutoff=cutoff,
+                                      remove_seen_flag=remove_seen_flag,
+                                      items_to_compute=items_to_compute,
+                                      remove_top_pop_flag=remove_top_pop_flag,
+                                      remove_custom_items_flag=remove_custom_items_flag)
+
+        return self._ranking_to_list(ranking, single_user)
+
 
 class BaseUserSimilarityMatrixRecommender(BaseSimilarityMatrixRecommender):
 
@@ -7,15 +7,19 @@ Created on 23/10/17
 """
 
 from Recommenders.BaseSimilarityMatrixRecommender import BaseItemSimilarityMatrixRecommender
+from Recommenders.DataIO import DataIO
 from Recommenders.Recommender_utils import similarityMatrixTopK, check_matrix
 from Utils.seconds_to_biggest_unit import seconds_to_biggest_unit
 from sklearn.preprocessing import normalize
 import numpy as np
-import time
+import time, os, uuid, hashlib
 import scipy.sparse as sps
+import scipy.linalg
 
 from Recommenders.Similarity.Compute_Similarity import Compute_Similarity
 
+DEFAULT_EIGEN_CACHE_FOLDER = "./result_experiments/EASE_R_eigendecomposition/"
+
 
 class EASE_R_Recommender(BaseItemSimilarityMatrixRecommender):
     """ EASE_R_Recommender
@@ -35,37 +39,72 @@ class EASE_R_Recommender(BaseItemSimilarityMatrixRecommender):
     def __init__(self, URM_train, sparse_threshold_quota=None):
         super(EASE_R_Recommender, self).__init__(URM_train)
         self.sparse_threshold_quota = sparse_threshold_quota
+        self._URM_train_not_normalized = None
+
+    def set_URM_train(self, URM_train_new, **kwargs):
+        super(EASE_R_Recommender, self).set_URM_train(URM_train_new, **kwargs)
+        self._URM_train_not_normalized = None
+
+    def fit(self, topK=None, l2_norm=1e3, normalize_matrix=False, verbose=True, solver="inverse",
+            eigen_cache_folder=DEFAULT_EIGEN_CACHE_FOLDER):  # l2_norm=3935
+        """
+        :param solver:  "inverse" computes the float64 inverse of the Gram matrix with np.linalg.inv,
+                        "cholesky" computes the float32 inverse in place from the Cholesky factorization,
+                        its peak memory is roughly one dense |items|x|items| float32 matrix, the matrix must be
+                        positive definite, which holds if all values of URM_train are in [-1, 1]
+                        "eigen" computes the inverse from the eigendecomposition of the Gram matrix, which
+                        does not depend on l2_norm and is computed once and stored in eigen_cache_folder,
+                        each fit then requires a single matrix product
+        :param eigen_cache_folder:  folder of the eigendecompositions, if None they are not stored
+        """
 
-    def fit(self, topK=None, l2_norm=1e3, normalize_matrix=False, verbose=True):  # l2_norm=3935
+        assert solver in ["inverse", "cholesky", "eigen"], "{}: solver must be 'inverse', 'cholesky' or 'eigen', provided value was '{}'".format(
+            self.RECOMMENDER_NAME, solver)
 
         self.verbose = verbose
 
         start_time = time.time()
         self._print("Fitting model... ")
 
+        # Each fit starts from the data as provided, the normalized matrix replaces URM_train but the original one
+        # is kept, so that repeated fits normalize and hash the same data
+        if self._URM_train_not_normalized is None:
+            self._URM_train_not_normalized = self.URM_train
+
+        self.URM_train = self._URM_train_not_normalized
+
+        eigen_cache_key = self._get_eigen_cache_key(normalize_matrix) if solver == "eigen" else None
+
         if normalize_matrix:
             # Normalize rows and then columns
             self.URM_train = normalize(self.URM_train, norm='l2', axis=1)
             self.URM_train = normalize(self.URM_train, norm='l2', axis=0)
             self.URM_train = sps.csr_matrix(self.URM_train)
 
-        # Grahm matrix is X^t X, compute dot product
-        similarity = Compute_Similarity(self.URM_train, shrink=0, topK=self.URM_train.shape[1], normalize=False,
-                                        similarity="cosine")
-        grahm_matrix = similarity.compute_similarity().toarray()
+        if solver == "cholesky":
+            B = self._compute_B_cholesky(l2_norm)
+
+        elif solver == "eigen":
+            B = self._compute_B_eigen(l2_norm, eigen_cache_folder, eigen_cache_key)
+
+        else:
+            # Grahm matrix is X^t X, compute dot product
+            similarity = Compute_Similarity(self.URM_train, shrink=0, topK=self.URM_train.shape[1], normalize=False,
+                                            similarity="cosine")
+            grahm_matrix = similarity.compute_similarity().toarray()
 
-        diag_indices = np.diag_indices(grahm_matrix.shape[0])
+            diag_indices = np.diag_indices(grahm_matrix.shape[0])
 
-        # The Compute_Similarity object ensures the diagonal of the similarity matrix is zero
-        # in this case we need the diagonal as well, which is just the item popularity
-        item_popularity = np.ediff1d(self.URM_train.tocsc().indptr)
-        grahm_matrix[diag_indices] = item_popularity + l2_norm
+            # The Compute_Similarity object ensures the diagonal of the similarity matrix is zero
+            # in this case we need the diagonal as well, which is just the item popularity
+            item_popularity = np.ediff1d(self.URM_train.tocsc().indptr)
+            grahm_matrix[diag_indices] = item_popularity + l2_norm
 
-        P = np.linalg.inv(grahm_matrix)
+            P = np.linalg.inv(grahm_matrix)
 
-        B = P / (-np.diag(P))
+            B = P / (-np.diag(P))
 
-        B[diag_indices] = 0.0
+            B[diag_indices] = 0.0
 
         new_time_value, new_time_unit = seconds_to_biggest_unit(time.time() - start_time)
         self._print("Fitting model... done in {:.2f} {}".format(new_time_value, new_time_unit))
@@ -80,7 +119,8 @@ class EASE_R_Recommender(BaseItemSimilarityMatrixRecommender):
             self.W_sparse = check_matrix(B, format='csr', dtype=np.float32)
 
         else:
-            self.W_sparse = check_matrix(B, format='npy', dtype=np.float32)
+            # Avoid copying the dense matrix if it already has the required dtype
+            self.W_sparse = B if isinstance(B, np.ndarray) and B.dtype == np.float32 else check_matrix(B, format='npy', dtype=np.float32)
             self._W_sparse_format_checked = True
             self._compute_item_score = self._compute_score_W_dense
 
@@ -93,6 +133,168 @@ class EASE_R_Recommender(BaseItemSimilarityMatrixRecommender):
         #     self.W_sparse = similarityMatrixTopK(B, k = topK, verbose = False)
         #     self.W_sparse = sps.csr_matrix(self.W_sparse)
 
+    def _compute_gram_matrix(self, block_size=1000):
+        """
+        Computes X^T X as a dense float32 matrix one block of columns at a time, in Fortran order so that LAPACK
+        does not copy it. As in the "inverse" solver the diagonal is the item popularity, so all solvers fit the same model
+        """
+
+        URM_train = check_matrix(self.URM_train, 'csc', dtype=np.float32)
+        URM_train_T = URM_train.T.tocsr()
+
+        n_items = URM_train.shape[1]
+
+        G = np.empty((n_items, n_items), dtype=np.float32, order="F")
+
+        for start_col in range(0, n_items, block_size):
+            end_col = min(start_col + block_size, n_items)
+            G[:, start_col:end_col] = URM_train_T.dot(URM_train[:, start_col:end_col]).toarray()
+
+        G[np.diag_indices(n_items)] = np.ediff1d(URM_train.indptr)
+
+        return G
+
+    def _copy_lower_to_upper(self, P, block_size=1000):
+        """
+        Copies the lower triangle into the upper one, one block of columns at a time
+        """
+
+        n_items = P.shape[0]
+
+        for start_col in range(0, n_items, block_size):
+            end_col = min(start_col + block_size, n_items)
+
+            diagonal_block = P[start_col:end_col, start_col:end_col]
+            P[start_col:end_col, start_col:end_col] = np.tril(diagonal_block) + np.tril(diagonal_block, -1).T
+            P[start_col:end_col, end_col:] = P[end_col:, start_col:end_col].T
+
+    def _compute_B_cholesky(self, l2_norm, block_size=1000):
+        """
+        Computes B = P / (-diag(P)) with P = (X^T X + l2_norm * I)^-1 using a single dense float32 matrix,
+        the diagonal of X^T X is the item popularity, see _compute_gram_matrix.
+        The Gram matrix is built one block of columns at a time, then Cholesky factorization, inversion and
+        normalization are all done in place. The matrix is allocated in Fortran order so that LAPACK does not copy it.
+        """
+
+        P = self._compute_gram_matrix(block_size=block_size)
+
+        n_items = P.shape[0]
+
+        diag_indices = np.diag_indices(n_items)
+        P[diag_indices] += l2_norm
+
+        try:
+            P, lower = scipy.linalg.cho_factor(P, lower=True, overwrite_a=True, check_finite=False)
+
+        except np.linalg.LinAlgError:
+            # With the item popularity on the diagonal the matrix is positive definite if all values are in [-1, 1],
+            # e.g., for binary or normalized data, but not necessarily for ratings
+            raise ValueError("{}: the Gram matrix with the item popularity on the diagonal is not positive definite, "
+                             "use solver 'inverse' or 'eigen'".format(self.RECOMMENDER_NAME))
+
+        # Inverse from the Cholesky factor, only the lower triangle is computed
+        potri, = scipy.linalg.get_lapack_funcs(("potri",), (P,))
+        P, info = potri(P, lower=lower, overwrite_c=True)
+
+        assert info == 0, "{}: Cholesky inversion failed with LAPACK info {}".format(self.RECOMMENDER_NAME, info)
+
+        self._copy_lower_to_upper(P, block_size=block_size)
+
+        P /= -np.diag(P)
+        P[diag_indices] = 0.0
+
+        return P
+
+    def _get_eigen_cache_key(self, normalize_matrix):
+        """
+        Hash of URM_train before the normalization and of normalize_matrix, the tag identifies the Gram matrix
+        with the item popularity on the diagonal, so decompositions of a different Gram matrix are never loaded
+        """
+
+        URM_train = check_matrix(self.URM_train, 'csr', dtype=np.float32)
+
+        cache_key = hashlib.sha1()
+        for array in [URM_train.indptr, URM_train.indices, URM_train.data]:
+            cache_key.update(np.ascontiguousarray(array).view(np.uint8))
+        cache_key.update(repr((URM_train.shape, normalize_matrix, "popularity_diagonal")).encode("utf-8"))
+
+        return cache_key.hexdigest()
+
+    def _get_gram_eigendecomposition(self, eigen_cache_folder, cache_key):
+        """
+        Returns the eigenvalues s, float64, and eigenvectors V, float32, of X^T X = V diag(s) V^T.
+        The decomposition is computed in float64, as a float32 one is not accurate enough for the larger l2_norm values.
+        The decomposition is stored in eigen_cache_folder under cache_key, see _get_eigen_cache_key,
+        and loaded memory-mapped by the following fits on the same data
+        """
+
+        if eigen_cache_folder is not None:
+            eigenvalues_path = os.path.join(eigen_cache_folder, "{}_eigenvalues.npy".format(cache_key))
+            eigenvectors_path = os.path.join(eigen_cache_folder, "{}_eigenvectors.npy".format(cache_key))
+
+            if os.path.isfile(eigenvalues_path) and os.path.isfile(eigenvectors_path):
+                self._print("Loading the cached eigendecomposition of the Gram matrix")
+                return np.load(eigenvalues_path), np.load(eigenvectors_path, mmap_mode='r')
+
+        self._print("Computing the eigendecomposition of the Gram matrix...")
+
+        eigenvalues, eigenvectors = scipy.linalg.eigh(self._compute_gram_matrix().astype(np.float64),
+                                                      overwrite_a=True, check_finite=False)
+        eigenvectors = eigenvectors.astype(np.float32)
+
+        if eigen_cache_folder is not None:
+            os.makedirs(eigen_cache_folder, exist_ok=True)
+
+            # Written with a temporary name and renamed, so concurrent processes never load a partial file.
+            # The eigenvectors are written last, as their presence marks the entry as complete
+            for array, file_path in [(eigenvalues, eigenvalues_path), (eigenvectors, eigenvectors_path)]:
+                temp_file_path = os.path.join(eigen_cache_folder, "__temp_{}.npy".format(uuid.uuid4().hex))
+                np.save(temp_file_path, array)
+                os.replace(temp_file_path, file_path)
+
+        return eigenvalues, eigenvectors
+
+    def _compute_B_eigen(self, l2_norm, eigen_cache_folder, eigen_cache_key, block_size=1000):
+        """
+        Computes B = P / (-diag(P)) with P = (X^T X + l2_norm * I)^-1 = V diag(1/(s + l2_norm)) V^T.
+        Computing P directly in float32 loses the off-diagonal values, which are much smaller than the diagonal
+        for large l2_norm. Since 1/(s + l2_norm) = (1 - s/(s + l2_norm)) / l2_norm, P = (I - M) / l2_norm with
+        M = V diag(s/(s + l2_norm)) V^T and, out of the diagonal, B_ij = M_ij / (l2_norm * P_jj).
+        M = W W^T with W = V diag(sqrt(s/(s + l2_norm))) is computed with a single BLAS syrk, only its lower
+        triangle, and diag(P) is computed in float64 from V.
+        With the item popularity on the diagonal, see _compute_gram_matrix, X^T X is positive semidefinite for
+        binary or normalized data. Otherwise it may have negative eigenvalues and M is computed as (V diag(...)) V^T.
+        """
+
+        eigenvalues, eigenvectors = self._get_gram_eigendecomposition(eigen_cache_folder, eigen_cache_key)
+
+        n_items = len(eigenvalues)
+
+        P_diagonal = np.zeros(n_items, dtype=np.float64)
+
+        for start_row in range(0, n_items, block_size):
+            end_row = min(start_row + block_size, n_items)
+            P_diagonal[start_row:end_row] = (np.asarray(eigenvectors[start_row:end_row], dtype=np.float64) ** 2).dot(1 / (eigenvalues + l2_norm))
+
+        eigenvalues_weight = eigenvalues / (eigenvalues + l2_norm)
+
+        if eigenvalues_weight.min() >= 0.0:
+            W = np.asfortranarray(eigenvectors * np.sqrt(eigenvalues_weight).astype(np.float32))
+
+            syrk, = scipy.linalg.get_blas_funcs(("syrk",), (W,))
+            B = syrk(1.0, W, lower=1)
+            del W
+
+            self._copy_lower_to_upper(B, block_size=block_size)
+
+        else:
+            B = np.dot(eigenvectors * eigenvalues_weight.astype(np.float32), np.asarray(eigenvectors).T)
+
+        B /= (l2_norm * P_diagonal).astype(np.float32)
+        B[np.diag_indices(n_items)] = 0.0
+
+        return B
+
     def _is_content_sparse_check(self, matrix):
 
         if self.sparse_threshold_quota is None:
@@ -126,9 +328,50 @@ class EASE_R_Recommender(BaseItemSimilarityMatrixRecommender):
 
         return item_scores
 
+    def save_model(self, folder_path, file_name=None, use_mmap_format=True):
+        """
+        If W_sparse is dense and use_mmap_format is True, it is saved as an uncompressed .npy file next to the zip
+        file, which only contains its file name. load_model will open it with np.load(mmap_mode='r'), so repeated
+        loads do not decompress the matrix and multiple processes share the same pages.
+        """
+
+        if sps.issparse(self.W_sparse) or not use_mmap_format:
+            super(EASE_R_Recommender, self).save_model(folder_path, file_name=file_name)
+            return
+
+        if file_name is None:
+            file_name = self.RECOMMENDER_NAME
+
+        if file_name[-4:] == ".zip":
+            file_name = file_name[:-4]
+
+        self._print("Saving model in file '{}'".format(folder_path + file_name))
+
+        if not os.path.exists(folder_path):
+            os.makedirs(folder_path)
+
+        W_sparse_file_name = file_name + "_W_sparse.npy"
+
+        # Replace the file only after the new one has been successfully written
+        with open(folder_path + W_sparse_file_name + ".temp", "wb") as W_sparse_file:
+            np.save(W_sparse_file, np.asarray(self.W_sparse, dtype=np.float32), allow_pickle=False)
+
+        os.replace(folder_path + W_sparse_file_name + ".temp", folder_path + W_sparse_file_name)
+
+        data_dict_to_save = {"W_sparse_mmap_file_name": W_sparse_file_name}
+
+        dataIO = DataIO(folder_path=folder_path)
+        dataIO.save_data(file_name=file_name, data_dict_to_save=data_dict_to_save)
+
+        self._print("Saving complete")
+
     def load_model(self, folder_path, file_name=None):
         super(EASE_R_Recommender, self).load_model(folder_path, file_name=file_name)
 
+        if hasattr(self, "W_sparse_mmap_file_name"):
+            self.W_sparse = np.load(folder_path + self.W_sparse_mmap_file_name, mmap_mode='r', allow_pickle=False)
+            del self.W_sparse_mmap_file_name
+
         if not sps.issparse(self.W_sparse):
             self._W_sparse_format_checked = True
             self._compute_item_score = self._compute_score_W_dense
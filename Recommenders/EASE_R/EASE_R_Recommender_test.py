@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 18/10/26
+"""
+
+import unittest, os, shutil, tempfile
+
+import numpy as np
+import scipy.sparse as sps
+
+from Recommenders.EASE_R.EASE_R_Recommender import EASE_R_Recommender
+
+
+def get_URM(n_users=500, n_items=150, density=0.05, random_seed=42):
+
+    URM = sps.random(n_users, n_items, density=density, format="csr", dtype=np.float32,
+                     random_state=np.random.RandomState(random_seed))
+    URM.data = np.ones_like(URM.data)
+
+    return URM
+
+
+class MyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.eigen_cache_folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.eigen_cache_folder, ignore_errors=True)
+
+
+    def test_eigen_cache_hit_on_repeated_fits(self):
+
+        URM = get_URM()
+
+        for normalize_matrix in [False, True]:
+
+            shutil.rmtree(self.eigen_cache_folder, ignore_errors=True)
+
+            recommender = EASE_R_Recommender(URM.copy())
+            recommender_inverse = EASE_R_Recommender(URM.copy())
+
+            for l2_norm in [1e1, 1e2, 1e3]:
+                recommender.fit(l2_norm=l2_norm, normalize_matrix=normalize_matrix, solver="eigen",
+                                eigen_cache_folder=self.eigen_cache_folder, verbose=False)
+
+                # One eigendecomposition, eigenvalues and eigenvectors
+                self.assertEqual(len(os.listdir(self.eigen_cache_folder)), 2,
+                                 "Eigen cache missed for normalize_matrix {}, l2_norm {}".format(normalize_matrix, l2_norm))
+
+                recommender_inverse.fit(l2_norm=l2_norm, normalize_matrix=normalize_matrix, solver="inverse", verbose=False)
+
+                self.assertTrue(np.allclose(recommender.W_sparse, recommender_inverse.W_sparse, atol=1e-4),
+                                "Eigen solver different from inverse for normalize_matrix {}, l2_norm {}".format(normalize_matrix, l2_norm))
+
+
+    def test_normalized_fit_starts_from_original_data(self):
+
+        URM = get_URM()
+
+        recommender = EASE_R_Recommender(URM.copy())
+        recommender.fit(l2_norm=1e2, normalize_matrix=True, verbose=False)
+        recommender.fit(l2_norm=1e2, normalize_matrix=True, verbose=False)
+
+        recommender_single_fit = EASE_R_Recommender(URM.copy())
+        recommender_single_fit.fit(l2_norm=1e2, normalize_matrix=True, verbose=False)
+
+        self.assertTrue(np.allclose(recommender.W_sparse, recommender_single_fit.W_sparse, atol=1e-6))
+        self.assertTrue(np.allclose(recommender.URM_train.toarray(), recommender_single_fit.URM_train.toarray()))
+
+
+
+if __name__ == '__main__':
+
+    unittest.main()
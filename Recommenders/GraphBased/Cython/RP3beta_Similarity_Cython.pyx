@@ -0,0 +1,196 @@
+#cython: boundscheck=False
+#cython: wraparound=False
+#cython: initializedcheck=False
+#cython: language_level=3
+#cython: nonecheck=False
+#cython: cdivision=True
+#cython: overflowcheck=False
+
+"""
+Created on 18/10/26
+"""
+
+
+import numpy as np
+cimport numpy as np
+
+
+cdef inline bint _is_lower(double value_1, int item_1, double value_2, int item_2) nogil:
+    # Ties are broken in favour of the lower item index, which is therefore considered the "higher" one
+    return value_1 < value_2 or (value_1 == value_2 and item_1 > item_2)
+
+
+cdef inline void _heap_sift_down(double[:] heap_value, int[:] heap_item, int heap_size, int position) nogil:
+
+    cdef int child, smallest
+    cdef double tmp_value
+    cdef int tmp_item
+
+    while True:
+        smallest = position
+        child = 2*position + 1
+
+        if child < heap_size and _is_lower(heap_value[child], heap_item[child], heap_value[smallest], heap_item[smallest]):
+            smallest = child
+
+        child += 1
+
+        if child < heap_size and _is_lower(heap_value[child], heap_item[child], heap_value[smallest], heap_item[smallest]):
+            smallest = child
+
+        if smallest == position:
+            return
+
+        tmp_value = heap_value[position]
+        tmp_item = heap_item[position]
+        heap_value[position] = heap_value[smallest]
+        heap_item[position] = heap_item[smallest]
+        heap_value[smallest] = tmp_value
+        heap_item[smallest] = tmp_item
+
+        position = smallest
+
+
+cdef inline void _heap_sift_up(double[:] heap_value, int[:] heap_item, int position) nogil:
+
+    cdef int parent
+    cdef double tmp_value
+    cdef int tmp_item
+
+    while position > 0:
+        parent = (position - 1) // 2
+
+        if not _is_lower(heap_value[position], heap_item[position], heap_value[parent], heap_item[parent]):
+            return
+
+        tmp_value = heap_value[position]
+        tmp_item = heap_item[position]
+        heap_value[position] = heap_value[parent]
+        heap_item[position] = heap_item[parent]
+        heap_value[parent] = tmp_value
+        heap_item[parent] = tmp_item
+
+        position = parent
+
+
+cdef inline int _heap_push_candidate(double[:] heap_value, int[:] heap_item, int heap_size, int topK,
+                                     double value, int item) nogil:
+    """
+    Adds the candidate to a min-heap of at most topK elements, the root is the worst element kept so far
+    :return: the new heap size
+    """
+
+    if heap_size < topK:
+        heap_value[heap_size] = value
+        heap_item[heap_size] = item
+        _heap_sift_up(heap_value, heap_item, heap_size)
+        return heap_size + 1
+
+    if _is_lower(heap_value[0], heap_item[0], value, item):
+        heap_value[0] = value
+        heap_item[0] = item
+        _heap_sift_down(heap_value, heap_item, heap_size, 0)
+
+    return heap_size
+
+
+
+def compute_rp3beta_similarity_block(Piu_indptr, Piu_indices, Piu_data, Pui_indptr, Pui_indices, Pui_data,
+                                     degree, int topK, int start_row, int end_row):
+    """
+    Computes the rows [start_row, end_row) of the RP3beta similarity, i.e., (Piu * Pui)[row, :] * degree
+    with the diagonal set to zero, and keeps the topK nonzero values of each row.
+
+    Each row is computed with a sparse accumulator in the same order and precision as the scipy product,
+    then a min-heap of size topK selects the best items, ties are broken in favour of the lower item index.
+    The whole computation releases the GIL so that different blocks can be computed by different threads.
+
+    :param Piu_indptr, Piu_indices, Piu_data:   CSR arrays of Piu |items|x|users|, data is float32
+    :param Pui_indptr, Pui_indices, Pui_data:   CSR arrays of Pui |users|x|items|, data is float32
+    :param degree:                              float64 array |items|, weight of each item column
+    :return:    row_nnz, int32 array (end_row - start_row), number of values of each row
+                indices, int32 array, item of each value, rows one after the other
+                data, float32 array
+    """
+
+    cdef int[:] Piu_indptr_view = Piu_indptr
+    cdef int[:] Piu_indices_view = Piu_indices
+    cdef float[:] Piu_data_view = Piu_data
+
+    cdef int[:] Pui_indptr_view = Pui_indptr
+    cdef int[:] Pui_indices_view = Pui_indices
+    cdef float[:] Pui_data_view = Pui_data
+
+    cdef double[:] degree_view = degree
+
+    cdef int n_items = len(degree)
+    cdef int n_rows = end_row - start_row
+
+    # The output arrays are preallocated for the largest possible number of values and trimmed at the end
+    cdef np.ndarray[np.int32_t, ndim=1] row_nnz = np.zeros(n_rows, dtype=np.int32)
+    cdef np.ndarray[np.int32_t, ndim=1] indices = np.zeros(n_rows * topK, dtype=np.int32)
+    cdef np.ndarray[np.float32_t, ndim=1] data = np.zeros(n_rows * topK, dtype=np.float32)
+
+    cdef int[:] row_nnz_view = row_nnz
+    cdef int[:] indices_view = indices
+    cdef float[:] data_view = data
+
+    # Sparse accumulator, only the touched cells are reset after each row
+    cdef float[:] accumulator = np.zeros(n_items, dtype=np.float32)
+    cdef int[:] touched_mask = np.zeros(n_items, dtype=np.int32)
+    cdef int[:] touched_list = np.zeros(n_items, dtype=np.int32)
+
+    cdef double[:] heap_value = np.zeros(max(topK, 1), dtype=np.float64)
+    cdef int[:] heap_item = np.zeros(max(topK, 1), dtype=np.int32)
+
+    cdef int row, user_index, user_id, item_index, item_id, touched_index, n_touched, heap_size
+    cdef long n_cells = 0
+    cdef float piu_value
+    cdef double value
+
+    with nogil:
+
+        for row in range(start_row, end_row):
+
+            n_touched = 0
+
+            for user_index in range(Piu_indptr_view[row], Piu_indptr_view[row + 1]):
+
+                user_id = Piu_indices_view[user_index]
+                piu_value = Piu_data_view[user_index]
+
+                for item_index in range(Pui_indptr_view[user_id], Pui_indptr_view[user_id + 1]):
+
+                    item_id = Pui_indices_view[item_index]
+
+                    if not touched_mask[item_id]:
+                        touched_mask[item_id] = True
+                        touched_list[n_touched] = item_id
+                        n_touched += 1
+
+                    accumulator[item_id] += piu_value * Pui_data_view[item_index]
+
+
+            heap_size = 0
+
+            for touched_index in range(n_touched):
+                item_id = touched_list[touched_index]
+
+                value = accumulator[item_id] * degree_view[item_id]
+
+                if item_id != row and value != 0.0:
+                    heap_size = _heap_push_candidate(heap_value, heap_item, heap_size, topK, value, item_id)
+
+                accumulator[item_id] = 0.0
+                touched_mask[item_id] = False
+
+
+            row_nnz_view[row - start_row] = heap_size
+
+            for item_index in range(heap_size):
+                indices_view[n_cells] = heap_item[item_index]
+                data_view[n_cells] = <float> heap_value[item_index]
+                n_cells += 1
+
+
+    return row_nnz, indices[:n_cells], data[:n_cells]
@@ -9,10 +9,17 @@ import scipy.sparse as sps
 
 from sklearn.preprocessing import normalize
 from Recommenders.Recommender_utils import check_matrix, similarityMatrixTopK
+from Utils.IncrementalSparseMatrix import IncrementalSparseMatrix_Blocks, sparse_matrix_to_format_on_disk
 from Utils.seconds_to_biggest_unit import seconds_to_biggest_unit
 
 from Recommenders.BaseSimilarityMatrixRecommender import BaseItemSimilarityMatrixRecommender
-import time, sys
+import time, sys, os, multiprocessing, hashlib
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+
+# key -> product of the last products computed with use_product_cache, least recently used first,
+# shared by all the instances, e.g., by those created for each case of a hyperparameter search
+_product_cache = OrderedDict()
 
 
 class RP3betaRecommender(BaseItemSimilarityMatrixRecommender):
@@ -29,7 +36,139 @@ class RP3betaRecommender(BaseItemSimilarityMatrixRecommender):
             self.beta, self.min_rating, self.topK,
             self.implicit, self.normalize_similarity)
 
-    def fit(self, alpha=1., beta=0.6, min_rating=0, topK=100, implicit=True, normalize_similarity=True):
+    def _compute_similarity_block_python(self, Piu, Pui, degree, topK, start_row, end_row):
+        """
+        Python version of compute_rp3beta_similarity_block, used if the compiled one is not available
+        """
+
+        similarity_block = (Piu[start_row:end_row, :] * Pui).toarray() * degree
+        similarity_block[np.arange(end_row - start_row), np.arange(start_row, end_row)] = 0.0
+
+        best = np.argpartition(-similarity_block, topK - 1, axis=1)[:, :topK]
+        best_values = np.take_along_axis(similarity_block, best, axis=1)
+
+        nonzero_mask = best_values != 0.0
+
+        return nonzero_mask.sum(axis=1).astype(np.int32), best[nonzero_mask].astype(np.int32), \
+               best_values[nonzero_mask].astype(np.float32)
+
+    def _compute_similarity_topK(self, Piu, Pui, degree, topK, n_threads, disk_folder_path=None, memory_budget_MB=1024):
+        """
+        Computes the rows of Piu * Pui reweighted by degree, without the diagonal, and keeps the topK of each row.
+        The rows are computed in blocks by n_threads threads, the compiled kernel releases the GIL.
+        If disk_folder_path is not None the result is written in that folder and memory-mapped.
+        """
+
+        n_items = Pui.shape[1]
+        topK = n_items if topK is False or topK is None else min(topK, n_items)
+
+        try:
+            from Recommenders.GraphBased.Cython.RP3beta_Similarity_Cython import compute_rp3beta_similarity_block
+
+            Piu = check_matrix(Piu, 'csr', dtype=np.float32)
+            Pui = check_matrix(Pui, 'csr', dtype=np.float32)
+
+            Piu_arrays = (Piu.indptr.astype(np.int32), Piu.indices.astype(np.int32), Piu.data)
+            Pui_arrays = (Pui.indptr.astype(np.int32), Pui.indices.astype(np.int32), Pui.data)
+            degree = np.asarray(degree, dtype=np.float64)
+
+            def compute_block(start_row, end_row):
+                return compute_rp3beta_similarity_block(*Piu_arrays, *Pui_arrays, degree, topK, start_row, end_row)
+
+        except ImportError:
+            self._print("Unable to load Cython RP3beta_Similarity, reverting to Python")
+
+            def compute_block(start_row, end_row):
+                return self._compute_similarity_block_python(Piu, Pui, degree, topK, start_row, end_row)
+
+        if n_threads is None:
+            n_threads = multiprocessing.cpu_count()
+
+        block_dim = 200
+        block_start_list = list(range(0, n_items, block_dim))
+
+        W_sparse_builder = IncrementalSparseMatrix_Blocks(n_items, n_items, format="csr", dtype=np.float32,
+                                                          folder_path=disk_folder_path, memory_budget_MB=memory_budget_MB)
+
+        start_time = time.time()
+        start_time_printBatch = start_time
+
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+
+            block_result_iterator = executor.map(lambda block_start: compute_block(block_start, min(block_start + block_dim, n_items)),
+                                                 block_start_list)
+
+            for block_start, (row_nnz, indices, data) in zip(block_start_list, block_result_iterator):
+
+                W_sparse_builder.add_block(row_nnz, indices, data)
+
+                n_rows_done = min(block_start + block_dim, n_items)
+
+                if time.time() - start_time_printBatch > 300 or n_rows_done == n_items:
+                    new_time_value, new_time_unit = seconds_to_biggest_unit(time.time() - start_time)
+
+                    self._print("Similarity column {} ({:4.1f}%), {:.2f} column/sec. Elapsed time {:.2f} {}".format(
+                        n_rows_done,
+                        100.0 * float(n_rows_done) / n_items,
+                        float(n_rows_done) / (time.time() - start_time),
+                        new_time_value, new_time_unit))
+
+                    sys.stdout.flush()
+                    sys.stderr.flush()
+
+                    start_time_printBatch = time.time()
+
+        W_sparse = W_sparse_builder.get_SparseMatrix()
+        W_sparse.sort_indices()
+
+        return W_sparse
+
+    def _get_product(self, Piu, Pui, n_threads, product_topK, product_cache_size):
+        """
+        Returns Piu * Pui without the diagonal, from the cache if it has been computed for the same data and alpha.
+        Only the product_cache_size most recently used products are kept, as each can be as large as a dense
+        |items|x|items| matrix if product_topK is None
+        """
+
+        URM_train = self.URM_train
+
+        cache_key = hashlib.sha1()
+        for array in [URM_train.indptr, URM_train.indices, URM_train.data]:
+            cache_key.update(np.ascontiguousarray(array).view(np.uint8))
+        cache_key.update(repr((URM_train.shape, self.alpha, self.min_rating, self.implicit, product_topK)).encode("utf-8"))
+        cache_key = cache_key.hexdigest()
+
+        if cache_key in _product_cache:
+            self._print("Using the cached product for alpha {}".format(self.alpha))
+            _product_cache.move_to_end(cache_key)
+            return _product_cache[cache_key]
+
+        # Release the least recently used products before computing the new one
+        while len(_product_cache) >= max(product_cache_size, 1):
+            _product_cache.popitem(last=False)
+
+        product = self._compute_similarity_topK(Piu, Pui, np.ones(Pui.shape[1]), product_topK, n_threads)
+        _product_cache[cache_key] = product
+
+        return product
+
+    def fit(self, alpha=1., beta=0.6, min_rating=0, topK=100, implicit=True, normalize_similarity=True, n_threads=None,
+            use_product_cache=False, product_topK=None, product_cache_size=1, disk_folder_path=None, memory_budget_MB=1024):
+        """
+        If use_product_cache is True the product Piu * Pui, which depends on the data and alpha only, is kept in memory
+        and the following fits with the same alpha only rescale it with the degree, select the topK and normalize.
+        The products of the product_cache_size most recently used alpha values are kept.
+        If product_topK is None the whole product is cached and the result is the same as without the cache,
+        otherwise only its product_topK values of each row are, which is faster but approximate,
+        since after the reweighting the topK of each row might contain items outside of them.
+        The cache only pays off if the fits repeat the same alpha, e.g., with a Categorical alpha in a search, while the
+        whole product may be nearly dense, so a bounded product_topK should be used to cache several of them.
+
+        If disk_folder_path is not None the similarity is built in that folder and W_sparse is memory-mapped from its
+        files. Each fit writes in new subfolders, so the models previously fitted in the same folder are not changed,
+        and the folder should be deleted once they are no longer used. memory_budget_MB bounds the values kept in
+        memory while building it, the cached product, if any, is still kept in memory.
+        """
 
         self.alpha = alpha
         self.beta = beta
@@ -75,74 +214,31 @@ class RP3betaRecommender(BaseItemSimilarityMatrixRecommender):
 
         # Final matrix is computed as Pui * Piu * Pui
         # Multiplication unpacked for memory usage reasons
-        block_dim = 200
-        d_t = Piu
-
-        # Use array as it reduces memory requirements compared to lists
-        dataBlock = 10000000
-
-        rows = np.zeros(dataBlock, dtype=np.int32)
-        cols = np.zeros(dataBlock, dtype=np.int32)
-        values = np.zeros(dataBlock, dtype=np.float32)
-
-        numCells = 0
-
-        start_time = time.time()
-        start_time_printBatch = start_time
-
-        for current_block_start_row in range(0, Pui.shape[1], block_dim):
-
-            if current_block_start_row + block_dim > Pui.shape[1]:
-                block_dim = Pui.shape[1] - current_block_start_row
-
-            similarity_block = d_t[current_block_start_row:current_block_start_row + block_dim, :] * Pui
-            similarity_block = similarity_block.toarray()
-
-            for row_in_block in range(block_dim):
-                row_data = np.multiply(similarity_block[row_in_block, :], degree)
-                row_data[current_block_start_row + row_in_block] = 0
-
-                best = row_data.argsort()[::-1][:self.topK]
-
-                notZerosMask = row_data[best] != 0.0
-
-                values_to_add = row_data[best][notZerosMask]
-                cols_to_add = best[notZerosMask]
+        if use_product_cache:
+            # The product replaces Pui and the identity replaces Piu, so that the same kernel
+            # only rescales the columns by the degree and selects the topK of each row
+            product = self._get_product(Piu, Pui, n_threads, product_topK, product_cache_size)
+            identity = sps.identity(product.shape[0], dtype=np.float32, format='csr')
 
-                for index in range(len(values_to_add)):
+            Piu, Pui = identity, product
 
-                    if numCells == len(rows):
-                        rows = np.concatenate((rows, np.zeros(dataBlock, dtype=np.int32)))
-                        cols = np.concatenate((cols, np.zeros(dataBlock, dtype=np.int32)))
-                        values = np.concatenate((values, np.zeros(dataBlock, dtype=np.float32)))
+        similarity_folder_path = None if disk_folder_path is None else os.path.join(disk_folder_path, "similarity")
+        topK_folder_path = None if disk_folder_path is None else os.path.join(disk_folder_path, "similarity_topK")
 
-                    rows[numCells] = current_block_start_row + row_in_block
-                    cols[numCells] = cols_to_add[index]
-                    values[numCells] = values_to_add[index]
-
-                    numCells += 1
-
-            if time.time() - start_time_printBatch > 300:
-                new_time_value, new_time_unit = seconds_to_biggest_unit(time.time() - start_time)
-
-                self._print("Similarity column {} ({:4.1f}%), {:.2f} column/sec. Elapsed time {:.2f} {}".format(
-                    current_block_start_row + block_dim,
-                    100.0 * float(current_block_start_row + block_dim) / Pui.shape[1],
-                    float(current_block_start_row + block_dim) / (time.time() - start_time),
-                    new_time_value, new_time_unit))
-
-                sys.stdout.flush()
-                sys.stderr.flush()
-
-                start_time_printBatch = time.time()
-
-        self.W_sparse = sps.csr_matrix((values[:numCells], (rows[:numCells], cols[:numCells])),
-                                       shape=(Pui.shape[1], Pui.shape[1]))
+        self.W_sparse = self._compute_similarity_topK(Piu, Pui, degree, self.topK, n_threads,
+                                                      disk_folder_path=similarity_folder_path,
+                                                      memory_budget_MB=memory_budget_MB)
 
         if self.normalize_similarity:
-            self.W_sparse = normalize(self.W_sparse, norm='l1', axis=1)
+            # On disk the memory-mapped values are normalized in place
+            self.W_sparse = normalize(self.W_sparse, norm='l1', axis=1, copy=disk_folder_path is None)
 
         if self.topK != False:
-            self.W_sparse = similarityMatrixTopK(self.W_sparse, k=self.topK)
-
-        self.W_sparse = check_matrix(self.W_sparse, format='csr')
+            self.W_sparse = similarityMatrixTopK(self.W_sparse, k=self.topK, disk_folder_path=topK_folder_path,
+                                                 memory_budget_MB=memory_budget_MB)
+
+        if disk_folder_path is None:
+            self.W_sparse = check_matrix(self.W_sparse, format='csr')
+        else:
+            self.W_sparse = sparse_matrix_to_format_on_disk(self.W_sparse, "csr", os.path.join(topK_folder_path, "csr"),
+                                                            memory_budget_MB=memory_budget_MB)
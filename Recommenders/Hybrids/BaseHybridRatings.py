@@ -1,6 +1,9 @@
+import os
+
 import numpy as np
 
 from Recommenders.BaseSimilarityMatrixRecommender import BaseItemSimilarityMatrixRecommender
+from Recommenders.BaseTempFolder import BaseTempFolder
 from Recommenders.EASE_R.EASE_R_Recommender import EASE_R_Recommender
 from Recommenders.Recommender_utils import check_matrix
 
@@ -8,20 +11,34 @@ output_root_path = "./result_experiments/"
 
 
 def _normalize(item_weights_1, item_weights_2):
-    mean1 = np.mean(item_weights_1)
-    mean2 = np.mean(item_weights_2)
-    std1 = np.std(item_weights_1)
-    std2 = np.std(item_weights_2)
-    if std1 != 0 and std2 != 0:
-        item_weights_1 = (item_weights_1 - mean1) / std1
-        item_weights_2 = (item_weights_2 - mean2) / std2
+    """
+    Standardizes the scores of each user with the mean and std of its own row, so the scores of a user do not
+    depend on the other users of the batch. The scores of a user are unchanged if either of its two std is zero
+    """
+    mean1 = np.mean(item_weights_1, axis=1, keepdims=True)
+    mean2 = np.mean(item_weights_2, axis=1, keepdims=True)
+    std1 = np.std(item_weights_1, axis=1, keepdims=True)
+    std2 = np.std(item_weights_2, axis=1, keepdims=True)
+
+    is_constant = np.logical_or(std1 == 0, std2 == 0)
+    mean1[is_constant], mean2[is_constant] = 0.0, 0.0
+    std1[is_constant], std2[is_constant] = 1.0, 1.0
+
+    item_weights_1 = (item_weights_1 - mean1) / std1
+    item_weights_2 = (item_weights_2 - mean2) / std2
 
     return item_weights_1, item_weights_2
 
 
-class BaseHybridRatings(BaseItemSimilarityMatrixRecommender):
+class BaseHybridRatings(BaseItemSimilarityMatrixRecommender, BaseTempFolder):
     """
     Hybrid of two prediction scores R = R1*alpha + R2*(1-alpha)
+
+    If use_score_cache is True the scores of the three components are stored in float32 memory-mapped arrays
+    the first time a user is scored, and the components are fitted again only when their own hyperparameters change.
+    A new call to fit which only changes alpha, beta and gamma therefore reuses the cached scores.
+    The raw scores are cached and normalized on each batch as before, so the ranking only differs from the
+    uncached one by the float32 rounding of the scores.
     """
 
     RECOMMENDER_NAME = "BaseHybridRatings"
@@ -38,28 +55,94 @@ class BaseHybridRatings(BaseItemSimilarityMatrixRecommender):
         self.recommender_2 = recommender_2
         self.recommender_3 = recommender_3
 
+        self.use_score_cache = False
+        self._components_fit_args = None
+        self._score_cache = None
+        self._score_cache_folder = None
+        self._score_cache_user_mask = None
+
     def fit(self, alpha=0.9560759641998946, beta=0.3, gamma=0.3, alpha1=0.9739242060693925, beta1=0.32744235125291515,
-            topK1=837):
+            topK1=837, use_score_cache=False, score_cache_folder=None):
         self.alpha = alpha
         self.beta = beta
         self.gamma = gamma
 
-        self.recommender_1.fit(alpha=alpha1, beta=beta1, topK=topK1)
+        components_fit_args = (alpha1, beta1, topK1)
 
-        if self.fold is not None and isinstance(self.recommender_2, EASE_R_Recommender):
-            easer_name = 'EASE_R_Recommender-fold{}.zip'.format(self.fold)
-            self.recommender_2.load_model(output_root_path, file_name=easer_name)
-        else:
-            self.recommender_2.fit()
+        if not use_score_cache or components_fit_args != self._components_fit_args:
 
-        self.recommender_3.fit()
+            self.clear_score_cache()
+
+            self.recommender_1.fit(alpha=alpha1, beta=beta1, topK=topK1)
+
+            if self.fold is not None and isinstance(self.recommender_2, EASE_R_Recommender):
+                easer_name = 'EASE_R_Recommender-fold{}.zip'.format(self.fold)
+                self.recommender_2.load_model(output_root_path, file_name=easer_name)
+            else:
+                self.recommender_2.fit()
+
+            self.recommender_3.fit()
+
+            self._components_fit_args = components_fit_args
+
+        self.use_score_cache = use_score_cache
+
+        if self.use_score_cache and self._score_cache is None:
+            self._create_score_cache(score_cache_folder)
 
         print('{} hyperparams: {}, {}, {}'.format(self.RECOMMENDER_NAME, self.alpha, self.beta, self.gamma))
 
+    def _create_score_cache(self, score_cache_folder=None):
+        """
+        Creates one |users|x|items| float32 memory-mapped array for each component, the files are sparse
+        so only the rows of the users that are actually scored occupy disk space
+        """
+
+        self._score_cache_folder = self._get_unique_temp_folder(input_temp_file_folder=score_cache_folder)
+
+        self._score_cache = [np.lib.format.open_memmap(os.path.join(self._score_cache_folder,
+                                                                    "component_{}_scores.npy".format(component_index)),
+                                                       mode='w+', dtype=np.float32, shape=(self.n_users, self.n_items))
+                             for component_index in range(3)]
+
+        self._score_cache_user_mask = np.zeros(self.n_users, dtype=bool)
+
+    def clear_score_cache(self):
+        """
+        Removes the cached scores, the temporary folder is deleted only if it is the default one
+        """
+
+        if self._score_cache is not None:
+            # The memory-mapped files must be closed before being removed
+            self._score_cache = None
+            self._score_cache_user_mask = None
+            self._clean_temp_folder(temp_file_folder=self._score_cache_folder)
+
+        self._score_cache_folder = None
+
+    def _get_component_scores(self, user_id_array):
+        """
+        Returns the raw scores of the three components, from the cache if it is enabled
+        """
+
+        recommender_list = [self.recommender_1, self.recommender_2, self.recommender_3]
+
+        if not self.use_score_cache:
+            return [recommender._compute_item_score(user_id_array) for recommender in recommender_list]
+
+        user_id_array = np.asarray(user_id_array)
+        new_user_id_array = np.unique(user_id_array[~self._score_cache_user_mask[user_id_array]])
+
+        if len(new_user_id_array) > 0:
+            for recommender, score_cache in zip(recommender_list, self._score_cache):
+                score_cache[new_user_id_array] = recommender._compute_item_score(new_user_id_array)
+
+            self._score_cache_user_mask[new_user_id_array] = True
+
+        return [score_cache[user_id_array] for score_cache in self._score_cache]
+
     def _compute_item_score(self, user_id_array, items_to_compute=None):
-        item_weights_1 = self.recommender_1._compute_item_score(user_id_array)
-        item_weights_2 = self.recommender_2._compute_item_score(user_id_array)
-        item_weights_3 = self.recommender_3._compute_item_score(user_id_array)
+        item_weights_1, item_weights_2, item_weights_3 = self._get_component_scores(user_id_array)
 
         item_weights_1, item_weights_2 = _normalize(item_weights_1, item_weights_2)
         item_weights_1, item_weights_3 = _normalize(item_weights_1, item_weights_3)
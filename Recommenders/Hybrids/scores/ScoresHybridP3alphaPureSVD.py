@@ -22,11 +22,11 @@ class ScoresHybridP3alphaPureSVD(BaseItemSimilarityMatrixRecommender):
         self.svd = PureSVDRecommender.PureSVDRecommender(URM_train)
 
     def fit(self, topK_P=991, alpha_P=0.4705816992313091, normalize_similarity_P=False, alpha=0.5, num_factors=340,
-            norm_scores=True):
+            norm_scores=True, use_svd_cache=False, svd_cache_num_factors=None):
         self.alpha = alpha
         self.norm_scores = norm_scores
         self.P3alpha.fit(topK=topK_P, alpha=alpha_P, normalize_similarity=normalize_similarity_P)
-        self.svd.fit(num_factors=num_factors)
+        self.svd.fit(num_factors=num_factors, use_svd_cache=use_svd_cache, svd_cache_num_factors=svd_cache_num_factors)
 
 
     def _compute_item_score(self, user_id_array, items_to_compute=None):
@@ -13,6 +13,7 @@ from Recommenders.IR_feature_weighting import okapi_BM_25, TF_IDF
 import numpy as np
 
 from Recommenders.Similarity.Compute_Similarity import Compute_Similarity
+from Recommenders.Similarity.Compute_Similarity_Sweep import is_sweep_supported, get_similarity_sweep
 
 
 class UserKNNCFRecommender(BaseUserSimilarityMatrixRecommender):
@@ -26,7 +27,13 @@ class UserKNNCFRecommender(BaseUserSimilarityMatrixRecommender):
         super(UserKNNCFRecommender, self).__init__(URM_train, verbose=verbose)
 
     def fit(self, topK=50, shrink=100, similarity='cosine', normalize=True, feature_weighting="none", URM_bias=False,
-            **similarity_args):
+            use_similarity_cache=False, similarity_cache_topK=1000, **similarity_args):
+        """
+        If use_similarity_cache is True the dot products of the data, which do not depend on topK, shrink, normalize
+        and the parameters of the similarity, are kept in memory as a sweep of similarity_cache_topK candidates
+        for each column, and the following fits on the same data only rescale and truncate them.
+        The result is the same as without the cache, the similarities the sweep does not support are computed as usual.
+        """
 
         self.topK = topK
         self.shrink = shrink
@@ -49,8 +56,16 @@ class UserKNNCFRecommender(BaseUserSimilarityMatrixRecommender):
             self.URM_train = TF_IDF(self.URM_train.T).T
             self.URM_train = check_matrix(self.URM_train, 'csr')
 
-        similarity = Compute_Similarity(self.URM_train.T, shrink=shrink, topK=topK, normalize=normalize,
-                                        similarity=similarity, **similarity_args)
+        if use_similarity_cache and topK > 0 and is_sweep_supported(self.URM_train.T, similarity, **similarity_args):
+            sweep = get_similarity_sweep(self.URM_train.T, similarity, topK, candidate_topK=similarity_cache_topK)
+
+            self.W_sparse = sweep.compute_similarity(topK=topK, shrink=shrink, normalize=normalize,
+                                                     similarity=similarity, **similarity_args)
+
+        else:
+            similarity = Compute_Similarity(self.URM_train.T, shrink=shrink, topK=topK, normalize=normalize,
+                                            similarity=similarity, **similarity_args)
+
+            self.W_sparse = similarity.compute_similarity()
 
-        self.W_sparse = similarity.compute_similarity()
         self.W_sparse = check_matrix(self.W_sparse, format='csr')
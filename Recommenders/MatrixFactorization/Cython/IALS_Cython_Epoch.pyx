@@ -0,0 +1,219 @@
+#cython: boundscheck=False
+#cython: wraparound=False
+#cython: initializedcheck=False
+#cython: language_level=3
+#cython: nonecheck=False
+#cython: cdivision=True
+#cython: overflowcheck=False
+
+"""
+Created on 18/10/26
+"""
+
+
+import numpy as np
+cimport numpy as np
+
+from scipy.linalg.cython_lapack cimport sposv
+from scipy.linalg.cython_blas cimport ssyrk
+from libc.math cimport sqrt
+
+
+cdef inline void _solve_cholesky(int[::1] interaction_index, float[::1] interaction_confidence,
+                                 int start_pos, int end_pos, float[:, ::1] Y, float[:, ::1] YtY, float reg,
+                                 float[:, ::1] A, float[::1] b, float[:, ::1] Y_weighted, float[:, ::1] X, int row) nogil:
+    """
+    Solves (YtY + Yt*(Cu-I)*Y + reg*I) x = Yt*Cu*p(u) with a Cholesky factorization and writes x in X[row, :].
+    The row is left unchanged if the matrix is not positive definite
+    """
+
+    cdef int n_factors = Y.shape[1]
+    cdef int n_interactions = end_pos - start_pos
+    cdef int index, factor_i, factor_j, item_id, info = 0, n_rhs = 1
+    cdef float confidence, weight, one = 1.0
+    cdef char uplo = b'U', trans = b'N'
+    cdef bint use_syrk = True
+
+    for factor_i in range(n_factors):
+        b[factor_i] = 0.0
+        for factor_j in range(n_factors):
+            A[factor_i, factor_j] = YtY[factor_i, factor_j]
+        A[factor_i, factor_i] += reg
+
+    for index in range(start_pos, end_pos):
+        item_id = interaction_index[index]
+        confidence = interaction_confidence[index]
+
+        if confidence < 1.0:
+            use_syrk = False
+
+        weight = sqrt(confidence - 1.0) if confidence >= 1.0 else 0.0
+
+        for factor_i in range(n_factors):
+            b[factor_i] += confidence * Y[item_id, factor_i]
+            Y_weighted[index - start_pos, factor_i] = weight * Y[item_id, factor_i]
+
+    # A is symmetric and only its upper triangle in column-major order is used, i.e., the lower one in row-major.
+    # Yt*(Cu-I)*Y is the product of the rows of Y weighted by sqrt(c-1), computed with BLAS when all c >= 1
+    if use_syrk and n_interactions > 0:
+        ssyrk(&uplo, &trans, &n_factors, &n_interactions, &one, &Y_weighted[0, 0], &n_factors,
+              &one, &A[0, 0], &n_factors)
+
+    elif not use_syrk:
+        for index in range(start_pos, end_pos):
+            item_id = interaction_index[index]
+            confidence = interaction_confidence[index]
+
+            for factor_i in range(n_factors):
+                weight = (confidence - 1.0) * Y[item_id, factor_i]
+
+                for factor_j in range(factor_i + 1):
+                    A[factor_i, factor_j] += weight * Y[item_id, factor_j]
+
+    sposv(&uplo, &n_factors, &n_rhs, &A[0, 0], &n_factors, &b[0], &n_factors, &info)
+
+    if info == 0:
+        for factor_i in range(n_factors):
+            X[row, factor_i] = b[factor_i]
+
+
+
+cdef inline void _solve_conjugate_gradient(int[::1] interaction_index, float[::1] interaction_confidence,
+                                           int start_pos, int end_pos, float[:, ::1] Y, float[:, ::1] YtY, float reg,
+                                           float[::1] x, float[::1] r, float[::1] p, float[::1] Ap, float[:, ::1] X,
+                                           int row, int cg_steps) nogil:
+    """
+    Approximately solves the same system with cg_steps steps of conjugate gradient, starting from the current X[row, :].
+    The product with the system matrix is computed from the interactions without building the matrix, see:
+    G. Takacs, I. Pilaszy and D. Tikk, Applications of the conjugate gradient method for implicit feedback
+    collaborative filtering, RecSys 2011.
+    """
+
+    cdef int n_factors = Y.shape[1]
+    cdef int index, factor_i, factor_j, item_id, step
+    cdef float confidence, dot_product, rsold, rsnew, alpha_step
+
+    # r = b - A*x
+    for factor_i in range(n_factors):
+        x[factor_i] = X[row, factor_i]
+
+    for factor_i in range(n_factors):
+        dot_product = reg * x[factor_i]
+        for factor_j in range(n_factors):
+            dot_product = dot_product + YtY[factor_i, factor_j] * x[factor_j]
+        r[factor_i] = - dot_product
+
+    for index in range(start_pos, end_pos):
+        item_id = interaction_index[index]
+        confidence = interaction_confidence[index]
+
+        dot_product = 0.0
+        for factor_i in range(n_factors):
+            dot_product = dot_product + Y[item_id, factor_i] * x[factor_i]
+
+        for factor_i in range(n_factors):
+            r[factor_i] += (confidence - (confidence - 1.0) * dot_product) * Y[item_id, factor_i]
+
+    rsold = 0.0
+    for factor_i in range(n_factors):
+        p[factor_i] = r[factor_i]
+        rsold = rsold + r[factor_i] * r[factor_i]
+
+    for step in range(cg_steps):
+
+        if rsold < 1e-20:
+            break
+
+        # Ap = A*p
+        for factor_i in range(n_factors):
+            dot_product = reg * p[factor_i]
+            for factor_j in range(n_factors):
+                dot_product = dot_product + YtY[factor_i, factor_j] * p[factor_j]
+            Ap[factor_i] = dot_product
+
+        for index in range(start_pos, end_pos):
+            item_id = interaction_index[index]
+            confidence = interaction_confidence[index]
+
+            dot_product = 0.0
+            for factor_i in range(n_factors):
+                dot_product = dot_product + Y[item_id, factor_i] * p[factor_i]
+
+            for factor_i in range(n_factors):
+                Ap[factor_i] += (confidence - 1.0) * dot_product * Y[item_id, factor_i]
+
+        dot_product = 0.0
+        for factor_i in range(n_factors):
+            dot_product = dot_product + p[factor_i] * Ap[factor_i]
+
+        alpha_step = rsold / dot_product
+
+        rsnew = 0.0
+        for factor_i in range(n_factors):
+            x[factor_i] += alpha_step * p[factor_i]
+            r[factor_i] -= alpha_step * Ap[factor_i]
+            rsnew = rsnew + r[factor_i] * r[factor_i]
+
+        for factor_i in range(n_factors):
+            p[factor_i] = r[factor_i] + rsnew / rsold * p[factor_i]
+
+        rsold = rsnew
+
+    for factor_i in range(n_factors):
+        X[row, factor_i] = x[factor_i]
+
+
+
+def update_factors_block(C_indptr, C_indices, C_data, Y, YtY, float reg, X, row_array,
+                         int start, int end, bint use_conjugate_gradient, int cg_steps):
+    """
+    Updates in place the factors X of the rows row_array[start:end], given the fixed factors Y.
+    Each row solves the IALS least-squares problem
+        (YtY + Yt*(Cu-I)*Y + reg*I) x = Yt*Cu*p(u)
+    either exactly, with a Cholesky factorization, or with cg_steps steps of conjugate gradient.
+    The whole computation releases the GIL so that different blocks can be updated by different threads.
+
+    :param C_indptr, C_indices, C_data:     CSR arrays of the confidence matrix, rows are the ones of X, data is float32
+    :param Y:                               float32 array |columns|x|n_factors|
+    :param YtY:                             float32 array |n_factors|x|n_factors|
+    :param X:                               float32 array |rows|x|n_factors|, C-contiguous
+    :param row_array:                       int32 array of the rows to update
+    """
+
+    cdef int[::1] C_indptr_view = C_indptr
+    cdef int[::1] C_indices_view = C_indices
+    cdef float[::1] C_data_view = C_data
+
+    cdef float[:, ::1] Y_view = Y
+    cdef float[:, ::1] YtY_view = YtY
+    cdef float[:, ::1] X_view = X
+    cdef int[::1] row_array_view = row_array
+
+    cdef int n_factors = Y.shape[1]
+    cdef int max_interactions = 0
+
+    if end > start:
+        max_interactions = np.max(np.diff(C_indptr)[row_array[start:end]])
+
+    # Scratch buffers, allocated once per block
+    cdef float[:, ::1] A = np.zeros((n_factors, n_factors), dtype=np.float32)
+    cdef float[:, ::1] Y_weighted = np.zeros((max(max_interactions, 1), n_factors), dtype=np.float32)
+    cdef float[::1] b = np.zeros(n_factors, dtype=np.float32)
+    cdef float[::1] x = np.zeros(n_factors, dtype=np.float32)
+    cdef float[::1] r = np.zeros(n_factors, dtype=np.float32)
+    cdef float[::1] p = np.zeros(n_factors, dtype=np.float32)
+    cdef float[::1] Ap = np.zeros(n_factors, dtype=np.float32)
+
+    cdef int index, row
+
+    with nogil:
+
+        for index in range(start, end):
+            row = row_array_view[index]
+
+            if use_conjugate_gradient:
+                _solve_conjugate_gradient(C_indices_view, C_data_view, C_indptr_view[row], C_indptr_view[row + 1],
+                                          Y_view, YtY_view, reg, x, r, p, Ap, X_view, row, cg_steps)
+            else:
+                _solve_cholesky(C_indices_view, C_data_view, C_indptr_view[row], C_indptr_view[row + 1],
+                                Y_view, YtY_view, reg, A, b, Y_weighted, X_view, row)
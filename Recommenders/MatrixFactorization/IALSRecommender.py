@@ -7,7 +7,9 @@ Created on 23/03/2019
 from Recommenders.BaseMatrixFactorizationRecommender import BaseMatrixFactorizationRecommender
 from Recommenders.Incremental_Training_Early_Stopping import Incremental_Training_Early_Stopping
 from Recommenders.Recommender_utils import check_matrix
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
+import multiprocessing
 
 
 class IALSRecommender(BaseMatrixFactorizationRecommender, Incremental_Training_Early_Stopping):
@@ -33,6 +35,7 @@ class IALSRecommender(BaseMatrixFactorizationRecommender, Incremental_Training_E
     RECOMMENDER_NAME = "IALSRecommender"
 
     AVAILABLE_CONFIDENCE_SCALING = ["linear", "log"]
+    AVAILABLE_SOLVER = ["cholesky", "cg"]
 
     def fit(self, epochs=300,
             num_factors=20,
@@ -42,6 +45,9 @@ class IALSRecommender(BaseMatrixFactorizationRecommender, Incremental_Training_E
             reg=1e-3,
             init_mean=0.0,
             init_std=0.1,
+            solver="cholesky",
+            cg_steps=3,
+            n_threads=None,
             **earlystopping_kwargs):
         """
 
@@ -53,6 +59,10 @@ class IALSRecommender(BaseMatrixFactorizationRecommender, Incremental_Training_E
         :param epsilon: epsilon used in log scaling only
         :param init_mean: mean used to initialize the latent factors
         :param init_std: standard deviation used to initialize the latent factors
+        :param solver: 'cholesky' solves exactly each least-squares problem, 'cg' approximates it with cg_steps steps
+                        of conjugate gradient starting from the previous factors
+        :param cg_steps: number of conjugate gradient steps per user or item, used by the 'cg' solver only
+        :param n_threads: number of threads used by the compiled epoch, default is the number of cores
         :return:
         """
 
@@ -61,10 +71,18 @@ class IALSRecommender(BaseMatrixFactorizationRecommender, Incremental_Training_E
                 "Value for 'confidence_scaling' not recognized. Acceptable values are {}, provided was '{}'".format(
                     self.AVAILABLE_CONFIDENCE_SCALING, confidence_scaling))
 
+        if solver not in self.AVAILABLE_SOLVER:
+            raise ValueError(
+                "Value for 'solver' not recognized. Acceptable values are {}, provided was '{}'".format(
+                    self.AVAILABLE_SOLVER, solver))
+
         self.num_factors = num_factors
         self.alpha = alpha
         self.epsilon = epsilon
         self.reg = reg
+        self.solver = solver
+        self.cg_steps = cg_steps
+        self.n_threads = multiprocessing.cpu_count() if n_threads is None else n_threads
 
         self.USER_factors = self._init_factors(self.n_users, False)  # don't need values, will compute them
         self.ITEM_factors = self._init_factors(self.n_items)
@@ -79,6 +97,16 @@ class IALSRecommender(BaseMatrixFactorizationRecommender, Incremental_Training_E
 
         self.regularization_diagonal = np.diag(self.reg * np.ones(self.num_factors))
 
+        try:
+            from Recommenders.MatrixFactorization.Cython.IALS_Cython_Epoch import update_factors_block
+            self._update_factors_block = update_factors_block
+
+            self.C_csc_T = check_matrix(self.C_csc.T, format="csr", dtype=np.float32)
+
+        except ImportError:
+            self._print("Unable to load Cython IALS_Cython_Epoch, reverting to Python with the exact solver")
+            self._update_factors_block = None
+
         self._update_best_model()
 
         self._train_with_early_stopping(epochs,
@@ -120,6 +148,40 @@ class IALSRecommender(BaseMatrixFactorizationRecommender, Incremental_Training_E
 
     def _run_epoch(self, num_epoch):
 
+        if self._update_factors_block is not None:
+            self._run_epoch_cython()
+        else:
+            self._run_epoch_python()
+
+    def _update_factors(self, C, Y, X, row_array):
+        """
+        Updates the factors X of the rows in row_array with the compiled solver, given the fixed factors Y.
+        The rows are split in blocks updated by n_threads threads, the compiled solver releases the GIL.
+        """
+
+        # YtY is accumulated in float64 for precision
+        YtY = Y.T.astype(np.float64).dot(Y).astype(np.float32)
+
+        C_arrays = (C.indptr.astype(np.int32), C.indices.astype(np.int32), C.data)
+        use_conjugate_gradient = self.solver == "cg"
+
+        block_dim = max(1, int(np.ceil(len(row_array) / (4 * self.n_threads))))
+
+        def update_block(block_start):
+            self._update_factors_block(*C_arrays, Y, YtY, self.reg, X, row_array,
+                                       block_start, min(block_start + block_dim, len(row_array)),
+                                       use_conjugate_gradient, self.cg_steps)
+
+        with ThreadPoolExecutor(max_workers=self.n_threads) as executor:
+            list(executor.map(update_block, range(0, len(row_array), block_dim)))
+
+    def _run_epoch_cython(self):
+
+        self._update_factors(self.C, self.ITEM_factors, self.USER_factors, self.warm_users)
+        self._update_factors(self.C_csc_T, self.USER_factors, self.ITEM_factors, self.warm_items)
+
+    def _run_epoch_python(self):
+
         # fit user factors
         # VV = n_factors x n_factors
         VV = self.ITEM_factors.T.dot(self.ITEM_factors)
@@ -184,7 +246,8 @@ class IALSRecommender(BaseMatrixFactorizationRecommender, Incremental_Training_E
     def _init_factors(self, num_factors, assign_values=True):
 
         if assign_values:
-            return self.num_factors ** -0.5 * np.random.random_sample((num_factors, self.num_factors))
+            return (self.num_factors ** -0.5 * np.random.random_sample((num_factors, self.num_factors))).astype(np.float32)
 
         else:
-            return np.empty((num_factors, self.num_factors))
+            # The conjugate gradient solver starts from the current values, which must be defined
+            return np.zeros((num_factors, self.num_factors), dtype=np.float32)
@@ -47,39 +47,3 @@ class IALSRecommender_implicit(BaseMatrixFactorizationRecommender):
         # Get the user and item vectors from our trained model
         self.USER_factors = model.user_factors
         self.ITEM_factors = model.item_factors
-
-    def _compute_item_score(self, user_id_array, items_to_compute=None):
-        """
-        USER_factors is n_users x n_factors
-        ITEM_factors is n_items x n_factors
-
-        The prediction for cold users will always be -inf for ALL items
-
-        :param user_id_array:
-        :param items_to_compute:
-        :return:
-        """
-
-        assert self.USER_factors.shape[1] == self.ITEM_factors.shape[1], \
-            "{}: User and Item factors have inconsistent shape".format(self.RECOMMENDER_NAME)
-
-        assert self.USER_factors.shape[0] > np.max(user_id_array), \
-            "{}: Cold users not allowed. Users in trained model are {}, requested prediction for users up to {}".format(
-                self.RECOMMENDER_NAME, self.USER_factors.shape[0], np.max(user_id_array))
-
-        if items_to_compute is not None:
-            item_scores = - np.ones((len(user_id_array), self.ITEM_factors.shape[0]), dtype=np.float32) * np.inf
-            item_scores[:, items_to_compute] = np.dot(self.USER_factors[user_id_array],
-                                                      np.transpose(self.ITEM_factors[items_to_compute, :]))
-
-        else:
-            item_factors_T = np.transpose(self.ITEM_factors)
-            user_factors = self.USER_factors[user_id_array]
-            item_scores = np.dot(user_factors, item_factors_T)
-
-        # No need to select only the specific negative items or warm users because the -inf score will not change
-        if self.use_bias:
-            item_scores += self.ITEM_bias + self.GLOBAL_bias
-            item_scores = np.transpose(np.transpose(item_scores) + self.USER_bias[user_id_array])
-
-        return item_scores
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 18/10/26
+"""
+
+import numpy as np
+
+
+def get_recall_at_cutoff(ranking_exact, ranking_approximate, n_items):
+    """
+    Fraction of the exact top-cutoff items of each query which are also in the approximate ones, averaged over
+    the queries with at least one exact item. Positions without an item are -1 in both rankings
+    """
+
+    n_exact = (ranking_exact != -1).sum(axis=1)
+
+    # Each (query, item) couple is encoded in a single key
+    query_index = np.arange(len(ranking_exact), dtype=np.int64)[:, None]
+    exact_key = (query_index * n_items + ranking_exact)[ranking_exact != -1]
+    approximate_key = (query_index * n_items + ranking_approximate)[ranking_approximate != -1]
+
+    n_found = np.bincount(exact_key[np.isin(exact_key, approximate_key)] // n_items, minlength=len(ranking_exact))
+
+    return np.mean(n_found[n_exact > 0] / n_exact[n_exact > 0])
+
+
+def _squared_distances(vectors, centroids, centroids_norm):
+    return (vectors ** 2).sum(axis=1)[:, None] - 2 * vectors.dot(centroids.T) + centroids_norm
+
+
+def _kmeans(vectors, n_clusters, n_iterations, random_state, block_size=10000):
+    """
+    Lloyd's k-means, the centroids are initialized with random vectors and empty clusters are moved to random vectors
+    :return:    centroids array (n_clusters, n_features), cluster of each vector
+    """
+
+    centroids = vectors[random_state.choice(len(vectors), n_clusters, replace=False)].copy()
+    assignment = np.zeros(len(vectors), dtype=np.int32)
+
+    for iteration in range(n_iterations + 1):
+
+        centroids_norm = (centroids ** 2).sum(axis=1)
+
+        for block_start in range(0, len(vectors), block_size):
+            block_end = min(block_start + block_size, len(vectors))
+            assignment[block_start:block_end] = np.argmin(_squared_distances(vectors[block_start:block_end],
+                                                                             centroids, centroids_norm), axis=1)
+
+        # The last iteration only computes the assignment to the final centroids
+        if iteration == n_iterations:
+            break
+
+        cluster_size = np.bincount(assignment, minlength=n_clusters)
+
+        centroids = np.zeros_like(centroids)
+        np.add.at(centroids, assignment, vectors)
+
+        non_empty = cluster_size > 0
+        centroids[non_empty] /= cluster_size[non_empty, None]
+
+        n_empty = np.sum(~non_empty)
+        if n_empty > 0:
+            centroids[~non_empty] = vectors[random_state.choice(len(vectors), n_empty, replace=False)]
+
+    return centroids, assignment
+
+
+class IVFInnerProductIndex(object):
+    """
+    Approximate maximum inner product search with an inverted file index.
+
+    The inner product search is reduced to a nearest neighbour search by appending to each item vector the
+    component sqrt(M^2 - ||v||^2), M being the largest norm, so that all items have the same norm and a query (q, 0)
+    ranks the items by inner product as it ranks them by L2 distance, see:
+    Y. Bachrach et al., Speeding up the Xbox recommender system using a euclidean transformation for inner-product
+    spaces, RecSys 2014.
+
+    The transformed items are clustered with k-means into n_lists lists. A query scores exactly only the items
+    of the n_probe lists whose centroids are the nearest, n_probe is the recall/speed trade-off:
+    with n_probe = n_lists the search is exact. The lists can have very different sizes, so the recall of a given
+    n_probe depends on the data, calibrate_n_probe selects it from a sample of queries.
+    """
+
+    def __init__(self, ITEM_factors, ITEM_bias=None, n_lists=None, n_probe=None, n_iterations=10, random_seed=None):
+        """
+        :param ITEM_factors:    array |n_items|x|n_factors|
+        :param ITEM_bias:       if not None, added to the score of each item
+        :param n_lists:         number of lists, default is sqrt(n_items)
+        :param n_probe:         number of lists scored by each query, default is 1/10 of the lists, see calibrate_n_probe
+        :param n_iterations:    k-means iterations
+        """
+
+        self.ITEM_factors = ITEM_factors
+
+        self.vectors = np.asarray(ITEM_factors, dtype=np.float32)
+
+        if ITEM_bias is not None:
+            # The bias is the inner product of an additional item component with a query component equal to 1
+            self.vectors = np.hstack((self.vectors, np.asarray(ITEM_bias, dtype=np.float32).reshape(-1, 1)))
+
+        self.vectors = np.ascontiguousarray(self.vectors)
+        self.use_bias = ITEM_bias is not None
+        self.n_items = self.vectors.shape[0]
+
+        self.n_lists = max(1, int(np.sqrt(self.n_items))) if n_lists is None else min(n_lists, self.n_items)
+        self.n_probe = max(1, self.n_lists // 10) if n_probe is None else n_probe
+
+        vectors_norm = (self.vectors ** 2).sum(axis=1)
+        transformed_vectors = np.hstack((self.vectors, np.sqrt(vectors_norm.max() - vectors_norm).reshape(-1, 1)))
+
+        random_state = np.random.RandomState(random_seed)
+        centroids, assignment = _kmeans(transformed_vectors, self.n_lists, n_iterations, random_state)
+
+        # The query has 0 in the additional component, the distance from a centroid is
+        # ||q||^2 + ||c||^2 - 2*q.c[:-1] and the nearest centroids have the highest 2*q.c[:-1] - ||c||^2
+        self.centroids = np.ascontiguousarray(centroids[:, :-1])
+        self.centroids_norm = (centroids ** 2).sum(axis=1)
+
+        # Lists are stored one after the other as in a CSR matrix, with the vectors in the same order,
+        # so the items of a list are scored with a single matrix product
+        self.list_indptr = np.zeros(self.n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment, minlength=self.n_lists), out=self.list_indptr[1:])
+
+        self.list_items = np.argsort(assignment, kind="stable").astype(np.int32)
+        self.list_vectors = np.ascontiguousarray(self.vectors[self.list_items])
+
+    def _get_query_vectors(self, query_factors):
+
+        query_vectors = np.asarray(query_factors, dtype=np.float32)
+
+        if self.use_bias:
+            query_vectors = np.hstack((query_vectors, np.ones((len(query_vectors), 1), dtype=np.float32)))
+
+        return query_vectors
+
+    def search(self, query_factors, cutoff, n_probe=None, excluded_items_mask=None, excluded_items_csr=None, block_size=1000):
+        """
+        Selects the approximate top-cutoff items of each query.
+        The queries are processed in blocks, each list probed by some queries of the block is scored with a
+        single matrix product and its top-cutoff items for each of those queries are kept, the best cutoff
+        among the ones kept for the n_probe lists of a query are returned.
+        :param query_factors:           array |n_queries|x|n_factors|, e.g., the user factors
+        :param n_probe:                 default is the one of the index
+        :param excluded_items_mask:     boolean array |n_items|, items never returned
+        :param excluded_items_csr:      CSR matrix |n_queries|x|n_items|, items not returned for each query, e.g., the seen ones
+        :return:    int32 array (n_queries, cutoff) with the items sorted by decreasing score, -1 if the probed lists
+                    hold less than cutoff items that are not excluded
+                    float32 array (n_queries, cutoff) with their score
+        """
+
+        n_probe = min(self.n_probe if n_probe is None else n_probe, self.n_lists)
+        query_vectors = self._get_query_vectors(query_factors)
+        n_queries = len(query_vectors)
+
+        ranking = np.full((n_queries, cutoff), -1, dtype=np.int32)
+        ranking_scores = np.full((n_queries, cutoff), -np.inf, dtype=np.float32)
+
+        for block_start in range(0, n_queries, block_size):
+            block_end = min(block_start + block_size, n_queries)
+            block_queries = query_vectors[block_start:block_end]
+            n_block_queries = len(block_queries)
+
+            centroid_scores = 2 * block_queries.dot(self.centroids.T) - self.centroids_norm
+            probed_lists = np.argpartition(-centroid_scores, n_probe - 1, axis=1)[:, :n_probe].ravel()
+
+            # Each couple (query, probed list) has cutoff slots for the best items of that list
+            pair_query = np.repeat(np.arange(n_block_queries), n_probe)
+            pair_slot = np.tile(np.arange(n_probe), n_block_queries) * cutoff
+
+            pair_sorting = np.argsort(probed_lists, kind="stable")
+            probed_lists = probed_lists[pair_sorting]
+            pair_query = pair_query[pair_sorting]
+            pair_slot = pair_slot[pair_sorting]
+
+            candidate_items = np.full((n_block_queries, n_probe * cutoff), -1, dtype=np.int32)
+            candidate_scores = np.full((n_block_queries, n_probe * cutoff), -np.inf, dtype=np.float32)
+
+            excluded_key = None
+
+            if excluded_items_csr is not None:
+                # Each (query, item) couple is encoded in a single key, sorted to allow a binary search
+                block_csr = excluded_items_csr[block_start:block_end]
+                block_row = np.repeat(np.arange(n_block_queries, dtype=np.int64), np.ediff1d(block_csr.indptr))
+                excluded_key = np.sort(block_row * self.n_items + block_csr.indices)
+
+                if len(excluded_key) == 0:
+                    excluded_key = None
+
+            list_id_array, pair_start_array = np.unique(probed_lists, return_index=True)
+            pair_end_array = np.append(pair_start_array[1:], len(probed_lists))
+
+            for list_id, pair_start, pair_end in zip(list_id_array, pair_start_array, pair_end_array):
+
+                list_start, list_end = self.list_indptr[list_id], self.list_indptr[list_id + 1]
+                list_items = self.list_items[list_start:list_end]
+
+                if len(list_items) == 0:
+                    continue
+
+                query_index = pair_query[pair_start:pair_end]
+                list_scores = block_queries[query_index].dot(self.list_vectors[list_start:list_end].T)
+
+                if excluded_items_mask is not None:
+                    list_scores[:, excluded_items_mask[list_items]] = -np.inf
+
+                if excluded_key is not None:
+                    list_key = query_index.astype(np.int64)[:, None] * self.n_items + list_items
+                    key_position = np.minimum(np.searchsorted(excluded_key, list_key), len(excluded_key) - 1)
+                    list_scores[excluded_key[key_position] == list_key] = -np.inf
+
+                list_cutoff = min(cutoff, len(list_items))
+                best = np.argpartition(-list_scores, list_cutoff - 1, axis=1)[:, :list_cutoff]
+
+                slot_column = pair_slot[pair_start:pair_end, None] + np.arange(list_cutoff)
+                candidate_items[query_index[:, None], slot_column] = list_items[best]
+                candidate_scores[query_index[:, None], slot_column] = np.take_along_axis(list_scores, best, axis=1)
+
+            block_cutoff = min(cutoff, candidate_items.shape[1])
+            best = np.argpartition(-candidate_scores, block_cutoff - 1, axis=1)[:, :block_cutoff]
+            best_scores = np.take_along_axis(candidate_scores, best, axis=1)
+
+            sorting = np.argsort(-best_scores, axis=1)
+            best_scores = np.take_along_axis(best_scores, sorting, axis=1)
+            best_items = np.take_along_axis(np.take_along_axis(candidate_items, best, axis=1), sorting, axis=1)
+
+            best_items[np.isneginf(best_scores)] = -1
+
+            ranking[block_start:block_end, :block_cutoff] = best_items
+            ranking_scores[block_start:block_end, :block_cutoff] = best_scores
+
+        return ranking, ranking_scores
+
+    def calibrate_n_probe(self, query_factors, ranking_exact, target_recall=0.95, excluded_items_csr=None):
+        """
+        Sets n_probe to the smallest value for which the search finds at least target_recall of the exact
+        top-cutoff items of the sample queries, or to n_lists if none does
+        :param query_factors:       array |n_queries|x|n_factors|, e.g., the factors of a sample of users
+        :param ranking_exact:       int array (n_queries, cutoff) of the exact top-cutoff items, -1 if missing
+        :param excluded_items_csr:  CSR matrix |n_queries|x|n_items|, as in search
+        :return:                    the new n_probe and the recall it reaches on the sample
+        """
+
+        cutoff = ranking_exact.shape[1]
+        recall_cache = {}
+
+        def get_recall(n_probe):
+            if n_probe not in recall_cache:
+                ranking, _ = self.search(query_factors, cutoff, n_probe=n_probe, excluded_items_csr=excluded_items_csr)
+                recall_cache[n_probe] = get_recall_at_cutoff(ranking_exact, ranking, self.n_items)
+
+            return recall_cache[n_probe]
+
+        # The recall grows with n_probe, binary search of the smallest n_probe reaching the target
+        n_probe_low, n_probe_high = 1, self.n_lists
+
+        while n_probe_low < n_probe_high:
+            n_probe = (n_probe_low + n_probe_high) // 2
+
+            if get_recall(n_probe) >= target_recall:
+                n_probe_high = n_probe
+            else:
+                n_probe_low = n_probe + 1
+
+        self.n_probe = n_probe_low
+
+        return self.n_probe, get_recall(self.n_probe)
@@ -12,7 +12,51 @@ from Utils.seconds_to_biggest_unit import seconds_to_biggest_unit
 from sklearn.utils.extmath import randomized_svd
 import scipy.sparse as sps
 import numpy as np
-import time
+import time, hashlib
+
+# (key, number of components, U, Sigma, QT) of the last decomposition computed with the cache
+_svd_cache = None
+
+
+def _get_svd_cache_key(URM, random_seed):
+
+    cache_key = hashlib.sha1()
+    for array in [URM.indptr, URM.indices, URM.data]:
+        cache_key.update(np.ascontiguousarray(array).view(np.uint8))
+
+    cache_key.update(repr((URM.shape, random_seed)).encode("utf-8"))
+
+    return cache_key.hexdigest()
+
+
+def compute_truncated_svd(URM, num_factors, random_seed=None, use_cache=False, cache_num_factors=None):
+    """
+    Computes the truncated SVD of URM with randomized_svd.
+    If use_cache is True the decomposition is computed with max(num_factors, cache_num_factors) components and kept,
+    keyed by URM and random_seed, the following calls with the same URM and seed and at most as many components
+    slice the cached one. The leading components of a larger randomized decomposition are as accurate
+    or more accurate than the ones computed with fewer components, but not identical.
+    Only the last decomposition is kept.
+    :return:    U, Sigma, QT with num_factors components
+    """
+
+    global _svd_cache
+
+    if not use_cache:
+        return randomized_svd(URM, n_components=num_factors, random_state=random_seed)
+
+    URM = sps.csr_matrix(URM)
+    cache_key = _get_svd_cache_key(URM, random_seed)
+
+    if _svd_cache is None or _svd_cache[0] != cache_key or _svd_cache[1] < num_factors:
+        n_components = max(num_factors, cache_num_factors if cache_num_factors is not None else 0)
+
+        U, Sigma, QT = randomized_svd(URM, n_components=n_components, random_state=random_seed)
+        _svd_cache = (cache_key, n_components, U, Sigma, QT)
+
+    _, _, U, Sigma, QT = _svd_cache
+
+    return U[:, :num_factors], Sigma[:num_factors], QT[:num_factors, :]
 
 
 class PureSVDRecommender(BaseMatrixFactorizationRecommender):
@@ -32,14 +76,20 @@ class PureSVDRecommender(BaseMatrixFactorizationRecommender):
     def __init__(self, URM_train, verbose=True):
         super(PureSVDRecommender, self).__init__(URM_train, verbose=verbose)
 
-    def fit(self, num_factors=28, random_seed=None):
+    def fit(self, num_factors=28, random_seed=None, use_svd_cache=False, svd_cache_num_factors=None):
+        """
+        :param use_svd_cache:           if True the decomposition is shared by the fits on the same data and random_seed,
+                                        see compute_truncated_svd
+        :param svd_cache_num_factors:   number of components of the cached decomposition, e.g., the largest
+                                        num_factors of a hyperparameter search
+        """
         start_time = time.time()
         self._print("Computing SVD decomposition...")
 
-        U, Sigma, QT = randomized_svd(self.URM_train,
-                                      n_components=num_factors,
-                                      # n_iter=5,
-                                      random_state=random_seed)
+        U, Sigma, QT = compute_truncated_svd(self.URM_train, num_factors,
+                                             random_seed=random_seed,
+                                             use_cache=use_svd_cache,
+                                             cache_num_factors=svd_cache_num_factors)
 
         U_s = U * sps.diags(Sigma)
 
@@ -116,13 +166,13 @@ class PureSVDItemRecommender(BaseItemSimilarityMatrixRecommender):
     def __init__(self, URM_train, verbose=True):
         super(PureSVDItemRecommender, self).__init__(URM_train, verbose=verbose)
 
-    def fit(self, num_factors=100, topK=None, random_seed=None):
+    def fit(self, num_factors=100, topK=None, random_seed=None, use_svd_cache=False, svd_cache_num_factors=None):
         self._print("Computing SVD decomposition...")
 
-        U, Sigma, QT = randomized_svd(self.URM_train,
-                                      n_components=num_factors,
-                                      # n_iter=5,
-                                      random_state=random_seed)
+        U, Sigma, QT = compute_truncated_svd(self.URM_train, num_factors,
+                                             random_seed=random_seed,
+                                             use_cache=use_svd_cache,
+                                             cache_num_factors=svd_cache_num_factors)
 
         if topK is None:
             topK = self.n_items
@@ -142,7 +192,8 @@ class ScaledPureSVDRecommender(PureSVDRecommender):
     def __init__(self, URM_train, verbose=True):
         super(ScaledPureSVDRecommender, self).__init__(URM_train, verbose=verbose)
 
-    def fit(self, num_factors=100, random_seed=None, scaling_items=1.0, scaling_users=1.0):
+    def fit(self, num_factors=100, random_seed=None, scaling_items=1.0, scaling_users=1.0,
+            use_svd_cache=False, svd_cache_num_factors=None):
         item_pop = np.ediff1d(sps.csc_matrix(self.URM_train).indptr)
         scaling_matrix = sps.diags(np.power(item_pop, scaling_items - 1))
 
@@ -153,4 +204,7 @@ class ScaledPureSVDRecommender(PureSVDRecommender):
 
         self.URM_train = scaling_matrix * self.URM_train
 
-        super(ScaledPureSVDRecommender, self).fit(num_factors=num_factors, random_seed=random_seed)
+        # The cache is keyed by the scaled URM, so each scaling pair has its own decomposition
+        super(ScaledPureSVDRecommender, self).fit(num_factors=num_factors, random_seed=random_seed,
+                                                  use_svd_cache=use_svd_cache,
+                                                  svd_cache_num_factors=svd_cache_num_factors)
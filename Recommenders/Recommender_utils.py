@@ -10,6 +10,8 @@ import scipy.sparse as sps
 import time
 import os
 
+from Utils.IncrementalSparseMatrix import IncrementalSparseMatrix_Blocks, sparse_matrix_to_format_on_disk
+
 def check_matrix(X, format='csc', dtype=np.float32):
     """
     This function takes a matrix as input and transforms it into the specified format.
@@ -52,16 +54,23 @@ def check_matrix(X, format='csc', dtype=np.float32):
         return X.astype(dtype)
 
 
-def similarityMatrixTopK(item_weights, k=100, verbose = False):
+def similarityMatrixTopK(item_weights, k=100, verbose = False, block_size = None, disk_folder_path = None, memory_budget_MB = 1024):
     """
-    The function selects the TopK most similar elements, column-wise
+    The function selects the TopK most similar elements, column-wise.
+    Only nonzero values are kept, within each column the values are stored in increasing order.
+
+    The selection is vectorized over blocks of columns with argpartition, the nonzero values of the columns
+    of a sparse matrix are first placed in a dense block padded with -inf.
 
-    :param item_weights:
-    :param forceSparseOutput:
+    :param item_weights:    square matrix, either dense or sparse
     :param k:
     :param verbose:
-    :param inplace: Default True, WARNING matrix will be modified
-    :return:
+    :param block_size:      number of columns processed at once, by default blocks have about 10M cells
+    :param disk_folder_path:    if not None and item_weights is sparse the result is written in this folder and
+                                memory-mapped, see IncrementalSparseMatrix_Blocks. A CSR item_weights is first
+                                converted to CSC on disk, in the subfolder "input"
+    :param memory_budget_MB:    memory used to buffer the selected values and to convert the format on disk
+    :return:                csc_matrix float32
     """
 
     assert (item_weights.shape[0] == item_weights.shape[1]), "selectTopK: ItemWeights is not a square matrix"
@@ -77,49 +86,128 @@ def similarityMatrixTopK(item_weights, k=100, verbose = False):
     # for each column, keep only the top-k scored items
     sparse_weights = not isinstance(item_weights, np.ndarray)
 
-    # iterate over each column and keep only the top-k similar items
-    data, rows_indices, cols_indptr = [], [], []
-
     if sparse_weights:
-        item_weights = check_matrix(item_weights, format='csc', dtype=np.float32)
+        W_sparse = _similarityMatrixTopK_sparse(item_weights, k, block_size, disk_folder_path, memory_budget_MB)
     else:
-        column_row_index = np.arange(nitems, dtype=np.int32)
+        data, rows_indices, cols_indptr = _similarityMatrixTopK_dense(item_weights, k, block_size)
+
+        # During testing CSR is faster
+        W_sparse = sps.csc_matrix((data, rows_indices, cols_indptr), shape=(nitems, nitems), dtype=np.float32)
+
+    if verbose:
+        print("Sparse TopK matrix generated in {:.2f} seconds".format(time.time() - start_time))
+
+    return W_sparse
+
+
+def _similarityMatrixTopK_sparse(item_weights, k, block_size, disk_folder_path, memory_budget_MB):
+
+    if disk_folder_path is not None and item_weights.format == "csr":
+        item_weights = sparse_matrix_to_format_on_disk(item_weights, "csc", os.path.join(disk_folder_path, "input"),
+                                                       memory_budget_MB=memory_budget_MB)
+
+    # The values are only read, a CSC float32 matrix is used as is
+    if not (item_weights.format == "csc" and item_weights.dtype == np.float32):
+        item_weights = check_matrix(item_weights, format='csc', dtype=np.float32)
+
+    nitems = item_weights.shape[1]
+
+    column_nnz = np.ediff1d(item_weights.indptr)
 
+    if block_size is None:
+        block_size = max(1, int(1e7 // max(1, column_nnz.max(initial=1))))
 
+    W_sparse_builder = IncrementalSparseMatrix_Blocks(nitems, nitems, format="csc", dtype=np.float32,
+                                                      folder_path=disk_folder_path, memory_budget_MB=memory_budget_MB)
 
-    for item_idx in range(nitems):
+    for start_col in range(0, nitems, block_size):
 
-        cols_indptr.append(len(data))
+        end_col = min(start_col + block_size, nitems)
 
-        if sparse_weights:
-            start_position = item_weights.indptr[item_idx]
-            end_position = item_weights.indptr[item_idx+1]
+        start_position = item_weights.indptr[start_col]
+        end_position = item_weights.indptr[end_col]
 
-            column_data = item_weights.data[start_position:end_position]
-            column_row_index = item_weights.indices[start_position:end_position]
+        block_nnz = column_nnz[start_col:end_col]
+        block_width = block_nnz.max(initial=0)
+        block_k = min(k, block_width)
 
+        # Place each column in a row of a dense array padded with -inf, zeros are never selected
+        block_row = np.repeat(np.arange(end_col - start_col), block_nnz)
+        block_col = np.arange(end_position - start_position) - np.repeat(item_weights.indptr[start_col:end_col] - start_position, block_nnz)
+
+        block_data = item_weights.data[start_position:end_position]
+
+        block_key = np.full((end_col - start_col, block_width), -np.inf, dtype=np.float32)
+        block_key[block_row, block_col] = np.where(block_data != 0, block_data, -np.inf)
+
+        if block_k == 0:
+            top_k_idx = np.zeros((end_col - start_col, 0), dtype=np.int64)
+        elif block_k < block_width:
+            top_k_idx = np.argpartition(block_key, block_width - block_k, axis=1)[:, block_width - block_k:]
         else:
-            column_data = item_weights[:,item_idx]
+            top_k_idx = np.tile(np.arange(block_width), (end_col - start_col, 1))
 
+        top_k_key = np.take_along_axis(block_key, top_k_idx, axis=1)
 
-        non_zero_data = column_data!=0
+        # Sort the selected values of each column in increasing order
+        top_k_sorting = np.argsort(top_k_key, axis=1, kind="stable")
+        top_k_idx = np.take_along_axis(top_k_idx, top_k_sorting, axis=1)
+        top_k_key = np.take_along_axis(top_k_key, top_k_sorting, axis=1)
 
-        idx_sorted = np.argsort(column_data[non_zero_data])  # sort by column
-        top_k_idx = idx_sorted[-k:]
+        selected_mask = top_k_key != -np.inf
+        selected_position = (top_k_idx + (item_weights.indptr[start_col:end_col] - start_position)[:, None])[selected_mask]
 
-        data.extend(column_data[non_zero_data][top_k_idx])
-        rows_indices.extend(column_row_index[non_zero_data][top_k_idx])
+        W_sparse_builder.add_block(selected_mask.sum(axis=1),
+                                   item_weights.indices[start_position:end_position][selected_position],
+                                   block_data[selected_position])
 
+    return W_sparse_builder.get_SparseMatrix()
 
-    cols_indptr.append(len(data))
 
-    # During testing CSR is faster
-    W_sparse = sps.csc_matrix((data, rows_indices, cols_indptr), shape=(nitems, nitems), dtype=np.float32)
+def _similarityMatrixTopK_dense(item_weights, k, block_size):
 
-    if verbose:
-        print("Sparse TopK matrix generated in {:.2f} seconds".format(time.time() - start_time))
+    nitems = item_weights.shape[1]
 
-    return W_sparse
+    if block_size is None:
+        block_size = max(1, int(1e7 // max(1, nitems)))
+
+    # Preallocate the maximum number of cells, zeros are removed at the end
+    data = np.zeros(nitems * k, dtype=np.float32)
+    rows_indices = np.zeros(nitems * k, dtype=np.int32)
+    selected_mask = np.zeros(nitems * k, dtype=np.bool_)
+
+    for start_col in range(0, nitems, block_size):
+
+        end_col = min(start_col + block_size, nitems)
+
+        block = np.asarray(item_weights[:, start_col:end_col])
+
+        # Zeros are never selected, they are ranked after any nonzero value
+        block_key = np.where(block != 0, block, -np.inf)
+
+        if k == 0:
+            top_k_idx = np.zeros((0, end_col - start_col), dtype=np.int64)
+        elif k < nitems:
+            top_k_idx = np.argpartition(block_key, nitems - k, axis=0)[nitems - k:, :]
+        else:
+            top_k_idx = np.tile(np.arange(nitems)[:, None], (1, end_col - start_col))
+
+        top_k_key = np.take_along_axis(block_key, top_k_idx, axis=0)
+
+        # Sort the selected values of each column in increasing order
+        top_k_sorting = np.argsort(top_k_key, axis=0, kind="stable")
+        top_k_idx = np.take_along_axis(top_k_idx, top_k_sorting, axis=0)
+        top_k_values = np.take_along_axis(block, top_k_idx, axis=0)
+
+        # Cells are stored column by column
+        data[start_col * k:end_col * k] = top_k_values.T.ravel()
+        rows_indices[start_col * k:end_col * k] = top_k_idx.T.ravel()
+        selected_mask[start_col * k:end_col * k] = top_k_values.T.ravel() != 0
+
+    cols_indptr = np.zeros(nitems + 1, dtype=np.int32)
+    cols_indptr[1:] = np.cumsum(selected_mask.reshape(nitems, k).sum(axis=1))
+
+    return data[selected_mask], rows_indices[selected_mask], cols_indptr
 
 
 
@@ -0,0 +1,231 @@
+#cython: boundscheck=False
+#cython: wraparound=False
+#cython: initializedcheck=False
+#cython: language_level=3
+#cython: nonecheck=False
+#cython: cdivision=True
+#cython: overflowcheck=False
+
+"""
+Created on 18/10/26
+"""
+
+import numpy as np
+cimport numpy as np
+import scipy.sparse as sps
+import time, sys
+
+from libc.math cimport fabs
+
+from Recommenders.Recommender_utils import check_matrix
+from Utils.seconds_to_biggest_unit import seconds_to_biggest_unit
+
+
+cdef inline double _soft_threshold(double value, double threshold) nogil:
+
+    if value > threshold:
+        return value - threshold
+    elif value < -threshold:
+        return value + threshold
+
+    return 0.0
+
+
+
+def slim_elastic_net_gram(G_sparse, gram_diagonal, double l1_penalty, double l2_penalty, bint positive_only,
+                          int topK, int max_iter, double tol, W_init = None, verbose = True, print_prefix = ""):
+    """
+    Fits the SLIM ElasticNet model of every item column by coordinate descent on the item-item Gram matrix G = X^T X,
+    the objective of column j is
+
+        0.5 * ||X[:,j] - X w||^2 + l1_penalty * ||w||_1 + 0.5 * l2_penalty * ||w||^2,   with w[j] = 0
+
+    which is the sklearn ElasticNet objective multiplied by the number of rows of X.
+    The data is never modified, the constraint w[j] = 0 is enforced by never updating coordinate j.
+    Only the coordinates that can become nonzero are visited, i.e., the items co-occurring with j and the ones
+    whose gradient has been changed by a previous update.
+
+    :param G_sparse:        sparse matrix |items|x|items|, the Gram matrix without its diagonal
+    :param gram_diagonal:   array |items|, the diagonal of the Gram matrix
+    :param W_init:          sparse matrix |items|x|items| used as a warm start, column j is the starting point of item j
+    :return:                rows, cols, values of the topK coefficients of each column
+    """
+
+    G_sparse = check_matrix(G_sparse, 'csc', dtype=np.float64)
+
+    cdef int n_items = G_sparse.shape[0]
+
+    cdef int[:] G_indptr = G_sparse.indptr.astype(np.int32)
+    cdef int[:] G_indices = G_sparse.indices.astype(np.int32)
+    cdef double[:] G_data = G_sparse.data
+    cdef double[:] G_diagonal = np.asarray(gram_diagonal, dtype=np.float64)
+
+    cdef int[:] W_init_indptr, W_init_indices
+    cdef double[:] W_init_data
+    cdef bint use_warm_start = W_init is not None
+
+    if use_warm_start:
+        W_init = check_matrix(W_init, 'csc', dtype=np.float64)
+        W_init_indptr = W_init.indptr.astype(np.int32)
+        W_init_indices = W_init.indices.astype(np.int32)
+        W_init_data = W_init.data
+
+    # Dense working arrays, only the cells of the candidate list are reset after each column
+    cdef double[:] coef = np.zeros(n_items, dtype=np.float64)
+    cdef double[:] gram_coef = np.zeros(n_items, dtype=np.float64)
+    cdef double[:] target_gram = np.zeros(n_items, dtype=np.float64)
+    cdef int[:] candidate_mask = np.zeros(n_items, dtype=np.int32)
+    cdef int[:] candidate_list = np.zeros(n_items, dtype=np.int32)
+
+    cdef np.ndarray[np.int32_t, ndim=1] column_rows = np.zeros(n_items, dtype=np.int32)
+    cdef np.ndarray[np.float64_t, ndim=1] column_values = np.zeros(n_items, dtype=np.float64)
+
+    rows_list, cols_list, values_list = [], [], []
+
+    cdef int current_item, item_index, item_id, inner_index, inner_item_id, n_candidates, n_iter, n_nonzero, local_topK
+    cdef double new_coef, delta, max_delta, max_coef
+
+    start_time = time.time()
+    start_time_printBatch = start_time
+
+    for current_item in range(n_items):
+
+        with nogil:
+
+            n_candidates = 0
+
+            # The items co-occurring with the target are the initial candidates, target_gram is X^T X[:,j]
+            for inner_index in range(G_indptr[current_item], G_indptr[current_item + 1]):
+                item_id = G_indices[inner_index]
+                target_gram[item_id] = G_data[inner_index]
+
+                if not candidate_mask[item_id] and item_id != current_item:
+                    candidate_mask[item_id] = True
+                    candidate_list[n_candidates] = item_id
+                    n_candidates += 1
+
+            if use_warm_start:
+                for inner_index in range(W_init_indptr[current_item], W_init_indptr[current_item + 1]):
+                    item_id = W_init_indices[inner_index]
+
+                    if item_id == current_item or (positive_only and W_init_data[inner_index] < 0.0):
+                        continue
+
+                    coef[item_id] = W_init_data[inner_index]
+
+                    if not candidate_mask[item_id]:
+                        candidate_mask[item_id] = True
+                        candidate_list[n_candidates] = item_id
+                        n_candidates += 1
+
+                    for item_index in range(G_indptr[item_id], G_indptr[item_id + 1]):
+                        inner_item_id = G_indices[item_index]
+                        gram_coef[inner_item_id] += G_data[item_index] * coef[item_id]
+
+                        if not candidate_mask[inner_item_id] and inner_item_id != current_item:
+                            candidate_mask[inner_item_id] = True
+                            candidate_list[n_candidates] = inner_item_id
+                            n_candidates += 1
+
+
+            for n_iter in range(max_iter):
+
+                max_delta = 0.0
+                max_coef = 0.0
+
+                # The candidate list may grow while it is visited
+                item_index = 0
+
+                while item_index < n_candidates:
+
+                    item_id = candidate_list[item_index]
+                    item_index += 1
+
+                    if G_diagonal[item_id] + l2_penalty <= 0.0:
+                        continue
+
+                    # gram_coef does not contain the diagonal, so it is already the partial residual of item_id
+                    new_coef = _soft_threshold(target_gram[item_id] - gram_coef[item_id], l1_penalty) / (G_diagonal[item_id] + l2_penalty)
+
+                    if positive_only and new_coef < 0.0:
+                        new_coef = 0.0
+
+                    delta = new_coef - coef[item_id]
+
+                    if delta != 0.0:
+                        coef[item_id] = new_coef
+
+                        for inner_index in range(G_indptr[item_id], G_indptr[item_id + 1]):
+                            inner_item_id = G_indices[inner_index]
+                            gram_coef[inner_item_id] += G_data[inner_index] * delta
+
+                            if not candidate_mask[inner_item_id] and inner_item_id != current_item:
+                                candidate_mask[inner_item_id] = True
+                                candidate_list[n_candidates] = inner_item_id
+                                n_candidates += 1
+
+                    if fabs(delta) > max_delta:
+                        max_delta = fabs(delta)
+
+                    if fabs(new_coef) > max_coef:
+                        max_coef = fabs(new_coef)
+
+                if max_coef == 0.0 or max_delta <= tol * max_coef:
+                    break
+
+
+            # Collect the nonzero coefficients and clean the data structures for the next column
+            n_nonzero = 0
+
+            for item_index in range(n_candidates):
+                item_id = candidate_list[item_index]
+
+                if coef[item_id] != 0.0:
+                    column_rows[n_nonzero] = item_id
+                    column_values[n_nonzero] = coef[item_id]
+                    n_nonzero += 1
+
+                coef[item_id] = 0.0
+                gram_coef[item_id] = 0.0
+                candidate_mask[item_id] = False
+
+            # gram_coef may have been modified on the target too, target_gram on its co-occurring items
+            gram_coef[current_item] = 0.0
+
+            for inner_index in range(G_indptr[current_item], G_indptr[current_item + 1]):
+                target_gram[G_indices[inner_index]] = 0.0
+
+
+        local_topK = min(n_nonzero, topK)
+
+        if local_topK > 0:
+            relevant_items_partition = (-column_values[:n_nonzero]).argpartition(local_topK - 1)[0:local_topK]
+            relevant_items_partition_sorting = np.argsort(-column_values[relevant_items_partition])
+            ranking = relevant_items_partition[relevant_items_partition_sorting]
+
+            rows_list.append(column_rows[ranking].copy())
+            cols_list.append(np.full(local_topK, current_item, dtype=np.int32))
+            values_list.append(column_values[ranking].astype(np.float32))
+
+        if verbose and (time.time() - start_time_printBatch > 300 or current_item == n_items - 1):
+            elapsed_time = time.time() - start_time
+            new_time_value, new_time_unit = seconds_to_biggest_unit(elapsed_time)
+
+            print("{}Processed {} ({:4.1f}%) in {:.2f} {}. Items per second: {:.2f}".format(
+                print_prefix,
+                current_item + 1,
+                100.0 * float(current_item + 1) / n_items,
+                new_time_value,
+                new_time_unit,
+                float(current_item + 1) / elapsed_time))
+
+            sys.stdout.flush()
+            sys.stderr.flush()
+
+            start_time_printBatch = time.time()
+
+
+    if len(rows_list) == 0:
+        return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)
+
+    return np.concatenate(rows_list), np.concatenate(cols_list), np.concatenate(values_list)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 18/10/26
+"""
+
+import numpy as np
+import scipy.sparse as sps
+from Recommenders.Recommender_utils import check_matrix
+from Recommenders.BaseSimilarityMatrixRecommender import BaseItemSimilarityMatrixRecommender
+
+
+class SLIMElasticNetGramRecommender(BaseItemSimilarityMatrixRecommender):
+    """
+    SLIM ElasticNet trained with a dedicated coordinate descent solver which works on the item-item Gram matrix.
+
+    SLIMElasticNetRecommender calls sklearn ElasticNet once per item and every call builds again X^T X, here the
+    Gram matrix is computed once and each column only visits the items that can have a nonzero coefficient.
+    The hyperparameters have the same meaning as in SLIMElasticNetRecommender, the stopping criterion is the
+    maximum coordinate update relative to the largest coefficient rather than sklearn's duality gap.
+
+    If warm_start is True the model of the previous call to fit, e.g., with a different alpha, is used as the
+    starting point of the coordinate descent.
+
+    The Gram matrix is kept for the following calls to fit and computed again when URM_train is replaced.
+    """
+
+    RECOMMENDER_NAME = "SLIMElasticNetGramRecommender"
+
+    def __init__(self, URM_train, verbose=True):
+        super(SLIMElasticNetGramRecommender, self).__init__(URM_train, verbose=verbose)
+
+        self._gram_offdiagonal = None
+        self._gram_diagonal = None
+        self._gram_URM_train = None
+
+    def set_URM_train(self, URM_train_new, **kwargs):
+
+        super(SLIMElasticNetGramRecommender, self).set_URM_train(URM_train_new, **kwargs)
+
+        self._gram_offdiagonal = None
+        self._gram_diagonal = None
+        self._gram_URM_train = None
+
+    def _compute_gram(self):
+
+        URM_train = check_matrix(self.URM_train, 'csc', dtype=np.float64)
+
+        gram = check_matrix(URM_train.T.dot(URM_train), 'csc', dtype=np.float64)
+
+        self._gram_diagonal = gram.diagonal().copy()
+
+        gram.setdiag(0.0)
+        gram.eliminate_zeros()
+
+        self._gram_offdiagonal = gram
+        self._gram_URM_train = self.URM_train
+
+    def fit(self, l1_ratio=0.00029920499017254754, alpha=0.10734084960757517, positive_only=False, topK=453,
+            max_iter=200, tol=5e-5, warm_start=False):
+
+        assert 0 <= l1_ratio <= 1, "{}: l1_ratio must be between 0 and 1, provided value was {}".format(
+            self.RECOMMENDER_NAME, l1_ratio)
+
+        # Import compiled module
+        from Recommenders.SLIM.Cython.SLIM_ElasticNet_Gram_Cython import slim_elastic_net_gram
+
+        self.l1_ratio = l1_ratio
+        self.positive_only = positive_only
+        self.topK = topK
+
+        # URM_train may also have been assigned directly rather than with set_URM_train
+        if self._gram_offdiagonal is None or self._gram_URM_train is not self.URM_train:
+            self._compute_gram()
+
+        # sklearn ElasticNet divides the squared loss by the number of samples, the penalties are scaled accordingly
+        n_samples = self.URM_train.shape[0]
+
+        W_init = self.W_sparse if warm_start and hasattr(self, "W_sparse") else None
+
+        rows, cols, values = slim_elastic_net_gram(self._gram_offdiagonal, self._gram_diagonal,
+                                                   n_samples * alpha * self.l1_ratio,
+                                                   n_samples * alpha * (1.0 - self.l1_ratio),
+                                                   self.positive_only, self.topK, max_iter, tol,
+                                                   W_init=W_init,
+                                                   verbose=self.verbose,
+                                                   print_prefix="{}: ".format(self.RECOMMENDER_NAME))
+
+        # generate the sparse weight matrix
+        self.W_sparse = sps.csr_matrix((values, (rows, cols)), shape=(self.n_items, self.n_items), dtype=np.float32)
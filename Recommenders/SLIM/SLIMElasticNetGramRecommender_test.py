@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 18/10/26
+"""
+
+import unittest
+
+import numpy as np
+import scipy.sparse as sps
+
+from Recommenders.SLIM.SLIMElasticNetGramRecommender import SLIMElasticNetGramRecommender
+
+
+def get_URM(n_users=300, n_items=100, density=0.05, random_seed=42):
+
+    URM = sps.random(n_users, n_items, density=density, format="csr", dtype=np.float32,
+                     random_state=np.random.RandomState(random_seed))
+    URM.data = np.ones_like(URM.data)
+
+    return URM
+
+
+def fit(recommender):
+
+    recommender.fit(l1_ratio=0.1, alpha=1e-3, topK=50)
+
+    return recommender.W_sparse.toarray()
+
+
+class MyTestCase(unittest.TestCase):
+
+    def test_gram_computed_again_for_new_URM_train(self):
+
+        URM_1, URM_2 = get_URM(random_seed=0), get_URM(random_seed=1)
+
+        W_1 = fit(SLIMElasticNetGramRecommender(URM_1, verbose=False))
+        W_2 = fit(SLIMElasticNetGramRecommender(URM_2, verbose=False))
+
+        recommender = SLIMElasticNetGramRecommender(URM_1, verbose=False)
+        self.assertTrue(np.allclose(fit(recommender), W_1))
+
+        recommender.set_URM_train(URM_2)
+        self.assertTrue(np.allclose(fit(recommender), W_2))
+
+        # The Gram matrix is reused while URM_train does not change
+        gram_offdiagonal = recommender._gram_offdiagonal
+        self.assertTrue(np.allclose(fit(recommender), W_2))
+        self.assertIs(recommender._gram_offdiagonal, gram_offdiagonal)
+
+        recommender.URM_train = URM_1.copy()
+        self.assertTrue(np.allclose(fit(recommender), W_1))
+
+
+
+if __name__ == '__main__':
+
+    unittest.main()
@@ -16,6 +16,63 @@ from sklearn.utils._testing import ignore_warnings
 from sklearn.exceptions import ConvergenceWarning
 
 
+def _build_elastic_net(alpha, l1_ratio, positive_only, max_iter, tol):
+
+    return ElasticNet(alpha=alpha,
+                      l1_ratio=l1_ratio,
+                      positive=positive_only,
+                      fit_intercept=False,
+                      copy_X=False,
+                      precompute=True,
+                      selection='random',
+                      max_iter=max_iter,
+                      tol=tol,
+                      random_state=0)
+
+
+def _fit_item_elastic_net(model, URM_train, currentItem, topK):
+    """
+    Fits the ElasticNet model of one item column, URM_train is a CSC matrix whose data is temporarily modified
+    :return: row indices and values of the topK coefficients, sorted by decreasing value
+    """
+
+    # get the target column
+    y = URM_train[:, currentItem].toarray()
+
+    # set the j-th column of X to zero
+    start_pos = URM_train.indptr[currentItem]
+    end_pos = URM_train.indptr[currentItem + 1]
+
+    current_item_data_backup = URM_train.data[start_pos: end_pos].copy()
+    URM_train.data[start_pos: end_pos] = 0.0
+
+    # fit one ElasticNet model per column
+    model.fit(URM_train, y)
+
+    # finally, replace the original values of the j-th column
+    URM_train.data[start_pos:end_pos] = current_item_data_backup
+
+    # model.coef_ contains the coefficient of the ElasticNet model
+    # let's keep only the non-zero values
+
+    # Select topK values
+    # Sorting is done in three steps. Faster then plain np.argsort for higher number of items
+    # - Partition the data to extract the set of relevant items
+    # - Sort only the relevant items
+    # - Get the original item index
+
+    nonzero_model_coef_index = model.sparse_coef_.indices
+    nonzero_model_coef_value = model.sparse_coef_.data
+
+    local_topK = min(len(nonzero_model_coef_value) - 1, topK)
+
+    relevant_items_partition = (-nonzero_model_coef_value).argpartition(local_topK)[0:local_topK]
+    relevant_items_partition_sorting = np.argsort(-nonzero_model_coef_value[relevant_items_partition])
+    ranking = relevant_items_partition[relevant_items_partition_sorting]
+
+    return nonzero_model_coef_index[ranking], nonzero_model_coef_value[ranking]
+
+
 # os.environ["PYTHONWARNINGS"] = ('ignore::exceptions.ConvergenceWarning:sklearn.linear_model')
 # os.environ["PYTHONWARNINGS"] = ('ignore:Objective did not converge:ConvergenceWarning:')
 
@@ -51,16 +108,7 @@ class SLIMElasticNetRecommender(BaseItemSimilarityMatrixRecommender):
         self.topK = topK
 
         # initialize the ElasticNet model
-        self.model = ElasticNet(alpha=alpha,
-                                l1_ratio=self.l1_ratio,
-                                positive=self.positive_only,
-                                fit_intercept=False,
-                                copy_X=False,
-                                precompute=True,
-                                selection='random',
-                                max_iter=max_iter,
-                                tol=tol,
-                                random_state=0)
+        self.model = _build_elastic_net(alpha, self.l1_ratio, self.positive_only, max_iter, tol)
 
         URM_train = check_matrix(self.URM_train, 'csc', dtype=np.float32)
 
@@ -81,53 +129,21 @@ class SLIMElasticNetRecommender(BaseItemSimilarityMatrixRecommender):
         # fit each item's factors sequentially (not in parallel)
         for currentItem in range(n_items):
 
-            # get the target column
-            y = URM_train[:, currentItem].toarray()
-
-            # set the j-th column of X to zero
-            start_pos = URM_train.indptr[currentItem]
-            end_pos = URM_train.indptr[currentItem + 1]
-
-            current_item_data_backup = URM_train.data[start_pos: end_pos].copy()
-            URM_train.data[start_pos: end_pos] = 0.0
-
-            # fit one ElasticNet model per column
-            self.model.fit(URM_train, y)
+            ranking_rows, ranking_values = _fit_item_elastic_net(self.model, URM_train, currentItem, self.topK)
 
-            # self.model.coef_ contains the coefficient of the ElasticNet model
-            # let's keep only the non-zero values
-
-            # Select topK values
-            # Sorting is done in three steps. Faster then plain np.argsort for higher number of items
-            # - Partition the data to extract the set of relevant items
-            # - Sort only the relevant items
-            # - Get the original item index
-
-            nonzero_model_coef_index = self.model.sparse_coef_.indices
-            nonzero_model_coef_value = self.model.sparse_coef_.data
-
-            local_topK = min(len(nonzero_model_coef_value) - 1, self.topK)
-
-            relevant_items_partition = (-nonzero_model_coef_value).argpartition(local_topK)[0:local_topK]
-            relevant_items_partition_sorting = np.argsort(-nonzero_model_coef_value[relevant_items_partition])
-            ranking = relevant_items_partition[relevant_items_partition_sorting]
-
-            for index in range(len(ranking)):
+            for index in range(len(ranking_rows)):
 
                 if numCells == len(rows):
                     rows = np.concatenate((rows, np.zeros(dataBlock, dtype=np.int32)))
                     cols = np.concatenate((cols, np.zeros(dataBlock, dtype=np.int32)))
                     values = np.concatenate((values, np.zeros(dataBlock, dtype=np.float32)))
 
-                rows[numCells] = nonzero_model_coef_index[ranking[index]]
+                rows[numCells] = ranking_rows[index]
                 cols[numCells] = currentItem
-                values[numCells] = nonzero_model_coef_value[ranking[index]]
+                values[numCells] = ranking_values[index]
 
                 numCells += 1
 
-            # finally, replace the original values of the j-th column
-            URM_train.data[start_pos:end_pos] = current_item_data_backup
-
             elapsed_time = time.time() - start_time
             new_time_value, new_time_unit = seconds_to_biggest_unit(elapsed_time)
 
@@ -149,132 +165,150 @@ class SLIMElasticNetRecommender(BaseItemSimilarityMatrixRecommender):
                                        shape=(n_items, n_items), dtype=np.float32)
 
 
-'''
+
 from multiprocessing import Pool, cpu_count, shared_memory
 from functools import partial
+import os
+
+
+# Shared memory segments and model of the worker process, set once by _init_worker
+_worker_shm_list = None
+_worker_URM_train = None
+_worker_model = None
 
 
 def create_shared_memory(a):
-    shm = shared_memory.SharedMemory(create=True, size=a.nbytes)
+    shm = shared_memory.SharedMemory(create=True, size=max(a.nbytes, 1))
     b = np.ndarray(a.shape, dtype=a.dtype, buffer=shm.buf)
     b[:] = a[:]
     return shm
 
 
-@ignore_warnings(category=ConvergenceWarning)
-def _partial_fit(items, topK, alpha, l1_ratio, urm_shape, positive_only=True, shm_names=None, shm_shapes=None, shm_dtypes=None):
-
-    model = ElasticNet(
-        alpha=alpha,
-        l1_ratio=l1_ratio,
-        positive=positive_only,
-        fit_intercept=False,
-        copy_X=False,
-        precompute=True,
-        selection='random',
-        max_iter=100,
-        tol=1e-4
-    )
-
-    indptr_shm = shared_memory.SharedMemory(name=shm_names[0], create=False)
-    indices_shm = shared_memory.SharedMemory(name=shm_names[1], create=False)
-    data_shm = shared_memory.SharedMemory(name=shm_names[2], create=False)
-
-    X_j = sps.csc_matrix((
-            np.ndarray(shm_shapes[2], dtype=shm_dtypes[2], buffer=data_shm.buf).copy(),
-            np.ndarray(shm_shapes[1], dtype=shm_dtypes[1], buffer=indices_shm.buf),
-            np.ndarray(shm_shapes[0], dtype=shm_dtypes[0], buffer=indptr_shm.buf),
-        ), shape=urm_shape)
-
-    values, rows, cols = [], [], []
+def _init_worker(urm_shape, shm_names, shm_shapes, shm_dtypes, alpha, l1_ratio, positive_only, max_iter, tol):
 
-    for currentItem in items:
+    global _worker_shm_list, _worker_URM_train, _worker_model
 
-        y = X_j[:, currentItem].toarray()
+    _worker_shm_list = [shared_memory.SharedMemory(name=shm_name, create=False) for shm_name in shm_names]
 
-        backup = X_j.data[X_j.indptr[currentItem]:X_j.indptr[currentItem + 1]]
-        X_j.data[X_j.indptr[currentItem]:X_j.indptr[currentItem + 1]] = 0.0
+    indptr, indices, data = [np.ndarray(shm_shape, dtype=shm_dtype, buffer=shm.buf)
+                             for shm, shm_shape, shm_dtype in zip(_worker_shm_list, shm_shapes, shm_dtypes)]
 
-        model.fit(X_j, y)
+    # indptr and indices are only read and stay in shared memory, the data is copied because
+    # the column of the current item is set to zero during the fit
+    _worker_URM_train = sps.csc_matrix((data.copy(), indices, indptr), shape=urm_shape)
+    _worker_model = _build_elastic_net(alpha, l1_ratio, positive_only, max_iter, tol)
 
-        nonzero_model_coef_index = model.sparse_coef_.indices
-        nonzero_model_coef_value = model.sparse_coef_.data
 
-        local_topK = min(len(nonzero_model_coef_value) - 1, topK)
-
-        relevant_items_partition = (-nonzero_model_coef_value).argpartition(local_topK)[:local_topK]
-        relevant_items_partition_sorting = np.argsort(-nonzero_model_coef_value[relevant_items_partition])
-        ranking = relevant_items_partition[relevant_items_partition_sorting]
+@ignore_warnings(category=ConvergenceWarning)
+def _partial_fit(items, topK):
 
-        values.extend(nonzero_model_coef_value[ranking])
-        rows.extend(nonzero_model_coef_index[ranking])
-        cols.extend([currentItem] * len(ranking))
+    start_time = time.time()
 
-        X_j.data[X_j.indptr[currentItem]:X_j.indptr[currentItem + 1]] = backup
+    rows, values = [], []
 
-    indptr_shm.close()
-    indices_shm.close()
-    data_shm.close()
+    for currentItem in items:
+        ranking_rows, ranking_values = _fit_item_elastic_net(_worker_model, _worker_URM_train, currentItem, topK)
+        rows.append(ranking_rows.astype(np.int32))
+        values.append(ranking_values.astype(np.float32))
 
-    return values, rows, cols
+    cols = np.repeat(np.asarray(items, dtype=np.int32), [len(item_rows) for item_rows in rows])
 
+    rows = np.concatenate(rows) if len(rows) > 0 else np.zeros(0, dtype=np.int32)
+    values = np.concatenate(values) if len(values) > 0 else np.zeros(0, dtype=np.float32)
 
+    return rows, cols, values, os.getpid(), len(items), time.time() - start_time
 
 
 class MultiThreadSLIM_SLIMElasticNetRecommender(SLIMElasticNetRecommender):
+    """
+    Parallel version of SLIMElasticNetRecommender, the item columns are split in chunks fitted by a pool of processes.
+    The CSC URM_train is placed in shared memory, each worker copies only the data array, which it needs to modify.
+    Every item is fitted with the same deterministic ElasticNet model of the sequential version, therefore W_sparse
+    is identical to the one of SLIMElasticNetRecommender.
+    """
 
-    def fit(self, alpha=1.0, l1_ratio=0.1, positive_only=True, topK=100,
-            verbose=True, workers=int(cpu_count()*0.3)):
+    RECOMMENDER_NAME = "MultiThreadSLIM_SLIMElasticNetRecommender"
 
-        assert l1_ratio>= 0 and l1_ratio<=1, \
-            "ElasticNet: l1_ratio must be between 0 and 1, provided value was {}".format(l1_ratio)
+    @ignore_warnings(category=ConvergenceWarning)
+    def fit(self, l1_ratio=0.00029920499017254754, alpha=0.10734084960757517, positive_only=False, topK=453,
+            max_iter=200, tol=5e-5, workers=None, item_chunksize=8):
+
+        assert 0 <= l1_ratio <= 1, "{}: l1_ratio must be between 0 and 1, provided value was {}".format(
+            self.RECOMMENDER_NAME, l1_ratio)
 
-        self.alpha = alpha
         self.l1_ratio = l1_ratio
         self.positive_only = positive_only
         self.topK = topK
 
-        self.workers = workers
+        self.workers = cpu_count() if workers is None else workers
+
+        assert self.workers > 0, "{}: workers must be a positive integer, provided value was {}".format(
+            self.RECOMMENDER_NAME, self.workers)
+
+        URM_train = check_matrix(self.URM_train, 'csc', dtype=np.float32)
+
+        n_items = URM_train.shape[1]
+
+        shm_arrays = [URM_train.indptr, URM_train.indices, URM_train.data]
+        shm_list = [create_shared_memory(array) for array in shm_arrays]
+
+        initargs = (URM_train.shape,
+                    [shm.name for shm in shm_list],
+                    [array.shape for array in shm_arrays],
+                    [array.dtype for array in shm_arrays],
+                    alpha, self.l1_ratio, self.positive_only, max_iter, tol)
+
+        item_chunks = np.array_split(np.arange(n_items), max(1, int(np.ceil(n_items / item_chunksize))))
+
+        rows, cols, values = [], [], []
+        worker_items, worker_time = {}, {}
+        items_processed = 0
+
+        start_time = time.time()
+        start_time_printBatch = start_time
+
+        try:
+            with Pool(processes=self.workers, initializer=_init_worker, initargs=initargs) as pool:
 
-        self.URM_train = check_matrix(self.URM_train, 'csc', dtype=np.float32)
+                for rows_, cols_, values_, worker_pid, n_items_, time_ in pool.imap_unordered(partial(_partial_fit, topK=self.topK), item_chunks):
+                    rows.append(rows_)
+                    cols.append(cols_)
+                    values.append(values_)
 
-        indptr_shm = create_shared_memory(self.URM_train.indptr)
-        indices_shm = create_shared_memory(self.URM_train.indices)
-        data_shm = create_shared_memory(self.URM_train.data)
+                    worker_items[worker_pid] = worker_items.get(worker_pid, 0) + n_items_
+                    worker_time[worker_pid] = worker_time.get(worker_pid, 0.0) + time_
+                    items_processed += n_items_
 
-        _pfit = partial(_partial_fit, topK=self.topK, alpha=self.alpha, urm_shape=self.URM_train.shape,
-                        l1_ratio=self.l1_ratio, positive_only=self.positive_only,
-                        shm_names=[indptr_shm.name, indices_shm.name, data_shm.name],
-                        shm_shapes=[self.URM_train.indptr.shape, self.URM_train.indices.shape, self.URM_train.data.shape],
-                        shm_dtypes=[self.URM_train.indptr.dtype, self.URM_train.indices.dtype, self.URM_train.data.dtype])
+                    elapsed_time = time.time() - start_time
+                    new_time_value, new_time_unit = seconds_to_biggest_unit(elapsed_time)
 
-        with Pool(processes=self.workers) as pool:
+                    if time.time() - start_time_printBatch > 300 or items_processed == n_items:
+                        self._print("Processed {} ({:4.1f}%) in {:.2f} {}. Items per second: {:.2f}".format(
+                            items_processed,
+                            100.0 * float(items_processed) / n_items,
+                            new_time_value,
+                            new_time_unit,
+                            float(items_processed) / elapsed_time))
 
-            pool_chunksize = 4
-            item_chunksize = 8
+                        sys.stdout.flush()
+                        sys.stderr.flush()
 
-            itemchunks = np.array_split(np.arange(self.n_items), int(self.n_items / item_chunksize))
-            if verbose:
-                pbar = tqdm(total=self.n_items)
+                        start_time_printBatch = time.time()
 
-            # res contains a vector of (values, rows, cols) tuples
-            values, rows, cols = [], [], []
-            for values_, rows_, cols_ in pool.imap_unordered(_pfit, itemchunks, pool_chunksize):
-                values.extend(values_)
-                rows.extend(rows_)
-                cols.extend(cols_)
-                if verbose:
-                    pbar.update(item_chunksize)
+        finally:
+            for shm in shm_list:
+                shm.close()
+                shm.unlink()
 
-        indptr_shm.close()
-        indices_shm.close()
-        data_shm.close()
+        for worker_index, worker_pid in enumerate(sorted(worker_items.keys())):
+            self._print("Worker {} processed {} items. Items per second: {:.2f}".format(
+                worker_index,
+                worker_items[worker_pid],
+                worker_items[worker_pid] / max(worker_time[worker_pid], 1e-9)))
 
-        indptr_shm.unlink()
-        indices_shm.unlink()
-        data_shm.unlink()
+        rows = np.concatenate(rows) if len(rows) > 0 else np.zeros(0, dtype=np.int32)
+        cols = np.concatenate(cols) if len(cols) > 0 else np.zeros(0, dtype=np.int32)
+        values = np.concatenate(values) if len(values) > 0 else np.zeros(0, dtype=np.float32)
 
         # generate the sparse weight matrix
-        self.W_sparse = sps.csr_matrix((values, (rows, cols)), shape=(self.n_items, self.n_items), dtype=np.float32)
-        self.URM_train = self.URM_train.tocsr()
-'''
+        self.W_sparse = sps.csr_matrix((values, (rows, cols)), shape=(n_items, n_items), dtype=np.float32)
@@ -27,7 +27,8 @@ class SimilarityFunction(Enum):
 
 class Compute_Similarity:
 
-    def __init__(self, dataMatrix, use_implementation="density", similarity=None, **args):
+    def __init__(self, dataMatrix, use_implementation="density", similarity=None, n_threads=None,
+                 disk_folder_path=None, memory_budget_MB=1024, **args):
         """
         Interface object that will call the appropriate similarity implementation
         :param dataMatrix:              scipy sparse matrix |features|x|items| or |users|x|items|
@@ -35,6 +36,10 @@ class Compute_Similarity:
                                         "cython" will use the cython implementation, if available. Most efficient for sparse matrix
                                         "python" will use the python implementation. Most efficient for dense matrix
         :param similarity:              the type of similarity to use, see SimilarityFunction enum
+        :param n_threads:               number of threads used by the cython implementation, default is the number of cores
+        :param disk_folder_path:        if not None the similarity is built on disk in this folder and memory-mapped,
+                                        only the python implementation supports it and is therefore used
+        :param memory_budget_MB:        memory used by the python implementation while building the similarity
         :param args:                    other args required by the specific similarity implementation
         """
 
@@ -71,6 +76,9 @@ class Compute_Similarity:
             if similarity is not None:
                 args["similarity"] = similarity
 
+            if disk_folder_path is not None:
+                use_implementation = "python"
+
             if use_implementation == "density":
 
                 if isinstance(dataMatrix, np.ndarray):
@@ -99,15 +107,16 @@ class Compute_Similarity:
 
                 try:
                     from Recommenders.Similarity.Cython.Compute_Similarity_Cython import Compute_Similarity_Cython
-                    self.compute_similarity_object = Compute_Similarity_Cython(dataMatrix, **args)
+                    self.compute_similarity_object = Compute_Similarity_Cython(dataMatrix, n_threads=n_threads, **args)
 
                 except ImportError:
                     print("Unable to load Cython Compute_Similarity, reverting to Python")
-                    self.compute_similarity_object = Compute_Similarity_Python(dataMatrix, **args)
+                    self.compute_similarity_object = Compute_Similarity_Python(dataMatrix, memory_budget_MB=memory_budget_MB, **args)
 
 
             elif use_implementation == "python":
-                self.compute_similarity_object = Compute_Similarity_Python(dataMatrix, **args)
+                self.compute_similarity_object = Compute_Similarity_Python(dataMatrix, disk_folder_path=disk_folder_path,
+                                                                           memory_budget_MB=memory_budget_MB, **args)
 
             else:
 
@@ -10,13 +10,14 @@ import numpy as np
 import time, sys
 import scipy.sparse as sps
 from Recommenders.Recommender_utils import check_matrix
+from Utils.IncrementalSparseMatrix import IncrementalSparseMatrix_Blocks
 from Utils.seconds_to_biggest_unit import seconds_to_biggest_unit
 
 class Compute_Similarity_Python:
 
     def __init__(self, dataMatrix, topK=100, shrink = 0, normalize = True,
                  asymmetric_alpha = 0.5, tversky_alpha = 1.0, tversky_beta = 1.0,
-                 similarity = "cosine", row_weights = None):
+                 similarity = "cosine", row_weights = None, disk_folder_path = None, memory_budget_MB = 1024):
         """
         Computes the cosine similarity on the columns of dataMatrix
         If it is computed on URM=|users|x|items|, pass the URM as is.
@@ -27,6 +28,9 @@ class Compute_Similarity_Python:
         :param normalize:           If True divide the dot product by the product of the norms
         :param row_weights:         Multiply the values in each row by a specified value. Array
         :param asymmetric_alpha     Coefficient alpha for the asymmetric cosine
+        :param disk_folder_path:    If not None the similarity is written in this folder and the returned matrix
+                                    is memory-mapped from its files, see IncrementalSparseMatrix_Blocks
+        :param memory_budget_MB:    Memory used for the dense block of similarities and for the buffered columns
         :param similarity:  "cosine"        computes Cosine similarity
                             "adjusted"      computes Adjusted Cosine, removing the average of the users
                             "asymmetric"    computes Asymmetric Cosine
@@ -57,6 +61,9 @@ class Compute_Similarity_Python:
 
         self.dataMatrix = dataMatrix.copy()
 
+        self.disk_folder_path = disk_folder_path
+        self.memory_budget_MB = memory_budget_MB
+
         self.adjusted_cosine = False
         self.asymmetric_cosine = False
         self.pearson_correlation = False
@@ -212,10 +219,6 @@ class Compute_Similarity_Python:
         :return:
         """
 
-        values = []
-        rows = []
-        cols = []
-
         start_time = time.time()
         start_time_print_batch = start_time
         processed_items = 0
@@ -259,7 +262,14 @@ class Compute_Similarity_Python:
         if end_col is not None and end_col>start_col_local and end_col<self.n_columns:
             end_col_local = end_col
 
+        # The similarity is built column by column, the columns before start_col are empty
+        W_sparse_builder = IncrementalSparseMatrix_Blocks(self.n_columns, self.n_columns, format="csc", dtype=np.float32,
+                                                          folder_path=self.disk_folder_path,
+                                                          memory_budget_MB=self.memory_budget_MB)
+        W_sparse_builder.add_empty(start_col_local)
 
+        # The dense block of similarities and its copies during normalization must fit the memory budget
+        block_size = max(1, min(block_size, int(self.memory_budget_MB * 2**20) // (self.n_columns * 8 * 4)))
 
 
         start_col_block = start_col_local
@@ -273,6 +283,10 @@ class Compute_Similarity_Python:
             end_col_block = min(start_col_block + block_size, end_col_local)
             this_block_size = end_col_block-start_col_block
 
+            block_col_nnz = np.zeros(this_block_size, dtype=np.int32)
+            block_rows = []
+            block_values = []
+
             # All data points for a given item
             item_data = self.dataMatrix[:, start_col_block:end_col_block]
             item_data = item_data.toarray()
@@ -340,9 +354,11 @@ class Compute_Similarity_Python:
                 notZerosMask = this_column_weights[top_k_idx] != 0.0
                 numNotZeros = np.sum(notZerosMask)
 
-                values.extend(this_column_weights[top_k_idx][notZerosMask])
-                rows.extend(top_k_idx[notZerosMask])
-                cols.extend(np.ones(numNotZeros) * columnIndex)
+                block_values.append(this_column_weights[top_k_idx][notZerosMask])
+                block_rows.append(top_k_idx[notZerosMask])
+                block_col_nnz[col_index_in_block] = numNotZeros
+
+            W_sparse_builder.add_block(block_col_nnz, np.concatenate(block_rows), np.concatenate(block_values))
 
             # Add previous block size
             start_col_block += this_block_size
@@ -363,8 +379,6 @@ class Compute_Similarity_Python:
 
         # End while on columns
 
-        W_sparse = sps.csr_matrix((values, (rows, cols)),
-                                  shape=(self.n_columns, self.n_columns),
-                                  dtype=np.float32)
+        W_sparse = W_sparse_builder.get_SparseMatrix(format="csr")
 
         return W_sparse
\ No newline at end of file
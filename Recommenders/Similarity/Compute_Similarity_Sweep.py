@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 18/10/26
+"""
+
+import time, sys, hashlib, multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import scipy.sparse as sps
+
+from Utils.seconds_to_biggest_unit import seconds_to_biggest_unit
+
+
+SET_SIMILARITY_VALUES = ["jaccard", "tanimoto", "dice", "tversky"]
+SWEEP_SIMILARITY_VALUES = ["cosine", "asymmetric"] + SET_SIMILARITY_VALUES
+SWEEP_SIMILARITY_ARGS = ["asymmetric_alpha", "tversky_alpha", "tversky_beta"]
+
+# Sweeps of the last data matrices used, shared by all the instances, e.g., by those created for each case
+# of a hyperparameter search. More than one is kept since the cases alternate the feature weighting
+SWEEP_CACHE_SIZE = 3
+_sweep_cache = OrderedDict()
+
+
+def _is_monotone_similarity(similarity, asymmetric_alpha=0.5, tversky_alpha=1.0, tversky_beta=1.0):
+    """
+    The candidates are pruned assuming the similarity does not increase with the norm of the other column.
+    This does not hold for the asymmetric cosine with asymmetric_alpha > 1, whose exponent 2*(1-alpha) of
+    the other norm is negative, and for the tversky similarity with negative coefficients
+    """
+
+    if similarity == "asymmetric":
+        return asymmetric_alpha <= 1
+
+    if similarity == "tversky":
+        return tversky_alpha >= 0 and tversky_beta >= 0
+
+    return True
+
+
+def is_sweep_supported(dataMatrix, similarity, **similarity_args):
+    """
+    The sweep requires the similarity to increase with the dot product, which holds for non-negative data,
+    and not to increase with the norm of the other column, see _is_monotone_similarity.
+    It does not support the other arguments of Compute_Similarity, e.g., row_weights
+    """
+
+    if similarity not in SWEEP_SIMILARITY_VALUES or not set(similarity_args).issubset(SWEEP_SIMILARITY_ARGS):
+        return False
+
+    if not _is_monotone_similarity(similarity, **similarity_args):
+        return False
+
+    return similarity in SET_SIMILARITY_VALUES or dataMatrix.nnz == 0 or dataMatrix.data.min() >= 0
+
+
+def get_similarity_sweep(dataMatrix, similarity, topK, candidate_topK=1000, n_threads=None):
+    """
+    Returns the sweep of the data for the family of the similarity, from the cache if it has already been
+    computed for the same data with at least topK candidates, otherwise it is computed and added to the cache
+    """
+
+    is_set_similarity = similarity in SET_SIMILARITY_VALUES
+
+    cache_key = hashlib.sha1()
+    dataMatrix_csr = sps.csr_matrix(dataMatrix)
+    for array in [dataMatrix_csr.indptr, dataMatrix_csr.indices, dataMatrix_csr.data]:
+        cache_key.update(np.ascontiguousarray(array).view(np.uint8))
+    cache_key.update(repr((dataMatrix.shape, is_set_similarity)).encode("utf-8"))
+    cache_key = cache_key.hexdigest()
+
+    if cache_key in _sweep_cache and _sweep_cache[cache_key].candidate_topK >= topK:
+        _sweep_cache.move_to_end(cache_key)
+        return _sweep_cache[cache_key]
+
+    # Release the replaced sweep before computing the new one
+    _sweep_cache.pop(cache_key, None)
+
+    sweep = Compute_Similarity_Sweep(dataMatrix, is_set_similarity=is_set_similarity,
+                                     candidate_topK=max(candidate_topK, topK), n_threads=n_threads)
+
+    _sweep_cache[cache_key] = sweep
+
+    while len(_sweep_cache) > SWEEP_CACHE_SIZE:
+        _sweep_cache.popitem(last=False)
+
+    return sweep
+
+
+class Compute_Similarity_Sweep(object):
+    """
+    Computes the dot products and the norms of the columns of dataMatrix once and derives from them
+    the similarity for any value of topK <= candidate_topK, shrink, normalize and of the parameters of the similarity,
+    with the same result as Compute_Similarity.
+
+    The cosine, asymmetric cosine with asymmetric_alpha <= 1 and set-based similarities with non-negative
+    coefficients increase with the dot product and do not increase with the norm of the other column, so only the columns dominated on both by less than candidate_topK others
+    are kept as candidates, see compute_candidates_block, and each similarity rescales and truncates them.
+    The set-based similarities use the boolean data, the others the data as is.
+    """
+
+    def __init__(self, dataMatrix, is_set_similarity=False, candidate_topK=1000, n_threads=None):
+        """
+        :param dataMatrix:          |rows|x|columns|, the similarity is computed among the columns
+        :param is_set_similarity:   True for "jaccard", "tanimoto", "dice", "tversky"
+        :param n_threads:           number of threads computing the candidates, default is the number of cores
+        """
+
+        super(Compute_Similarity_Sweep, self).__init__()
+
+        self.n_columns = dataMatrix.shape[1]
+        self.is_set_similarity = is_set_similarity
+        self.candidate_topK = min(candidate_topK, self.n_columns)
+
+        dataMatrix = sps.csr_matrix(dataMatrix, copy=True)
+
+        if is_set_similarity:
+            dataMatrix.data[:] = 1
+
+        # Same precision as Compute_Similarity_Cython
+        self.sum_of_squared = np.array(dataMatrix.power(2).sum(axis=0), dtype=np.float64).ravel()
+
+        if not is_set_similarity:
+            self.sum_of_squared = np.sqrt(self.sum_of_squared)
+
+        self.col_indptr, self.candidate_rows, self.candidate_dot = self._compute_candidates(dataMatrix, n_threads)
+        self.candidate_cols = np.repeat(np.arange(self.n_columns, dtype=np.int32), np.ediff1d(self.col_indptr))
+
+    def _compute_candidates_block_python(self, dataMatrix, start_col, end_col):
+        """
+        Python version of compute_candidates_block, used if the compiled one is not available.
+        It keeps all the nonzero dot products, which is a superset of the candidates
+        """
+
+        dot_block = dataMatrix[:, start_col:end_col].T.dot(dataMatrix).toarray().astype(np.float64)
+        dot_block[np.arange(end_col - start_col), np.arange(start_col, end_col)] = 0.0
+
+        block_rows, block_cols = np.nonzero(dot_block)
+
+        return np.bincount(block_rows, minlength=end_col - start_col).astype(np.int32), \
+               block_cols.astype(np.int32), dot_block[block_rows, block_cols]
+
+    def _compute_candidates(self, dataMatrix, n_threads):
+
+        try:
+            from Recommenders.Similarity.Cython.Compute_Similarity_Sweep_Cython import compute_candidates_block
+
+            dataMatrix_csc = dataMatrix.tocsc()
+
+            csc_arrays = (dataMatrix_csc.indptr.astype(np.int32), dataMatrix_csc.indices.astype(np.int32),
+                          dataMatrix_csc.data.astype(np.float64))
+            csr_arrays = (dataMatrix.indptr.astype(np.int32), dataMatrix.indices.astype(np.int32),
+                          dataMatrix.data.astype(np.float64))
+
+            column_of_rank = np.argsort(self.sum_of_squared, kind="stable").astype(np.int32)
+            norm_rank = np.empty(self.n_columns, dtype=np.int32)
+            norm_rank[column_of_rank] = np.arange(self.n_columns, dtype=np.int32)
+
+            def compute_block(start_col, end_col):
+                return compute_candidates_block(*csc_arrays, *csr_arrays, self.sum_of_squared, norm_rank, column_of_rank,
+                                                self.candidate_topK, start_col, end_col)
+
+        except ImportError:
+            print("Unable to load Cython Compute_Similarity_Sweep, reverting to Python")
+
+            dataMatrix_csc = dataMatrix.tocsc().astype(np.float64)
+
+            def compute_block(start_col, end_col):
+                return self._compute_candidates_block_python(dataMatrix_csc, start_col, end_col)
+
+        if n_threads is None:
+            n_threads = multiprocessing.cpu_count()
+
+        block_dim = 200
+        block_start_list = list(range(0, self.n_columns, block_dim))
+
+        col_nnz_list, rows_list, dot_list = [], [], []
+
+        start_time = time.time()
+
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+
+            block_result_iterator = executor.map(lambda block_start: compute_block(block_start, min(block_start + block_dim, self.n_columns)),
+                                                 block_start_list)
+
+            for col_nnz, rows, dot in block_result_iterator:
+                col_nnz_list.append(col_nnz)
+                rows_list.append(rows)
+                dot_list.append(dot)
+
+        col_indptr = np.zeros(self.n_columns + 1, dtype=np.int64)
+
+        if self.n_columns > 0:
+            np.cumsum(np.concatenate(col_nnz_list), out=col_indptr[1:])
+
+        new_time_value, new_time_unit = seconds_to_biggest_unit(time.time() - start_time)
+
+        print("Compute_Similarity_Sweep: {} candidates for {} columns, {:.1f} per column. Elapsed time {:.2f} {}".format(
+            col_indptr[-1], self.n_columns, col_indptr[-1] / max(self.n_columns, 1), new_time_value, new_time_unit))
+
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+        return col_indptr, \
+               np.concatenate(rows_list) if rows_list else np.zeros(0, dtype=np.int32), \
+               np.concatenate(dot_list) if dot_list else np.zeros(0, dtype=np.float64)
+
+    def _compute_candidate_similarity(self, shrink, normalize, similarity, asymmetric_alpha, tversky_alpha, tversky_beta):
+        """
+        Rescales the dot product of the candidates as Compute_Similarity_Cython does, with the operations
+        in the same order and the parameters of the similarity in float32 as there.
+        The denominator is computed in place to limit the temporary arrays of the size of the candidates
+        """
+
+        dot = self.candidate_dot
+        col_nnz = np.ediff1d(self.col_indptr)
+
+        if similarity in ["jaccard", "tanimoto", "dice", "tversky"]:
+
+            if similarity == "tversky":
+                tversky_alpha = float(np.float32(tversky_alpha))
+                tversky_beta = float(np.float32(tversky_beta))
+
+                denominator = np.repeat(self.sum_of_squared, col_nnz) - dot
+                denominator *= tversky_alpha
+                denominator += dot
+                denominator += (self.sum_of_squared[self.candidate_rows] - dot) * tversky_beta
+
+            else:
+                denominator = np.repeat(self.sum_of_squared, col_nnz)
+                denominator += self.sum_of_squared[self.candidate_rows]
+
+                if similarity != "dice":
+                    denominator -= dot
+
+        elif normalize:
+
+            if similarity == "asymmetric":
+                asymmetric_alpha = float(np.float32(asymmetric_alpha))
+
+                # The power of 1-alpha may be negative so add small value to ensure values are non-zeros
+                sum_of_squared = self.sum_of_squared + 1e-6
+                norm_col = np.power(sum_of_squared, 2 * asymmetric_alpha)
+                norm_row = np.power(sum_of_squared, 2 * (1 - asymmetric_alpha))
+
+            else:
+                norm_col = norm_row = self.sum_of_squared
+
+            denominator = np.repeat(norm_col, col_nnz)
+            denominator *= norm_row[self.candidate_rows]
+
+        elif shrink != 0:
+            return dot / shrink
+
+        else:
+            return dot.copy()
+
+        denominator += shrink
+        denominator += 1e-6
+
+        return np.divide(dot, denominator, out=denominator)
+
+    def _select_topK_candidates_python(self, values, topK):
+        """
+        Python version of select_topK_candidates, used if the compiled one is not available.
+        Only the columns with more than topK candidates need the selection, their candidates are
+        sorted by column and decreasing similarity and the first topK of each column are kept
+        """
+
+        has_more = np.ediff1d(self.col_indptr)[self.candidate_cols] > topK
+        selected = np.flatnonzero(has_more)
+
+        selected = selected[np.lexsort((-values[selected], self.candidate_cols[selected]))]
+        position = np.arange(len(selected)) - np.searchsorted(self.candidate_cols[selected], self.candidate_cols[selected])
+
+        selected = np.concatenate((np.flatnonzero(~has_more), selected[position < topK]))
+
+        selected = np.sort(selected)
+
+        return selected[values[selected] != 0.0]
+
+    def compute_similarity(self, topK=100, shrink=0, normalize=True, similarity="cosine",
+                           asymmetric_alpha=0.5, tversky_alpha=1.0, tversky_beta=1.0):
+        """
+        :return:    sparse matrix |columns|x|columns| with the topK nonzero similarities of each column,
+                    the same Compute_Similarity returns with these arguments
+        """
+
+        if similarity not in SWEEP_SIMILARITY_VALUES or (similarity in SET_SIMILARITY_VALUES) != self.is_set_similarity:
+            raise ValueError("Compute_Similarity_Sweep: similarity '{}' cannot be computed from a sweep with "
+                             "is_set_similarity={}".format(similarity, self.is_set_similarity))
+
+        if not _is_monotone_similarity(similarity, asymmetric_alpha, tversky_alpha, tversky_beta):
+            raise ValueError("Compute_Similarity_Sweep: similarity '{}' with asymmetric_alpha={}, tversky_alpha={}, "
+                             "tversky_beta={} increases with the norm of the other column and cannot be computed "
+                             "from a sweep".format(similarity, asymmetric_alpha, tversky_alpha, tversky_beta))
+
+        topK = min(topK, self.n_columns)
+
+        if not 0 < topK <= self.candidate_topK:
+            raise ValueError("Compute_Similarity_Sweep: topK must be between 1 and candidate_topK={}, provided was {}".format(
+                self.candidate_topK, topK))
+
+        values = self._compute_candidate_similarity(shrink, normalize, similarity, asymmetric_alpha, tversky_alpha, tversky_beta)
+
+        try:
+            from Recommenders.Similarity.Cython.Compute_Similarity_Sweep_Cython import select_topK_candidates
+            selected = select_topK_candidates(self.col_indptr, values, topK)
+
+        except ImportError:
+            selected = self._select_topK_candidates_python(values, topK)
+
+        # The selected candidates are grouped by column, so the result is built directly in CSC format
+        indptr = np.zeros(self.n_columns + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.candidate_cols[selected], minlength=self.n_columns), out=indptr[1:])
+
+        W_sparse = sps.csc_matrix((values[selected].astype(np.float32), self.candidate_rows[selected], indptr),
+                                  shape=(self.n_columns, self.n_columns))
+
+        return W_sparse.tocsr()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 18/10/26
+"""
+
+import unittest
+
+import numpy as np
+import scipy.sparse as sps
+
+from Recommenders.Similarity.Compute_Similarity import Compute_Similarity
+from Recommenders.Similarity.Compute_Similarity_Sweep import is_sweep_supported, Compute_Similarity_Sweep
+from Recommenders.KNN.ItemKNNCFRecommender import ItemKNNCFRecommender
+
+
+def get_data_matrix(n_rows=2000, n_columns=600, density=0.02, random_seed=42):
+
+    data_matrix = sps.random(n_rows, n_columns, density=density, format="csr", dtype=np.float32,
+                             random_state=np.random.RandomState(random_seed))
+    data_matrix.data = data_matrix.data * 4 + 1
+
+    return data_matrix
+
+
+class MyTestCase(unittest.TestCase):
+
+    def test_sweep_not_supported_if_not_monotone(self):
+
+        data_matrix = get_data_matrix()
+
+        self.assertTrue(is_sweep_supported(data_matrix, "asymmetric", asymmetric_alpha=0.5))
+        self.assertTrue(is_sweep_supported(data_matrix, "asymmetric", asymmetric_alpha=1.0))
+        self.assertFalse(is_sweep_supported(data_matrix, "asymmetric", asymmetric_alpha=1.5))
+        self.assertFalse(is_sweep_supported(data_matrix, "asymmetric", asymmetric_alpha=1.9))
+        self.assertFalse(is_sweep_supported(data_matrix, "tversky", tversky_alpha=-0.5, tversky_beta=1.0))
+        self.assertFalse(is_sweep_supported(data_matrix, "tversky", tversky_alpha=1.0, tversky_beta=-0.5))
+
+        sweep = Compute_Similarity_Sweep(data_matrix, candidate_topK=50)
+
+        with self.assertRaises(ValueError):
+            sweep.compute_similarity(topK=20, similarity="asymmetric", asymmetric_alpha=1.5)
+
+
+    def test_sweep_same_as_compute_similarity(self):
+
+        data_matrix = get_data_matrix()
+        topK, candidate_topK = 20, 50
+
+        sweep = Compute_Similarity_Sweep(data_matrix, candidate_topK=candidate_topK)
+        sweep_set = Compute_Similarity_Sweep(data_matrix, is_set_similarity=True, candidate_topK=candidate_topK)
+
+        for similarity, similarity_args in [("cosine", {}),
+                                            ("asymmetric", {"asymmetric_alpha": 0.2}),
+                                            ("asymmetric", {"asymmetric_alpha": 1.0}),
+                                            ("tversky", {"tversky_alpha": 0.3, "tversky_beta": 1.5})]:
+
+            W_sweep = (sweep_set if similarity == "tversky" else sweep).compute_similarity(
+                topK=topK, shrink=5, similarity=similarity, **similarity_args)
+
+            W_exact = Compute_Similarity(data_matrix, topK=topK, shrink=5,
+                                         similarity=similarity, **similarity_args).compute_similarity()
+
+            self.assertTrue(np.allclose(W_sweep.toarray(), W_exact.toarray(), atol=1e-6),
+                            "Sweep different from Compute_Similarity for {} {}".format(similarity, similarity_args))
+
+
+    def test_knn_similarity_cache_same_as_compute_similarity(self):
+
+        data_matrix = get_data_matrix()
+        topK = 20
+
+        # With asymmetric_alpha > 1 the sweep cannot be used and the fit must fall back to Compute_Similarity
+        for asymmetric_alpha in [0.5, 1.5, 1.9]:
+
+            recommender_cache = ItemKNNCFRecommender(data_matrix.copy(), verbose=False)
+            recommender_cache.fit(topK=topK, shrink=5, similarity="asymmetric", asymmetric_alpha=asymmetric_alpha,
+                                  feature_weighting="none", use_similarity_cache=True, similarity_cache_topK=50)
+
+            W_exact = Compute_Similarity(data_matrix.copy(), topK=topK, shrink=5,
+                                         similarity="asymmetric", asymmetric_alpha=asymmetric_alpha).compute_similarity()
+
+            self.assertTrue(np.allclose(recommender_cache.W_sparse.toarray(), W_exact.toarray(), atol=1e-6),
+                            "Cached fit different from Compute_Similarity for asymmetric_alpha {}".format(asymmetric_alpha))
+
+
+
+if __name__ == '__main__':
+
+    unittest.main()
@@ -0,0 +1,235 @@
+#cython: boundscheck=False
+#cython: wraparound=False
+#cython: initializedcheck=False
+#cython: language_level=3
+#cython: nonecheck=False
+#cython: cdivision=True
+#cython: overflowcheck=False
+
+"""
+Created on 18/10/26
+"""
+
+import numpy as np
+cimport numpy as np
+import scipy.sparse as sps
+
+from Recommenders.Recommender_utils import check_matrix
+
+
+cdef inline bint _is_lower(double value_1, int item_1, double value_2, int item_2) nogil:
+    # Ties are broken in favour of the lower item index, which is therefore considered the "higher" one
+    return value_1 < value_2 or (value_1 == value_2 and item_1 > item_2)
+
+
+cdef inline void _heap_sift_down(double[:] heap_value, int[:] heap_item, int heap_size, int position) nogil:
+
+    cdef int child, smallest
+    cdef double tmp_value
+    cdef int tmp_item
+
+    while True:
+        smallest = position
+        child = 2*position + 1
+
+        if child < heap_size and _is_lower(heap_value[child], heap_item[child], heap_value[smallest], heap_item[smallest]):
+            smallest = child
+
+        child += 1
+
+        if child < heap_size and _is_lower(heap_value[child], heap_item[child], heap_value[smallest], heap_item[smallest]):
+            smallest = child
+
+        if smallest == position:
+            return
+
+        tmp_value = heap_value[position]
+        tmp_item = heap_item[position]
+        heap_value[position] = heap_value[smallest]
+        heap_item[position] = heap_item[smallest]
+        heap_value[smallest] = tmp_value
+        heap_item[smallest] = tmp_item
+
+        position = smallest
+
+
+cdef inline void _heap_sift_up(double[:] heap_value, int[:] heap_item, int position) nogil:
+
+    cdef int parent
+    cdef double tmp_value
+    cdef int tmp_item
+
+    while position > 0:
+        parent = (position - 1) // 2
+
+        if not _is_lower(heap_value[position], heap_item[position], heap_value[parent], heap_item[parent]):
+            return
+
+        tmp_value = heap_value[position]
+        tmp_item = heap_item[position]
+        heap_value[position] = heap_value[parent]
+        heap_item[position] = heap_item[parent]
+        heap_value[parent] = tmp_value
+        heap_item[parent] = tmp_item
+
+        position = parent
+
+
+cdef inline int _heap_push_candidate(double[:] heap_value, int[:] heap_item, int heap_size, int cutoff,
+                                     double value, int item) nogil:
+    """
+    Adds the candidate to a min-heap of at most cutoff elements, the root is the worst element kept so far
+    :return: the new heap size
+    """
+
+    if heap_size < cutoff:
+        heap_value[heap_size] = value
+        heap_item[heap_size] = item
+        _heap_sift_up(heap_value, heap_item, heap_size)
+        return heap_size + 1
+
+    if _is_lower(heap_value[0], heap_item[0], value, item):
+        heap_value[0] = value
+        heap_item[0] = item
+        _heap_sift_down(heap_value, heap_item, heap_size, 0)
+
+    return heap_size
+
+
+
+def compute_item_score_topk(URM_train, W_sparse, user_id_array, int cutoff, bint remove_seen_flag = True, items_to_exclude = None):
+    """
+    Computes the top-cutoff items of URM_train[user_id_array].dot(W_sparse) without building the dense score rows.
+
+    The product is computed one user at a time with a sparse accumulator of n_items elements shared by all users,
+    only the items reached by the user profile are visited and a min-heap of size cutoff keeps the best ones.
+    Items not reached by the user profile have score 0.0 and are used, in increasing index order, only if
+    less than cutoff items have a score >= 0.0, exactly as it happens when ranking the dense scores.
+
+    :param URM_train:           sparse matrix |users|x|items|
+    :param W_sparse:            sparse matrix |items|x|items|
+    :param user_id_array:       array of users whose recommendations need to be computed
+    :param cutoff:              length of the recommendation list
+    :param remove_seen_flag:    if True the items in the user profile are never recommended
+    :param items_to_exclude:    array of items that are never recommended to any user
+    :return:                    int32 array (len(user_id_array), cutoff), sorted by decreasing score and padded with -1
+    """
+
+    URM_train = check_matrix(URM_train, 'csr', dtype=np.float32)
+    W_sparse = check_matrix(W_sparse, 'csr', dtype=np.float32)
+
+    assert URM_train.shape[1] == W_sparse.shape[0] == W_sparse.shape[1], \
+        "compute_item_score_topk: URM_train and W_sparse have inconsistent shape, {} and {}".format(URM_train.shape, W_sparse.shape)
+
+    cdef int n_items = W_sparse.shape[1]
+    cdef int n_users_to_compute = len(user_id_array)
+
+    cdef int[:] URM_indptr = URM_train.indptr.astype(np.int32)
+    cdef int[:] URM_indices = URM_train.indices.astype(np.int32)
+    cdef float[:] URM_data = URM_train.data
+
+    cdef int[:] W_indptr = W_sparse.indptr.astype(np.int32)
+    cdef int[:] W_indices = W_sparse.indices.astype(np.int32)
+    cdef float[:] W_data = W_sparse.data
+
+    cdef int[:] user_id_array_view = np.asarray(user_id_array, dtype=np.int32)
+
+    cdef np.ndarray[np.int32_t, ndim=2] ranking = - np.ones((n_users_to_compute, cutoff), dtype=np.int32)
+    cdef int[:,:] ranking_view = ranking
+
+    # Sparse accumulator, only the touched cells are reset after each user
+    cdef double[:] accumulator = np.zeros(n_items, dtype=np.float64)
+    cdef int[:] touched_mask = np.zeros(n_items, dtype=np.int32)
+    cdef int[:] touched_list = np.zeros(n_items, dtype=np.int32)
+
+    # Excluded items are flagged with 2, seen items of the current user with 1
+    cdef int[:] excluded_mask = np.zeros(n_items, dtype=np.int32)
+
+    cdef double[:] heap_value = np.zeros(max(cutoff, 1), dtype=np.float64)
+    cdef int[:] heap_item = np.zeros(max(cutoff, 1), dtype=np.int32)
+
+    cdef int user_index, user_id, profile_index, item_profile, w_index, item_id, touched_index
+    cdef int n_touched, heap_size, n_ranked, position
+    cdef double rating
+
+    if items_to_exclude is not None:
+        for item_id in np.asarray(items_to_exclude, dtype=np.int32):
+            excluded_mask[item_id] = 2
+
+    with nogil:
+
+        for user_index in range(n_users_to_compute):
+
+            user_id = user_id_array_view[user_index]
+
+            if remove_seen_flag:
+                for profile_index in range(URM_indptr[user_id], URM_indptr[user_id+1]):
+                    item_profile = URM_indices[profile_index]
+                    if excluded_mask[item_profile] == 0:
+                        excluded_mask[item_profile] = 1
+
+            # Accumulate the scores of all the items reachable from the user profile
+            n_touched = 0
+
+            for profile_index in range(URM_indptr[user_id], URM_indptr[user_id+1]):
+
+                item_profile = URM_indices[profile_index]
+                rating = URM_data[profile_index]
+
+                for w_index in range(W_indptr[item_profile], W_indptr[item_profile+1]):
+
+                    item_id = W_indices[w_index]
+
+                    if not touched_mask[item_id]:
+                        touched_mask[item_id] = True
+                        touched_list[n_touched] = item_id
+                        n_touched += 1
+
+                    accumulator[item_id] += rating * W_data[w_index]
+
+
+            heap_size = 0
+
+            for touched_index in range(n_touched):
+                item_id = touched_list[touched_index]
+
+                if excluded_mask[item_id] == 0:
+                    heap_size = _heap_push_candidate(heap_value, heap_item, heap_size, cutoff, accumulator[item_id], item_id)
+
+
+            # Items never reached have score 0.0, they are needed only if the heap is not full or contains negative scores
+            if heap_size < cutoff or heap_value[0] < 0.0:
+                for item_id in range(n_items):
+
+                    if heap_size == cutoff and heap_value[0] >= 0.0:
+                        break
+
+                    if not touched_mask[item_id] and excluded_mask[item_id] == 0:
+                        heap_size = _heap_push_candidate(heap_value, heap_item, heap_size, cutoff, 0.0, item_id)
+
+
+            # Extract the heap from the worst to the best element
+            n_ranked = heap_size
+
+            for position in range(n_ranked - 1, -1, -1):
+                ranking_view[user_index, position] = heap_item[0]
+
+                heap_size -= 1
+                heap_value[0] = heap_value[heap_size]
+                heap_item[0] = heap_item[heap_size]
+                _heap_sift_down(heap_value, heap_item, heap_size, 0)
+
+
+            # Clean the data structures for the next user
+            for touched_index in range(n_touched):
+                item_id = touched_list[touched_index]
+                accumulator[item_id] = 0.0
+                touched_mask[item_id] = False
+
+            if remove_seen_flag:
+                for profile_index in range(URM_indptr[user_id], URM_indptr[user_id+1]):
+                    item_profile = URM_indices[profile_index]
+                    if excluded_mask[item_profile] == 1:
+                        excluded_mask[item_profile] = 0
+
+    return ranking
@@ -27,8 +27,9 @@ ELSE:
 
 
 
-import time, sys
+import time, sys, multiprocessing
 import cython
+from cython.parallel import prange, threadid
 import numpy as np
 cimport numpy as np
 
@@ -43,6 +44,53 @@ import scipy.sparse as sps
 from Recommenders.Recommender_utils import check_matrix
 from Utils.seconds_to_biggest_unit import seconds_to_biggest_unit
 
+cdef inline bint _is_lower(double value_1, int item_1, double value_2, int item_2) nogil:
+    # Ties are broken in favour of the lower item index, which is therefore considered the "higher" one
+    return value_1 < value_2 or (value_1 == value_2 and item_1 > item_2)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.initializedcheck(False)
+cdef inline void _heap_sift_down(double[:, ::1] heap_value, int[:, ::1] heap_item, int thread_id, int heap_size, int position) nogil:
+    """
+    Restores the min-heap of at most topK elements stored in the row thread_id of the buffers,
+    the root is the worst element kept so far
+    """
+
+    cdef int child, smallest
+    cdef double tmp_value
+    cdef int tmp_item
+
+    while True:
+        smallest = position
+        child = 2*position + 1
+
+        if child < heap_size and _is_lower(heap_value[thread_id, child], heap_item[thread_id, child],
+                                           heap_value[thread_id, smallest], heap_item[thread_id, smallest]):
+            smallest = child
+
+        child += 1
+
+        if child < heap_size and _is_lower(heap_value[thread_id, child], heap_item[thread_id, child],
+                                           heap_value[thread_id, smallest], heap_item[thread_id, smallest]):
+            smallest = child
+
+        if smallest == position:
+            return
+
+        tmp_value = heap_value[thread_id, position]
+        tmp_item = heap_item[thread_id, position]
+        heap_value[thread_id, position] = heap_value[thread_id, smallest]
+        heap_item[thread_id, position] = heap_item[thread_id, smallest]
+        heap_value[thread_id, smallest] = tmp_value
+        heap_item[thread_id, smallest] = tmp_item
+
+        position = smallest
+
+
+
+
 @cython.boundscheck(False)
 @cython.wraparound(False)
 @cython.initializedcheck(False)
@@ -54,9 +102,11 @@ cdef class Compute_Similarity_Cython:
     cdef int TopK
     cdef long n_columns, n_rows
 
-    cdef double[:] this_item_weights
-    cdef int[:] this_item_weights_mask, this_item_weights_id
-    cdef int this_item_weights_counter
+    cdef int n_threads
+
+    # Scratch buffers, one row for each thread
+    cdef double[:, ::1] thread_item_weights, thread_heap_value
+    cdef int[:, ::1] thread_item_weights_mask, thread_item_weights_id, thread_heap_item
 
     cdef int[:] user_to_item_row_ptr, user_to_item_cols
     cdef int[:] item_to_user_rows, item_to_user_col_ptr
@@ -72,7 +122,7 @@ cdef class Compute_Similarity_Cython:
 
     def __init__(self, dataMatrix, topK = 100, shrink=0, normalize = True,
                  asymmetric_alpha = 0.5, tversky_alpha = 1.0, tversky_beta = 1.0,
-                 similarity = "cosine", row_weights = None):
+                 similarity = "cosine", row_weights = None, n_threads = None):
         """
         Computes the cosine similarity on the columns of dataMatrix
         If it is computed on URM=|users|x|items|, pass the URM as is.
@@ -83,6 +133,7 @@ cdef class Compute_Similarity_Cython:
         :param normalize:           If True divide the dot product by the product of the norms
         :param row_weights:         Multiply the values in each row by a specified value. Array
         :param asymmetric_alpha     Coefficient alpha for the asymmetric cosine
+        :param n_threads:           Number of threads computing the columns, default is the number of cores
         :param similarity:  "cosine"        computes Cosine similarity
                             "adjusted"      computes Adjusted Cosine, removing the average of the users
                             "asymmetric"    computes Asymmetric Cosine
@@ -145,10 +196,13 @@ cdef class Compute_Similarity_Cython:
 
 
         self.TopK = min(topK, self.n_columns)
-        self.this_item_weights = np.zeros(self.n_columns, dtype=np.float64)
-        self.this_item_weights_id = np.zeros(self.n_columns, dtype=np.int32)
-        self.this_item_weights_mask = np.zeros(self.n_columns, dtype=np.int32)
-        self.this_item_weights_counter = 0
+        self.n_threads = multiprocessing.cpu_count() if n_threads is None else max(n_threads, 1)
+
+        self.thread_item_weights = np.zeros((self.n_threads, self.n_columns), dtype=np.float64)
+        self.thread_item_weights_id = np.zeros((self.n_threads, self.n_columns), dtype=np.int32)
+        self.thread_item_weights_mask = np.zeros((self.n_threads, self.n_columns), dtype=np.int32)
+        self.thread_heap_value = np.zeros((self.n_threads, max(self.TopK, 1)), dtype=np.float64)
+        self.thread_heap_item = np.zeros((self.n_threads, max(self.TopK, 1)), dtype=np.int32)
 
         # Copy data to avoid altering the original object
         dataMatrix = dataMatrix.copy()
@@ -314,17 +368,7 @@ cdef class Compute_Similarity_Cython:
 
 
 
-
-    cdef int[:] getUsersThatRatedItem(self, long item_id):
-        return self.item_to_user_rows[self.item_to_user_col_ptr[item_id]:self.item_to_user_col_ptr[item_id+1]]
-
-    cdef int[:] getItemsRatedByUser(self, long user_id):
-        return self.user_to_item_cols[self.user_to_item_row_ptr[user_id]:self.user_to_item_row_ptr[user_id+1]]
-
-
-
-
-    cdef computeItemSimilarities(self, long item_id_input):
+    cdef int computeItemSimilarities(self, long item_id_input, int thread_id) nogil:
         """
         For every item the cosine similarity against other items depends on whether they have users in common. The more
         common users the higher the similarity.
@@ -348,37 +392,20 @@ cdef class Compute_Similarity_Cython:
         -- Given a user, get the items he rated (second item)
         -- Update the similarity of the items he rated
         
-        
+        The similarities are accumulated in the scratch buffers of the thread, which are clean before the call
+        :return: the number of items touched, whose ids are in self.thread_item_weights_id
         """
 
-        # Create template used to initialize an array with zeros
-        # Much faster than np.zeros(self.n_columns)
-        #cdef array[double] template_zero = array('d')
-        #cdef array[double] result = clone(template_zero, self.n_columns, zero=True)
-
-
-        cdef long user_index, user_id, item_index, item_id, item_id_second
-
-        cdef int[:] users_that_rated_item = self.getUsersThatRatedItem(item_id_input)
-        cdef int[:] items_rated_by_user
-
-        cdef double rating_item_input, rating_item_second, row_weight
-
-        # Clean previous item
-        for item_index in range(self.this_item_weights_counter):
-            item_id = self.this_item_weights_id[item_index]
-            self.this_item_weights_mask[item_id] = False
-            self.this_item_weights[item_id] = 0.0
-
-        self.this_item_weights_counter = 0
-
+        cdef long user_index, user_id, item_index, item_id_second
+        cdef int counter = 0
 
+        cdef double rating_item_input, row_weight
 
         # Get users that rated the items
-        for user_index in range(len(users_that_rated_item)):
+        for user_index in range(self.item_to_user_col_ptr[item_id_input], self.item_to_user_col_ptr[item_id_input+1]):
 
-            user_id = users_that_rated_item[user_index]
-            rating_item_input = self.item_to_user_data[self.item_to_user_col_ptr[item_id_input]+user_index]
+            user_id = self.item_to_user_rows[user_index]
+            rating_item_input = self.item_to_user_data[user_index]
 
             if self.use_row_weights:
                 row_weight = self.row_weights[user_id]
@@ -386,210 +413,232 @@ cdef class Compute_Similarity_Cython:
                 row_weight = 1.0
 
             # Get all items rated by that user
-            items_rated_by_user = self.getItemsRatedByUser(user_id)
-
-            for item_index in range(len(items_rated_by_user)):
+            for item_index in range(self.user_to_item_row_ptr[user_id], self.user_to_item_row_ptr[user_id+1]):
 
-                item_id_second = items_rated_by_user[item_index]
+                item_id_second = self.user_to_item_cols[item_index]
 
                 # Do not compute the similarity on the diagonal
                 if item_id_second != item_id_input:
                     # Increment similairty
-                    rating_item_second = self.user_to_item_data[self.user_to_item_row_ptr[user_id]+item_index]
-
-                    self.this_item_weights[item_id_second] += rating_item_input*rating_item_second*row_weight
-
+                    self.thread_item_weights[thread_id, item_id_second] += rating_item_input*self.user_to_item_data[item_index]*row_weight
 
                     # Update global data structure
-                    if not self.this_item_weights_mask[item_id_second]:
+                    if not self.thread_item_weights_mask[thread_id, item_id_second]:
 
-                        self.this_item_weights_mask[item_id_second] = True
-                        self.this_item_weights_id[self.this_item_weights_counter] = item_id_second
-                        self.this_item_weights_counter += 1
+                        self.thread_item_weights_mask[thread_id, item_id_second] = True
+                        self.thread_item_weights_id[thread_id, counter] = item_id_second
+                        counter += 1
 
+        return counter
 
 
 
-    def compute_similarity(self, start_col=None, end_col=None):
+
+    cdef void computeItemColumn(self, long item_index, int thread_id, long column_offset,
+                                double[::1] values, int[::1] rows, int[::1] column_nnz) nogil:
         """
-        Compute the similarity for the given Data_manager_split_datasets
-        :param self:
-        :param start_col: column to begin with
-        :param end_col: column to stop before, end_col is excluded
-        :return:
+        Computes the similarity column of item_index, applies normalization and shrinkage and stores its topK values in
+        the segment of the output arrays reserved to the column, or in W_dense if TopK is 0
         """
 
-        cdef int print_block_size = 500
-
-        cdef int item_index, inner_item_index, item_id, local_topK
-        cdef long long topK_item_index
-
-        cdef long long[:] top_k_idx
-
-        # Declare numpy data type to use vetor indexing and simplify the topK selection code
-        cdef np.ndarray[LONG_t, ndim=1] top_k_partition, top_k_partition_sorting
-        cdef np.ndarray[np.float64_t, ndim=1] this_item_weights_np = np.zeros(self.n_columns, dtype=np.float64)
-        #cdef double[:] this_item_weights
+        cdef long inner_item_index, item_id, cell_index
+        cdef int counter, heap_size, local_topK, position, n_positive, n_zero
+        cdef long n_negative_allowed
+        cdef double weight, tmp_value
+        cdef int tmp_item
 
-        cdef long processed_items = 0
-
-        # Data structure to incrementally build sparse matrix
-        # Preinitialize max possible length
-        cdef unsigned long long max_cells = <long long> self.n_columns*self.TopK
-        cdef double[:] values = np.zeros((max_cells))
-        cdef int[:] rows = np.zeros((max_cells,), dtype=np.int32)
-        cdef int[:] cols = np.zeros((max_cells,), dtype=np.int32)
-        cdef long sparse_data_pointer = 0
+        # Computed similarities go in the row thread_id of self.thread_item_weights
+        counter = self.computeItemSimilarities(item_index, thread_id)
 
-        cdef int start_col_local = 0, end_col_local = self.n_columns
+        # Apply normalization and shrinkage, ensure denominator != 0
+        # Only the touched items are divided, the others are zero
+        for inner_item_index in range(counter):
+            item_id = self.thread_item_weights_id[thread_id, inner_item_index]
+            weight = self.thread_item_weights[thread_id, item_id]
 
-        cdef array[double] template_zero = array('d')
+            if self.normalize:
+                if self.asymmetric_cosine:
+                    weight /= self.sum_of_squared_to_alpha[item_index] * self.sum_of_squared_to_1_minus_alpha[item_id]\
+                              + self.shrink + 1e-6
+                else:
+                    weight /= self.sum_of_squared[item_index] * self.sum_of_squared[item_id]\
+                              + self.shrink + 1e-6
 
+            # Apply the specific denominator for Tanimoto
+            elif self.tanimoto_coefficient:
+                weight /= self.sum_of_squared[item_index] + self.sum_of_squared[item_id] - weight + self.shrink + 1e-6
 
+            elif self.dice_coefficient:
+                weight /= self.sum_of_squared[item_index] + self.sum_of_squared[item_id] + self.shrink + 1e-6
 
-        if start_col is not None and start_col>0 and start_col<self.n_columns:
-            start_col_local = start_col
+            elif self.tversky_coefficient:
+                weight /= weight + \
+                          (self.sum_of_squared[item_index]-weight)*self.tversky_alpha + \
+                          (self.sum_of_squared[item_id]-weight)*self.tversky_beta +\
+                          self.shrink + 1e-6
 
-        if end_col is not None and end_col>start_col_local and end_col<self.n_columns:
-            end_col_local = end_col
+            elif self.shrink != 0:
+                weight /= self.shrink
 
+            self.thread_item_weights[thread_id, item_id] = weight
 
 
+        if self.TopK == 0:
 
+            for inner_item_index in range(self.n_columns):
+                self.W_dense[inner_item_index,item_index] = self.thread_item_weights[thread_id, inner_item_index]
 
+        else:
 
-        start_time = time.time()
-        last_print_time = start_time
+            # Select the topK touched items with a min-heap, the root is the worst element kept so far
+            local_topK = min(self.TopK, counter)
+            heap_size = 0
 
-        item_index = start_col_local
+            for inner_item_index in range(counter):
+                item_id = self.thread_item_weights_id[thread_id, inner_item_index]
+                weight = self.thread_item_weights[thread_id, item_id]
 
-        # Compute all similarities for each item
-        while item_index < end_col_local:
+                if heap_size < local_topK:
+                    self.thread_heap_value[thread_id, heap_size] = weight
+                    self.thread_heap_item[thread_id, heap_size] = item_id
+                    heap_size += 1
 
-            processed_items += 1
+                    if heap_size == local_topK:
+                        for position in range(local_topK // 2, -1, -1):
+                            _heap_sift_down(self.thread_heap_value, self.thread_heap_item, thread_id, heap_size, position)
 
-            # Computed similarities go in self.this_item_weights
-            self.computeItemSimilarities(item_index)
+                elif _is_lower(self.thread_heap_value[thread_id, 0], self.thread_heap_item[thread_id, 0], weight, item_id):
+                    self.thread_heap_value[thread_id, 0] = weight
+                    self.thread_heap_item[thread_id, 0] = item_id
+                    _heap_sift_down(self.thread_heap_value, self.thread_heap_item, thread_id, heap_size, 0)
 
+            # Sort the heap by decreasing similarity, moving the root to the end
+            for position in range(heap_size - 1, 0, -1):
+                tmp_value = self.thread_heap_value[thread_id, 0]
+                tmp_item = self.thread_heap_item[thread_id, 0]
+                self.thread_heap_value[thread_id, 0] = self.thread_heap_value[thread_id, position]
+                self.thread_heap_item[thread_id, 0] = self.thread_heap_item[thread_id, position]
+                self.thread_heap_value[thread_id, position] = tmp_value
+                self.thread_heap_item[thread_id, position] = tmp_item
+                _heap_sift_down(self.thread_heap_value, self.thread_heap_item, thread_id, position, 0)
 
-            # Apply normalization and shrinkage, ensure denominator != 0
-            if self.normalize:
-                for inner_item_index in range(self.n_columns):
+            # The topK is selected among all the items, the ones not touched have similarity zero,
+            # so negative similarities are kept only if they rank before all the zeros
+            n_positive = 0
+            n_zero = 0
 
-                    if self.asymmetric_cosine:
-                        self.this_item_weights[inner_item_index] /= self.sum_of_squared_to_alpha[item_index] * self.sum_of_squared_to_1_minus_alpha[inner_item_index]\
-                                                             + self.shrink + 1e-6
+            for position in range(heap_size):
+                if self.thread_heap_value[thread_id, position] > 0.0:
+                    n_positive += 1
+                elif self.thread_heap_value[thread_id, position] == 0.0:
+                    n_zero += 1
 
-                    else:
-                        self.this_item_weights[inner_item_index] /= self.sum_of_squared[item_index] * self.sum_of_squared[inner_item_index]\
-                                                             + self.shrink + 1e-6
+            n_negative_allowed = self.TopK - n_positive - n_zero - (self.n_columns - counter)
 
-            # Apply the specific denominator for Tanimoto
-            elif self.tanimoto_coefficient:
-                for inner_item_index in range(self.n_columns):
-                    self.this_item_weights[inner_item_index] /= self.sum_of_squared[item_index] + self.sum_of_squared[inner_item_index] -\
-                                                         self.this_item_weights[inner_item_index] + self.shrink + 1e-6
+            # Incrementally build sparse matrix, do not add zeros
+            cell_index = column_offset * self.TopK
 
-            elif self.dice_coefficient:
-                for inner_item_index in range(self.n_columns):
-                    self.this_item_weights[inner_item_index] /= self.sum_of_squared[item_index] + self.sum_of_squared[inner_item_index] +\
-                                                         self.shrink + 1e-6
+            for position in range(heap_size):
+                weight = self.thread_heap_value[thread_id, position]
 
-            elif self.tversky_coefficient:
-                for inner_item_index in range(self.n_columns):
-                    self.this_item_weights[inner_item_index] /= self.this_item_weights[inner_item_index] + \
-                                                              (self.sum_of_squared[item_index]-self.this_item_weights[inner_item_index])*self.tversky_alpha + \
-                                                              (self.sum_of_squared[inner_item_index]-self.this_item_weights[inner_item_index])*self.tversky_beta +\
-                                                              self.shrink + 1e-6
+                if weight > 0.0 or (weight < 0.0 and n_negative_allowed > 0):
 
-            elif self.shrink != 0:
-                for inner_item_index in range(self.n_columns):
-                    self.this_item_weights[inner_item_index] /= self.shrink
+                    if weight < 0.0:
+                        n_negative_allowed -= 1
 
+                    values[cell_index] = weight
+                    rows[cell_index] = self.thread_heap_item[thread_id, position]
+                    cell_index += 1
 
-            if self.TopK == 0:
+            column_nnz[column_offset] = cell_index - column_offset * self.TopK
 
-                for inner_item_index in range(self.n_columns):
-                    self.W_dense[inner_item_index,item_index] = self.this_item_weights[inner_item_index]
 
-            else:
+        # Clean the scratch buffers for the next column of the thread
+        for inner_item_index in range(counter):
+            item_id = self.thread_item_weights_id[thread_id, inner_item_index]
+            self.thread_item_weights_mask[thread_id, item_id] = False
+            self.thread_item_weights[thread_id, item_id] = 0.0
 
-                # Sort indices and select TopK
-                # Using numpy implies some overhead, unfortunately the plain C qsort function is even slower
-                #top_k_idx = np.argsort(this_item_weights) [-self.TopK:]
 
-                # Sorting is done in three steps. Faster then plain np.argsort for higher number of items
-                # because we avoid sorting elements we already know we don't care about
-                # - Partition the data to extract the set of TopK items, this set is unsorted
-                # - Sort only the TopK items, discarding the rest
-                # - Get the original item index
-                #
 
 
+    def compute_similarity(self, start_col=None, end_col=None):
+        """
+        Compute the similarity for the given Data_manager_split_datasets
+        The columns are computed in parallel by n_threads threads with OpenMP, each with its own scratch buffers,
+        and each column writes its topK values in a segment of the output arrays, which are joined at the end
+        :param self:
+        :param start_col: column to begin with
+        :param end_col: column to stop before, end_col is excluded
+        :return:
+        """
 
-                #this_item_weights_np = clone(template_zero, self.this_item_weights_counter, zero=False)
-                for inner_item_index in range(self.n_columns):
-                    this_item_weights_np[inner_item_index] = 0.0
+        cdef long print_block_size = 500
 
+        cdef long item_index, block_start, block_end
 
-                # Add weights in the same ordering as the self.this_item_weights_id data structure
-                for inner_item_index in range(self.this_item_weights_counter):
-                    item_id = self.this_item_weights_id[inner_item_index]
-                    this_item_weights_np[inner_item_index] = - self.this_item_weights[item_id]
+        cdef long processed_items = 0
 
+        cdef int start_col_local = 0, end_col_local = self.n_columns
 
-                local_topK = min([self.TopK, self.this_item_weights_counter])
 
-                # Get the unordered set of topK items
-                top_k_partition = np.argpartition(this_item_weights_np, local_topK-1)[0:local_topK]
-                # Sort only the elements in the partition
-                top_k_partition_sorting = np.argsort(this_item_weights_np[top_k_partition])
-                # Get original index
-                top_k_idx = top_k_partition[top_k_partition_sorting]
+        if start_col is not None and start_col>0 and start_col<self.n_columns:
+            start_col_local = start_col
 
+        if end_col is not None and end_col>start_col_local and end_col<self.n_columns:
+            end_col_local = end_col
 
 
-                # Incrementally build sparse matrix, do not add zeros
-                for inner_item_index in range(len(top_k_idx)):
+        # Data structure to incrementally build sparse matrix
+        # Preinitialize max possible length, each column has a segment of TopK cells
+        cdef long n_block_columns = end_col_local - start_col_local
+        cdef long max_cells = n_block_columns*self.TopK
 
-                    topK_item_index = top_k_idx[inner_item_index]
+        cdef np.ndarray[np.float64_t, ndim=1] values_np = np.zeros(max_cells, dtype=np.float64)
+        cdef np.ndarray[np.int32_t, ndim=1] rows_np = np.zeros(max_cells, dtype=np.int32)
+        cdef np.ndarray[np.int32_t, ndim=1] column_nnz_np = np.zeros(max(n_block_columns, 1), dtype=np.int32)
 
-                    item_id = self.this_item_weights_id[topK_item_index]
+        cdef double[::1] values = values_np
+        cdef int[::1] rows = rows_np
+        cdef int[::1] column_nnz = column_nnz_np
 
-                    if self.this_item_weights[item_id] != 0.0:
 
-                        values[sparse_data_pointer] = self.this_item_weights[item_id]
-                        rows[sparse_data_pointer] = item_id
-                        cols[sparse_data_pointer] = item_index
+        start_time = time.time()
+        last_print_time = start_time
 
-                        sparse_data_pointer += 1
+        block_start = start_col_local
 
+        # Compute all similarities for each item, in blocks to print the progress
+        while block_start < end_col_local:
 
-            item_index += 1
+            block_end = min(block_start + print_block_size, end_col_local)
 
+            for item_index in prange(block_start, block_end, nogil=True, schedule='dynamic', num_threads=self.n_threads):
+                self.computeItemColumn(item_index, threadid(), item_index - start_col_local, values, rows, column_nnz)
 
-            if processed_items % print_block_size==0 or processed_items==end_col_local:
+            processed_items += block_end - block_start
+            block_start = block_end
 
-                current_time = time.time()
+            current_time = time.time()
 
-                # Set block size to the number of items necessary in order to print every 300 seconds
-                if current_time - start_time != 0:
-                    items_per_sec = processed_items/(current_time - start_time)
-                else:
-                    items_per_sec = 1
+            # Set block size to the number of items necessary in order to print every 300 seconds
+            if current_time - start_time != 0:
+                items_per_sec = processed_items/(current_time - start_time)
+            else:
+                items_per_sec = 1
 
-                print_block_size = int(items_per_sec*300)
+            print_block_size = max(int(items_per_sec*300), 1)
 
-                if current_time - last_print_time > 300  or processed_items==end_col_local:
-                    new_time_value, new_time_unit = seconds_to_biggest_unit(time.time() - start_time)
+            if current_time - last_print_time > 300  or block_end==end_col_local:
+                new_time_value, new_time_unit = seconds_to_biggest_unit(time.time() - start_time)
 
-                    print("Similarity column {} ({:4.1f}%), {:.2f} column/sec. Elapsed time {:.2f} {}".format(
-                        processed_items, processed_items*1.0/(end_col_local-start_col_local)*100, items_per_sec, new_time_value, new_time_unit))
+                print("Similarity column {} ({:4.1f}%), {:.2f} column/sec. Elapsed time {:.2f} {}".format(
+                    processed_items, processed_items*1.0/(end_col_local-start_col_local)*100, items_per_sec, new_time_value, new_time_unit))
 
-                    last_print_time = current_time
+                last_print_time = current_time
 
-                    sys.stdout.flush()
-                    sys.stderr.flush()
+                sys.stdout.flush()
+                sys.stderr.flush()
 
         # End while on columns
 
@@ -600,12 +649,14 @@ cdef class Compute_Similarity_Cython:
 
         else:
 
-            values = np.array(values[0:sparse_data_pointer])
-            rows = np.array(rows[0:sparse_data_pointer])
-            cols = np.array(cols[0:sparse_data_pointer])
+            # Join the segments of the columns, already grouped by column, in a CSC matrix
+            indptr = np.zeros(self.n_columns + 1, dtype=np.int64)
+            np.cumsum(column_nnz_np[:n_block_columns], out=indptr[start_col_local + 1:end_col_local + 1])
+            indptr[end_col_local + 1:] = indptr[end_col_local]
+
+            cell_mask = (np.arange(self.TopK) < column_nnz_np[:n_block_columns, None]).ravel()
 
-            W_sparse = sps.csr_matrix((values, (rows, cols)),
-                                    shape=(self.n_columns, self.n_columns),
-                                    dtype=np.float32)
+            W_sparse = sps.csc_matrix((values_np[cell_mask].astype(np.float32), rows_np[cell_mask], indptr),
+                                      shape=(self.n_columns, self.n_columns))
 
-            return W_sparse
+            return W_sparse.tocsr()
@@ -0,0 +1,353 @@
+#cython: boundscheck=False
+#cython: wraparound=False
+#cython: initializedcheck=False
+#cython: language_level=3
+#cython: nonecheck=False
+#cython: cdivision=True
+#cython: overflowcheck=False
+
+"""
+Created on 18/10/26
+"""
+
+
+import numpy as np
+cimport numpy as np
+
+from libc.stdlib cimport malloc, realloc, free, qsort
+
+
+cdef int _compare_int(const void* a, const void* b) nogil:
+    cdef int value_a = (<int*> a)[0]
+    cdef int value_b = (<int*> b)[0]
+    return (value_a > value_b) - (value_a < value_b)
+
+
+cdef inline void _heap_sift_down(double[::1] heap_value, int heap_size, int position) nogil:
+
+    cdef int child, smallest
+    cdef double tmp_value
+
+    while True:
+        smallest = position
+        child = 2*position + 1
+
+        if child < heap_size and heap_value[child] < heap_value[smallest]:
+            smallest = child
+
+        child += 1
+
+        if child < heap_size and heap_value[child] < heap_value[smallest]:
+            smallest = child
+
+        if smallest == position:
+            return
+
+        tmp_value = heap_value[position]
+        heap_value[position] = heap_value[smallest]
+        heap_value[smallest] = tmp_value
+
+        position = smallest
+
+
+cdef inline int _heap_push(double[::1] heap_value, int heap_size, int topK, double value) nogil:
+    """
+    Adds the value to a min-heap of the topK largest values, the root is the smallest of them
+    :return: the new heap size
+    """
+
+    cdef int position, parent
+    cdef double tmp_value
+
+    if heap_size < topK:
+        heap_value[heap_size] = value
+        position = heap_size
+
+        while position > 0:
+            parent = (position - 1) // 2
+
+            if heap_value[parent] <= heap_value[position]:
+                break
+
+            tmp_value = heap_value[position]
+            heap_value[position] = heap_value[parent]
+            heap_value[parent] = tmp_value
+            position = parent
+
+        return heap_size + 1
+
+    if value > heap_value[0]:
+        heap_value[0] = value
+        _heap_sift_down(heap_value, heap_size, 0)
+
+    return heap_size
+
+
+
+def compute_candidates_block(csc_indptr, csc_indices, csc_data, csr_indptr, csr_indices, csr_data,
+                             norm, norm_rank, column_of_rank, int candidate_topK, int start_col, int end_col):
+    """
+    Computes the dot products of the columns [start_col, end_col) of the data with all the other columns and keeps,
+    for each column, the candidates which can be in the topK of any similarity derived from them, with topK <= candidate_topK.
+
+    The similarities derived from the dot product d and the norm n of the other column increase with d and do not
+    increase with n, therefore if candidate_topK other columns have both a strictly higher d and a strictly lower n
+    a column can never be in the topK and is discarded, ties included.
+    The columns are visited by increasing norm while a min-heap keeps the candidate_topK largest dot products
+    of the columns with a strictly lower norm.
+    The whole computation releases the GIL so that different blocks can be computed by different threads.
+
+    :param csc_indptr, csc_indices, csc_data:   CSC arrays of the data |rows|x|columns|, data is float64
+    :param csr_indptr, csr_indices, csr_data:   CSR arrays of the same data
+    :param norm:                                float64 array |columns|, norm of each column
+    :param norm_rank:                           int32 array |columns|, position of each column sorted by norm
+    :param column_of_rank:                      int32 array |columns|, the inverse permutation
+    :return:    col_nnz, int32 array (end_col - start_col), number of candidates of each column
+                rows, int32 array, other column of each candidate, columns one after the other
+                dot, float64 array, dot product of each candidate
+    """
+
+    cdef int[::1] csc_indptr_view = csc_indptr
+    cdef int[::1] csc_indices_view = csc_indices
+    cdef double[::1] csc_data_view = csc_data
+
+    cdef int[::1] csr_indptr_view = csr_indptr
+    cdef int[::1] csr_indices_view = csr_indices
+    cdef double[::1] csr_data_view = csr_data
+
+    cdef double[::1] norm_view = norm
+    cdef int[::1] norm_rank_view = norm_rank
+    cdef int[::1] column_of_rank_view = column_of_rank
+
+    cdef int n_columns = len(norm)
+
+    cdef np.ndarray[np.int32_t, ndim=1] col_nnz = np.zeros(end_col - start_col, dtype=np.int32)
+    cdef int[::1] col_nnz_view = col_nnz
+
+    # Sparse accumulator, only the touched cells are reset after each column
+    cdef double[::1] accumulator = np.zeros(n_columns, dtype=np.float64)
+    cdef int[::1] touched_mask = np.zeros(n_columns, dtype=np.int32)
+    cdef int[::1] touched_list = np.zeros(max(n_columns, 1), dtype=np.int32)
+
+    cdef double[::1] heap_value = np.zeros(max(candidate_topK, 1), dtype=np.float64)
+
+    # The number of candidates is not known in advance, the buffers grow as needed
+    cdef long capacity = max(<long> (end_col - start_col) * candidate_topK, 1)
+    cdef int* rows_buffer = <int*> malloc(capacity * sizeof(int))
+    cdef double* dot_buffer = <double*> malloc(capacity * sizeof(double))
+    cdef int* rows_resized
+    cdef double* dot_resized
+    cdef bint out_of_memory = rows_buffer == NULL or dot_buffer == NULL
+
+    cdef int col, row_index, row, other_index, other, touched_index, n_touched, heap_size, group_start, group_end
+    cdef long n_cells = 0, n_cells_col_start
+    cdef double value, row_value
+
+    with nogil:
+
+        for col in range(start_col, end_col):
+
+            if out_of_memory:
+                break
+
+            n_touched = 0
+
+            for row_index in range(csc_indptr_view[col], csc_indptr_view[col + 1]):
+
+                row = csc_indices_view[row_index]
+                row_value = csc_data_view[row_index]
+
+                for other_index in range(csr_indptr_view[row], csr_indptr_view[row + 1]):
+
+                    other = csr_indices_view[other_index]
+
+                    # Do not compute the similarity on the diagonal
+                    if other == col:
+                        continue
+
+                    if not touched_mask[other]:
+                        touched_mask[other] = True
+                        touched_list[n_touched] = other
+                        n_touched += 1
+
+                    accumulator[other] += row_value * csr_data_view[other_index]
+
+
+            # All the candidates fit, otherwise the columns are sorted by norm
+            if n_touched > candidate_topK:
+
+                for touched_index in range(n_touched):
+                    touched_list[touched_index] = norm_rank_view[touched_list[touched_index]]
+
+                qsort(&touched_list[0], n_touched, sizeof(int), _compare_int)
+
+                for touched_index in range(n_touched):
+                    touched_list[touched_index] = column_of_rank_view[touched_list[touched_index]]
+
+            if n_cells + n_touched > capacity:
+                capacity = 2 * (n_cells + n_touched)
+                rows_resized = <int*> realloc(rows_buffer, capacity * sizeof(int))
+                dot_resized = <double*> realloc(dot_buffer, capacity * sizeof(double))
+
+                if rows_resized != NULL:
+                    rows_buffer = rows_resized
+                if dot_resized != NULL:
+                    dot_buffer = dot_resized
+
+                if rows_resized == NULL or dot_resized == NULL:
+                    out_of_memory = True
+                    break
+
+            n_cells_col_start = n_cells
+            heap_size = 0
+            group_start = 0
+
+            while group_start < n_touched:
+
+                # Columns with the same norm do not dominate each other and are tested before being added to the heap
+                group_end = group_start + 1
+
+                while n_touched > candidate_topK and group_end < n_touched and \
+                        norm_view[touched_list[group_end]] == norm_view[touched_list[group_start]]:
+                    group_end += 1
+
+                for touched_index in range(group_start, group_end):
+                    other = touched_list[touched_index]
+                    value = accumulator[other]
+
+                    if value != 0.0 and (heap_size < candidate_topK or value >= heap_value[0]):
+                        rows_buffer[n_cells] = other
+                        dot_buffer[n_cells] = value
+                        n_cells += 1
+
+                for touched_index in range(group_start, group_end):
+                    other = touched_list[touched_index]
+                    value = accumulator[other]
+
+                    if value != 0.0 and n_touched > candidate_topK:
+                        heap_size = _heap_push(heap_value, heap_size, candidate_topK, value)
+
+                    accumulator[other] = 0.0
+                    touched_mask[other] = False
+
+                group_start = group_end
+
+            col_nnz_view[col - start_col] = n_cells - n_cells_col_start
+
+
+    if out_of_memory:
+        free(rows_buffer)
+        free(dot_buffer)
+        raise MemoryError("Compute_Similarity_Sweep: unable to allocate the candidate buffers")
+
+    rows = np.empty(n_cells, dtype=np.int32)
+    dot = np.empty(n_cells, dtype=np.float64)
+
+    if n_cells > 0:
+        rows[:] = <int[:n_cells]> rows_buffer
+        dot[:] = <double[:n_cells]> dot_buffer
+
+    free(rows_buffer)
+    free(dot_buffer)
+
+    return col_nnz, rows, dot
+
+
+
+cdef inline bint _is_lower(double value_1, long index_1, double value_2, long index_2) nogil:
+    # Ties are broken in favour of the lower index, which is therefore considered the "higher" one
+    return value_1 < value_2 or (value_1 == value_2 and index_1 > index_2)
+
+
+cdef inline void _indexed_heap_sift_down(double[::1] heap_value, long[::1] heap_index, int heap_size, int position) nogil:
+
+    cdef int child, smallest
+    cdef double tmp_value
+    cdef long tmp_index
+
+    while True:
+        smallest = position
+        child = 2*position + 1
+
+        if child < heap_size and _is_lower(heap_value[child], heap_index[child], heap_value[smallest], heap_index[smallest]):
+            smallest = child
+
+        child += 1
+
+        if child < heap_size and _is_lower(heap_value[child], heap_index[child], heap_value[smallest], heap_index[smallest]):
+            smallest = child
+
+        if smallest == position:
+            return
+
+        tmp_value = heap_value[position]
+        tmp_index = heap_index[position]
+        heap_value[position] = heap_value[smallest]
+        heap_index[position] = heap_index[smallest]
+        heap_value[smallest] = tmp_value
+        heap_index[smallest] = tmp_index
+
+        position = smallest
+
+
+
+def select_topK_candidates(col_indptr, values, int topK):
+    """
+    Selects the topK nonzero values of each column among its candidates, columns with at most topK candidates
+    keep all the nonzero ones. A min-heap is built on the first topK candidates of the column and updated with the others.
+
+    :param col_indptr:  int64 array |columns + 1|, candidates of each column, as in a CSC matrix
+    :param values:      float64 array, similarity of each candidate
+    :return:            int64 array, positions of the selected candidates
+    """
+
+    cdef long[::1] col_indptr_view = col_indptr
+    cdef double[::1] values_view = values
+
+    cdef int n_columns = len(col_indptr) - 1
+
+    cdef np.ndarray[np.int64_t, ndim=1] selected = np.zeros(min(len(values), <long> n_columns * topK), dtype=np.int64)
+    cdef long[::1] selected_view = selected
+
+    cdef double[::1] heap_value = np.zeros(max(topK, 1), dtype=np.float64)
+    cdef long[::1] heap_index = np.zeros(max(topK, 1), dtype=np.int64)
+
+    cdef int col, heap_size, position
+    cdef long index, n_selected = 0
+
+    with nogil:
+
+        for col in range(n_columns):
+
+            if col_indptr_view[col + 1] - col_indptr_view[col] <= topK:
+                for index in range(col_indptr_view[col], col_indptr_view[col + 1]):
+                    if values_view[index] != 0.0:
+                        selected_view[n_selected] = index
+                        n_selected += 1
+                continue
+
+            heap_size = 0
+
+            for index in range(col_indptr_view[col], col_indptr_view[col + 1]):
+
+                if heap_size < topK:
+                    heap_value[heap_size] = values_view[index]
+                    heap_index[heap_size] = index
+                    heap_size += 1
+
+                    if heap_size == topK:
+                        for position in range(topK // 2, -1, -1):
+                            _indexed_heap_sift_down(heap_value, heap_index, heap_size, position)
+
+                elif _is_lower(heap_value[0], heap_index[0], values_view[index], index):
+                    heap_value[0] = values_view[index]
+                    heap_index[0] = index
+                    _indexed_heap_sift_down(heap_value, heap_index, heap_size, 0)
+
+            for position in range(heap_size):
+                if heap_value[position] != 0.0:
+                    selected_view[n_selected] = heap_index[position]
+                    n_selected += 1
+
+
+    return selected[:n_selected]
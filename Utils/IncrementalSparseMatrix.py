@@ -331,3 +331,233 @@ class IncrementalSparseMatrix_FilterIDs(IncrementalSparseMatrix):
         self._n_cols = len(self._column_original_ID_to_index)
 
         return super(IncrementalSparseMatrix_FilterIDs, self).get_SparseMatrix()
+
+
+
+import os, tempfile
+
+
+def _get_unique_subfolder(folder_path, prefix):
+    """
+    Creates a new subfolder of folder_path, so a matrix never overwrites the files of another one,
+    which might still be memory-mapped
+    """
+
+    os.makedirs(folder_path, exist_ok=True)
+
+    return tempfile.mkdtemp(prefix=prefix, dir=folder_path)
+
+
+class IncrementalSparseMatrix_Blocks(object):
+    """
+    Builds a sparse matrix appending blocks of consecutive rows, in CSR format, or of consecutive columns, in CSC format,
+    as the similarities are computed, so the matrix is built directly in its format without a COO to CSR conversion.
+
+    If folder_path is None the blocks are kept in memory and joined at the end.
+    Otherwise the blocks are buffered in memory and appended to the files indices.bin and data.bin in a new subfolder
+    of folder_path each time they exceed memory_budget_MB, the final matrix uses memory-mapped arrays of those files,
+    so its size is limited by the disk rather than by the memory. Since each matrix has its own subfolder, building
+    a new one never changes a matrix still in use. The files are not removed, folder_path should be deleted once
+    its matrices are no longer used.
+    """
+
+    def __init__(self, n_rows, n_cols, format="csr", dtype=np.float32, folder_path=None, memory_budget_MB=1024):
+
+        super(IncrementalSparseMatrix_Blocks, self).__init__()
+
+        assert format in ["csr", "csc"], \
+            "IncrementalSparseMatrix_Blocks: format value not recognized, allowed values are 'csr', 'csc', provided was '{}'".format(format)
+
+        self._shape = (n_rows, n_cols)
+        self._format = format
+        self._n_major, self._n_minor = self._shape if format == "csr" else self._shape[::-1]
+
+        self._dtype_data = np.dtype(dtype)
+        self._dtype_indices = np.dtype(np.int32 if self._n_minor <= np.iinfo(np.int32).max else np.int64)
+
+        self._folder_path = folder_path
+        self._memory_budget = int(memory_budget_MB * 2**20)
+
+        self._major_nnz_list = []
+        self._indices_list = []
+        self._data_list = []
+        self._buffer_bytes = 0
+        self._n_major_added = 0
+        self._nnz = 0
+
+        if self._folder_path is not None:
+            self._folder_path = _get_unique_subfolder(self._folder_path, "matrix_")
+
+            for file_name in ["indices.bin", "data.bin"]:
+                open(os.path.join(self._folder_path, file_name), "wb").close()
+
+    def get_nnz(self):
+        return self._nnz
+
+    def add_block(self, major_nnz, indices, data):
+        """
+        Appends len(major_nnz) rows (columns) after the ones already added
+        :param major_nnz:   number of values of each row (column) of the block
+        :param indices:     column (row) of each value, rows (columns) one after the other
+        :param data:        the values
+        """
+
+        major_nnz = np.asarray(major_nnz, dtype=np.int64)
+
+        assert self._n_major_added + len(major_nnz) <= self._n_major, \
+            "IncrementalSparseMatrix_Blocks: the block exceeds the {} {} of the matrix".format(
+                self._n_major, "rows" if self._format == "csr" else "columns")
+
+        assert major_nnz.sum() == len(indices) and len(indices) == len(data), \
+            "IncrementalSparseMatrix_Blocks: the block has {} values, {} indices and {} data".format(
+                major_nnz.sum(), len(indices), len(data))
+
+        self._major_nnz_list.append(major_nnz)
+        self._indices_list.append(np.asarray(indices, dtype=self._dtype_indices))
+        self._data_list.append(np.asarray(data, dtype=self._dtype_data))
+
+        self._n_major_added += len(major_nnz)
+        self._nnz += len(indices)
+        self._buffer_bytes += self._indices_list[-1].nbytes + self._data_list[-1].nbytes
+
+        if self._folder_path is not None and self._buffer_bytes >= self._memory_budget:
+            self._flush()
+
+    def add_empty(self, n_major):
+        """
+        Appends n_major empty rows (columns)
+        """
+        self.add_block(np.zeros(n_major, dtype=np.int64), [], [])
+
+    def _flush(self):
+
+        for file_name, array_list in [("indices.bin", self._indices_list), ("data.bin", self._data_list)]:
+            with open(os.path.join(self._folder_path, file_name), "ab") as file:
+                for array in array_list:
+                    array.tofile(file)
+
+        self._indices_list = []
+        self._data_list = []
+        self._buffer_bytes = 0
+
+    def _get_indptr(self):
+
+        indptr = np.zeros(self._n_major + 1, dtype=np.int64)
+
+        if len(self._major_nnz_list) > 0:
+            np.cumsum(np.concatenate(self._major_nnz_list), out=indptr[1:self._n_major_added + 1])
+
+        # The rows (columns) not added are empty
+        indptr[self._n_major_added + 1:] = indptr[self._n_major_added]
+
+        if self._nnz <= np.iinfo(np.int32).max and self._dtype_indices == np.int32:
+            indptr = indptr.astype(np.int32)
+
+        return indptr
+
+    def _get_arrays(self):
+
+        if self._folder_path is None or self._nnz == 0:
+            indices = np.concatenate(self._indices_list) if self._indices_list else np.zeros(0, dtype=self._dtype_indices)
+            data = np.concatenate(self._data_list) if self._data_list else np.zeros(0, dtype=self._dtype_data)
+
+            return self._get_indptr(), indices, data
+
+        self._flush()
+
+        indices = np.memmap(os.path.join(self._folder_path, "indices.bin"), dtype=self._dtype_indices, mode="r+", shape=(self._nnz,))
+        data = np.memmap(os.path.join(self._folder_path, "data.bin"), dtype=self._dtype_data, mode="r+", shape=(self._nnz,))
+
+        return self._get_indptr(), indices, data
+
+    def get_SparseMatrix(self, format=None):
+        """
+        :param format:  "csr" or "csc", by default the one the matrix is built in.
+                        In the other format the matrix is converted in memory or, if it is on disk,
+                        with sparse_matrix_to_format_on_disk in the subfolder named as the format
+        :return:        the sparse matrix, its indices and data are memory-mapped if folder_path is not None
+        """
+
+        format = self._format if format is None else format
+        indptr, indices, data = self._get_arrays()
+
+        if format == self._format:
+            matrix_class = sps.csr_matrix if format == "csr" else sps.csc_matrix
+            return matrix_class((data, indices, indptr), shape=self._shape, copy=False)
+
+        matrix_class = sps.csr_matrix if self._format == "csr" else sps.csc_matrix
+        sparseMatrix = matrix_class((data, indices, indptr), shape=self._shape, copy=False)
+
+        if self._folder_path is None or self._nnz == 0:
+            return sparseMatrix.tocsc() if format == "csc" else sparseMatrix.tocsr()
+
+        return sparse_matrix_to_format_on_disk(sparseMatrix, format, os.path.join(self._folder_path, format),
+                                               memory_budget_MB=self._memory_budget / 2**20)
+
+
+
+def sparse_matrix_to_format_on_disk(sparseMatrix, format, folder_path, memory_budget_MB=1024):
+    """
+    Converts a CSR matrix in CSC or vice versa, e.g., one memory-mapped by IncrementalSparseMatrix_Blocks, without
+    loading it in memory. The values are processed in chunks which fit the memory budget and written in their final
+    position of the memory-mapped files indices.bin and data.bin in a new subfolder of folder_path.
+    Since the rows (columns) are visited in order, the indices of the result are sorted.
+    :return: the sparse matrix in the given format, its indices and data are memory-mapped
+    """
+
+    assert format in ["csr", "csc"], \
+        "sparse_matrix_to_format_on_disk: format value not recognized, allowed values are 'csr', 'csc', provided was '{}'".format(format)
+
+    if sparseMatrix.format == format:
+        return sparseMatrix
+
+    assert sparseMatrix.format in ["csr", "csc"], \
+        "sparse_matrix_to_format_on_disk: the matrix must be either CSR or CSC, provided was '{}'".format(sparseMatrix.format)
+
+    n_major, n_minor = sparseMatrix.shape if sparseMatrix.format == "csr" else sparseMatrix.shape[::-1]
+    indptr, indices, data = sparseMatrix.indptr, sparseMatrix.indices, sparseMatrix.data
+    nnz = int(indptr[-1])
+
+    # About 64 bytes of temporary arrays for each value of the chunk
+    chunk_size = max(int(memory_budget_MB * 2**20) // 64, 1)
+
+    out_major_nnz = np.zeros(n_minor, dtype=np.int64)
+
+    for chunk_start in range(0, nnz, chunk_size):
+        out_major_nnz += np.bincount(indices[chunk_start:chunk_start + chunk_size], minlength=n_minor)
+
+    out_indptr = np.zeros(n_minor + 1, dtype=np.int64)
+    np.cumsum(out_major_nnz, out=out_indptr[1:])
+    next_position = out_indptr[:-1].copy()
+
+    folder_path = _get_unique_subfolder(folder_path, format + "_")
+
+    out_indices_dtype = np.int32 if n_major <= np.iinfo(np.int32).max else np.int64
+    out_indices = np.memmap(os.path.join(folder_path, "indices.bin"), dtype=out_indices_dtype, mode="w+", shape=(max(nnz, 1),))[:nnz]
+    out_data = np.memmap(os.path.join(folder_path, "data.bin"), dtype=data.dtype, mode="w+", shape=(max(nnz, 1),))[:nnz]
+
+    for chunk_start in range(0, nnz, chunk_size):
+        chunk_end = min(chunk_start + chunk_size, nnz)
+
+        chunk_major = np.searchsorted(indptr, np.arange(chunk_start, chunk_end), side="right") - 1
+        chunk_minor = np.asarray(indices[chunk_start:chunk_end])
+
+        # Within the chunk the values of each output row (column) keep their order,
+        # their position is the next free one of that row (column) plus their rank within the chunk
+        sorting = np.argsort(chunk_minor, kind="stable")
+        sorted_minor = chunk_minor[sorting]
+        position = next_position[sorted_minor] + np.arange(chunk_end - chunk_start) - np.searchsorted(sorted_minor, sorted_minor)
+
+        out_indices[position] = chunk_major[sorting]
+        out_data[position] = np.asarray(data[chunk_start:chunk_end])[sorting]
+
+        next_position += np.bincount(chunk_minor, minlength=n_minor)
+
+    out_indices.flush()
+    out_data.flush()
+
+    if nnz <= np.iinfo(np.int32).max and out_indices_dtype == np.int32:
+        out_indptr = out_indptr.astype(np.int32)
+
+    matrix_class = sps.csr_matrix if format == "csr" else sps.csc_matrix
+    return matrix_class((out_data, out_indices, out_indptr), shape=sparseMatrix.shape, copy=False)
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 18/10/26
+"""
+
+import unittest, shutil, tempfile
+
+import numpy as np
+import scipy.sparse as sps
+
+from Utils.IncrementalSparseMatrix import IncrementalSparseMatrix_Blocks, sparse_matrix_to_format_on_disk
+
+
+def get_matrix(random_seed, n_rows=300, n_cols=200, density=0.05):
+
+    return sps.random(n_rows, n_cols, density=density, format="csr", dtype=np.float32,
+                      random_state=np.random.RandomState(random_seed))
+
+
+def is_memory_mapped(array):
+
+    while array is not None and not isinstance(array, np.memmap):
+        array = array.base
+
+    return array is not None
+
+
+def build_on_disk(matrix, folder_path):
+
+    builder = IncrementalSparseMatrix_Blocks(*matrix.shape, format="csr", folder_path=folder_path, memory_budget_MB=0.01)
+
+    for start_row in range(0, matrix.shape[0], 50):
+        block = matrix[start_row:start_row + 50]
+        builder.add_block(np.ediff1d(block.indptr), block.indices, block.data)
+
+    return builder.get_SparseMatrix()
+
+
+class MyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.folder_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder_path, ignore_errors=True)
+
+
+    def test_blocks_on_disk_same_as_in_memory(self):
+
+        matrix = get_matrix(0)
+        matrix_disk = build_on_disk(matrix, self.folder_path)
+
+        self.assertTrue(is_memory_mapped(matrix_disk.data))
+        self.assertTrue(np.array_equal(matrix_disk.toarray(), matrix.toarray()))
+
+        matrix_csc = sparse_matrix_to_format_on_disk(matrix_disk, "csc", self.folder_path)
+
+        self.assertEqual(matrix_csc.format, "csc")
+        self.assertTrue(np.array_equal(matrix_csc.toarray(), matrix.toarray()))
+
+
+    def test_new_matrix_does_not_change_previous_one(self):
+
+        matrix_1, matrix_2 = get_matrix(0), get_matrix(1, density=0.01)
+
+        matrix_disk_1 = build_on_disk(matrix_1, self.folder_path)
+        matrix_csc_1 = sparse_matrix_to_format_on_disk(matrix_disk_1, "csc", self.folder_path)
+
+        # The second matrix has fewer values, rewriting the same files would also truncate the first one
+        matrix_disk_2 = build_on_disk(matrix_2, self.folder_path)
+        matrix_csc_2 = sparse_matrix_to_format_on_disk(matrix_disk_2, "csc", self.folder_path)
+
+        self.assertTrue(np.array_equal(matrix_disk_1.toarray(), matrix_1.toarray()))
+        self.assertTrue(np.array_equal(matrix_csc_1.toarray(), matrix_1.toarray()))
+        self.assertTrue(np.array_equal(matrix_disk_2.toarray(), matrix_2.toarray()))
+        self.assertTrue(np.array_equal(matrix_csc_2.toarray(), matrix_2.toarray()))
+
+
+
+if __name__ == '__main__':
+
+    unittest.main()
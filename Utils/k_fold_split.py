@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 18/10/26
+"""
+
+import os
+import uuid
+
+import numpy as np
+import scipy.sparse as sps
+
+DEFAULT_CACHE_FOLDER = "./result_experiments/k_fold_assignments/"
+
+
+def get_k_fold_assignment(n_interactions, k, seed=0, cache_folder=DEFAULT_CACHE_FOLDER):
+    """
+    Assigns each interaction to one of k folds of the same size, shuffled with the given seed.
+    As the splits did before, the global numpy generator is left in the state it has after np.random.seed(seed)
+    and the shuffle, so the code relying on the global generator after the split behaves as before.
+    The assignment and that state are stored in the cache folder, keyed by number of interactions, k and seed,
+    and loaded from there by the following calls
+    :param cache_folder:    if None the assignment is neither loaded nor stored
+    :return:                int array (n_interactions), fold of each interaction
+    """
+
+    if cache_folder is not None:
+        file_path = os.path.join(cache_folder, "assignment_n{}_k{}_seed{}.npz".format(n_interactions, k, seed))
+
+        if os.path.isfile(file_path):
+            with np.load(file_path) as cached_data:
+                np.random.set_state(("MT19937", cached_data["state_keys"], int(cached_data["state_pos"]), 0, 0.0))
+                return cached_data["assignment_to_fold"]
+
+    n_interactions_per_fold = int(n_interactions / k) + 1
+    assignment_to_fold = np.arange(k).repeat(n_interactions_per_fold)
+    np.random.seed(seed)
+    np.random.shuffle(assignment_to_fold)
+    assignment_to_fold = assignment_to_fold[:n_interactions].astype(np.int8 if k <= np.iinfo(np.int8).max else np.int32)
+
+    if cache_folder is not None:
+        os.makedirs(cache_folder, exist_ok=True)
+
+        _, state_keys, state_pos, _, _ = np.random.get_state()
+
+        # Written with a temporary name and renamed, so concurrent processes never load a partial file
+        temp_file_path = os.path.join(cache_folder, "__temp_{}.npz".format(uuid.uuid4().hex))
+        np.savez(temp_file_path, assignment_to_fold=assignment_to_fold, state_keys=state_keys, state_pos=state_pos)
+        os.replace(temp_file_path, file_path)
+
+    return assignment_to_fold
+
+
+def _csr_from_sorted_interactions(row, col, data, shape, index_dtype):
+    """
+    Builds the CSR matrix of interactions already sorted by user and item, without the COO to CSR conversion
+    """
+
+    indptr = np.zeros(shape[0] + 1, dtype=index_dtype)
+    np.cumsum(np.bincount(row, minlength=shape[0]), out=indptr[1:])
+
+    URM_csr = sps.csr_matrix((data, col, indptr), shape=shape)
+
+    # Duplicate interactions are summed as the COO to CSR conversion does
+    URM_csr.sum_duplicates()
+
+    return URM_csr
+
+
+def k_fold_split_generator(URM_coo, k, seed=0, cache_folder=DEFAULT_CACHE_FOLDER):
+    """
+    Yields the (URM_train, URM_test) couple of each fold, both CSR, one fold at a time.
+    The folds are the same one would obtain by selecting the interactions of each fold and converting them to CSR.
+    If the interactions are sorted by user and item, as when read from the dataset file, the selected interactions
+    are still sorted and both matrices are built directly in CSR format.
+    Otherwise the interactions are sorted once by fold, so that each fold is a contiguous range.
+    """
+
+    URM_coo = sps.coo_matrix(URM_coo)
+    index_dtype = np.int32 if URM_coo.nnz < np.iinfo(np.int32).max else np.int64
+
+    assignment_to_fold = get_k_fold_assignment(URM_coo.nnz, k, seed=seed, cache_folder=cache_folder)
+
+    key = URM_coo.row.astype(np.int64) * URM_coo.shape[1] + URM_coo.col
+
+    if np.all(key[1:] >= key[:-1]):
+
+        for fold_index in range(k):
+            test_mask = assignment_to_fold == fold_index
+            train_mask = np.logical_not(test_mask)
+
+            URM_train_csr = _csr_from_sorted_interactions(URM_coo.row[train_mask], URM_coo.col[train_mask],
+                                                          URM_coo.data[train_mask], URM_coo.shape, index_dtype)
+            URM_test_csr = _csr_from_sorted_interactions(URM_coo.row[test_mask], URM_coo.col[test_mask],
+                                                         URM_coo.data[test_mask], URM_coo.shape, index_dtype)
+
+            yield URM_train_csr, URM_test_csr
+
+        return
+
+    sorting = np.argsort(assignment_to_fold, kind="stable")
+    row = URM_coo.row[sorting]
+    col = URM_coo.col[sorting]
+    data = URM_coo.data[sorting]
+
+    fold_start = np.searchsorted(assignment_to_fold[sorting], np.arange(k + 1))
+
+    for fold_index in range(k):
+
+        start, end = fold_start[fold_index], fold_start[fold_index + 1]
+
+        URM_train_csr = sps.csr_matrix((np.concatenate((data[:start], data[end:])),
+                                        (np.concatenate((row[:start], row[end:])),
+                                         np.concatenate((col[:start], col[end:])))),
+                                       shape=URM_coo.shape)
+        URM_test_csr = sps.csr_matrix((data[start:end], (row[start:end], col[start:end])), shape=URM_coo.shape)
+
+        yield URM_train_csr, URM_test_csr
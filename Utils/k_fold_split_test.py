@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 18/10/26
+"""
+
+import unittest, shutil, tempfile
+
+import numpy as np
+import scipy.sparse as sps
+
+from Utils.k_fold_split import get_k_fold_assignment, k_fold_split_generator
+
+
+def get_old_assignment(n_interactions, k):
+    """
+    Fold assignment as it was computed before by reader.get_k_folds_URM and give_me_k_folds
+    """
+
+    n_interactions_per_fold = int(n_interactions / k) + 1
+    temp = np.arange(k).repeat(n_interactions_per_fold)
+    np.random.seed(0)
+    np.random.shuffle(temp)
+
+    return temp[:n_interactions]
+
+
+def get_old_folds(URM_coo, k):
+
+    assignment_to_fold = get_old_assignment(URM_coo.nnz, k)
+    fold_list = []
+
+    for i in range(k):
+        train_mask = assignment_to_fold != i
+        test_mask = assignment_to_fold == i
+        URM_train_csr = sps.csr_matrix((URM_coo.data[train_mask], (URM_coo.row[train_mask], URM_coo.col[train_mask])),
+                                       shape=URM_coo.shape)
+        URM_test_csr = sps.csr_matrix((URM_coo.data[test_mask], (URM_coo.row[test_mask], URM_coo.col[test_mask])),
+                                      shape=URM_coo.shape)
+        fold_list.append((URM_train_csr, URM_test_csr))
+
+    return fold_list
+
+
+def get_URM_coo(n_users=400, n_items=300, density=0.05, random_seed=42):
+
+    URM = sps.random(n_users, n_items, density=density, format="csr", dtype=np.float32,
+                     random_state=np.random.RandomState(random_seed))
+
+    return URM.tocoo()
+
+
+class MyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_folder, ignore_errors=True)
+
+
+    def test_assignment_and_random_state_same_as_old_split(self):
+
+        for n_interactions, k in [(1000, 3), (1234, 5), (7, 10)]:
+
+            # The code after the split relied on the global generator being in this state
+            old_assignment = get_old_assignment(n_interactions, k)
+            old_next_value = np.random.rand()
+
+            # First call computes the assignment, second one loads it from the cache
+            for _ in range(2):
+                np.random.seed(123)
+                assignment = get_k_fold_assignment(n_interactions, k, cache_folder=self.cache_folder)
+
+                self.assertTrue(np.array_equal(assignment, old_assignment))
+                self.assertEqual(np.random.rand(), old_next_value)
+
+            assignment = get_k_fold_assignment(n_interactions, k, cache_folder=None)
+            self.assertTrue(np.array_equal(assignment, old_assignment))
+
+
+    def test_folds_same_as_old_split(self):
+
+        URM_coo = get_URM_coo()
+
+        random_order = np.random.RandomState(0).permutation(URM_coo.nnz)
+        URM_coo_unsorted = sps.coo_matrix((URM_coo.data[random_order], (URM_coo.row[random_order], URM_coo.col[random_order])),
+                                          shape=URM_coo.shape)
+
+        # Sorted interactions use the direct CSR construction, the others are sorted by fold
+        for URM_coo_input in [URM_coo, URM_coo_unsorted]:
+
+            old_fold_list = get_old_folds(URM_coo_input, 3)
+            fold_list = list(k_fold_split_generator(URM_coo_input, 3, cache_folder=self.cache_folder))
+
+            self.assertEqual(len(fold_list), len(old_fold_list))
+
+            for (URM_train, URM_test), (old_URM_train, old_URM_test) in zip(fold_list, old_fold_list):
+                for URM, old_URM in [(URM_train, old_URM_train), (URM_test, old_URM_test)]:
+                    self.assertEqual(URM.format, "csr")
+                    self.assertTrue(np.array_equal(URM.indptr, old_URM.indptr))
+                    self.assertTrue(np.array_equal(URM.indices, old_URM.indices))
+                    self.assertTrue(np.array_equal(URM.data, old_URM.data))
+
+
+
+if __name__ == '__main__':
+
+    unittest.main()
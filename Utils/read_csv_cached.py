@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 18/10/26
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import uuid
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sps
+
+DEFAULT_CACHE_FOLDER_NAME = "__csv_cache__"
+
+
+def _get_cache_entry_name(csv_path, read_csv_kwargs, matrix_name=None):
+    """
+    The name is made of the file name, a hash of the path, read_csv arguments and matrix name, which identifies the
+    entries of the same file read in the same way, and a hash of size and modification time of the file.
+    Checking the file status avoids reading the CSV to know whether the cache is stale.
+    :return: prefix of the entries of the same file and arguments, name of the entry
+    """
+
+    csv_stat = os.stat(csv_path)
+
+    source_description = json.dumps([os.path.abspath(csv_path),
+                                     repr(sorted(read_csv_kwargs.items(), key=lambda item: item[0])),
+                                     matrix_name])
+    version_description = json.dumps([csv_stat.st_size, csv_stat.st_mtime_ns])
+
+    cache_entry_prefix = "{}_{}_".format(os.path.basename(csv_path),
+                                         hashlib.sha1(source_description.encode("utf-8")).hexdigest()[:8])
+
+    return cache_entry_prefix, cache_entry_prefix + hashlib.sha1(version_description.encode("utf-8")).hexdigest()[:8]
+
+
+def _load_columns(cache_entry_folder):
+
+    with open(os.path.join(cache_entry_folder, "columns.json"), "r") as file:
+        column_name_list = json.load(file)
+
+    data_dict = {column_name: np.load(os.path.join(cache_entry_folder, "column_{}.npy".format(column_index)),
+                                      mmap_mode="r")
+                 for column_index, column_name in enumerate(column_name_list)}
+
+    return pd.DataFrame(data_dict, columns=column_name_list)
+
+
+def _load_csr(cache_entry_folder):
+
+    with open(os.path.join(cache_entry_folder, "shape.json"), "r") as file:
+        shape = tuple(json.load(file))
+
+    # Copy-on-write, so the matrix can be changed in place without changing the cache
+    indptr, indices, data = [np.load(os.path.join(cache_entry_folder, "{}.npy".format(array_name)), mmap_mode="c")
+                             for array_name in ["indptr", "indices", "data"]]
+
+    return sps.csr_matrix((data, indices, indptr), shape=shape, copy=False)
+
+
+def _store_entry(cache_folder, cache_entry_name, array_dict, json_dict):
+    """
+    The files are written in a private folder which is then renamed, the rename is atomic so other processes
+    either see the complete cache entry or none
+    """
+
+    temp_folder = os.path.join(cache_folder, "__temp_{}".format(uuid.uuid4().hex))
+    os.makedirs(temp_folder)
+
+    try:
+        for array_name, array in array_dict.items():
+            np.save(os.path.join(temp_folder, "{}.npy".format(array_name)), array)
+
+        for json_name, value in json_dict.items():
+            with open(os.path.join(temp_folder, "{}.json".format(json_name)), "w") as file:
+                json.dump(value, file)
+
+        os.rename(temp_folder, os.path.join(cache_folder, cache_entry_name))
+
+    except OSError:
+        # Another process has stored the same entry in the meantime
+        shutil.rmtree(temp_folder, ignore_errors=True)
+
+
+def _store_columns(df, cache_folder, cache_entry_name):
+
+    array_dict = {"column_{}".format(column_index): df[column_name].values
+                  for column_index, column_name in enumerate(df.columns)}
+
+    column_name_list = [column_name if isinstance(column_name, str) else int(column_name) for column_name in df.columns]
+
+    _store_entry(cache_folder, cache_entry_name, array_dict, {"columns": column_name_list})
+
+
+def _remove_old_entries(cache_folder, cache_entry_prefix, cache_entry_name):
+
+    os.makedirs(cache_folder, exist_ok=True)
+
+    for folder_name in os.listdir(cache_folder):
+        if folder_name.startswith(cache_entry_prefix) and folder_name != cache_entry_name:
+            shutil.rmtree(os.path.join(cache_folder, folder_name), ignore_errors=True)
+
+
+def _get_default_cache_folder(csv_path):
+    return os.path.join(os.path.dirname(os.path.abspath(csv_path)), DEFAULT_CACHE_FOLDER_NAME)
+
+
+def read_csv_cached(csv_path, cache_folder=None, **read_csv_kwargs):
+    """
+    Drop-in replacement of pandas.read_csv for numeric CSV files.
+    The first call parses the CSV with pandas.read_csv(csv_path, **read_csv_kwargs) and saves each column as a .npy
+    file in the cache folder, the following calls, from any process, memory-map those files instead of parsing the CSV.
+    The cache entry is keyed by path, size and modification time of the CSV and by the read_csv arguments,
+    the entries of older versions of the same file read with the same arguments are removed.
+
+    :param csv_path:
+    :param cache_folder:        default is a "__csv_cache__" folder next to the CSV
+    :param read_csv_kwargs:     arguments of pandas.read_csv
+    :return:                    DataFrame
+    """
+
+    if cache_folder is None:
+        cache_folder = _get_default_cache_folder(csv_path)
+
+    cache_entry_prefix, cache_entry_name = _get_cache_entry_name(csv_path, read_csv_kwargs)
+    cache_entry_folder = os.path.join(cache_folder, cache_entry_name)
+
+    if os.path.isdir(cache_entry_folder):
+        return _load_columns(cache_entry_folder)
+
+    df = pd.read_csv(csv_path, **read_csv_kwargs)
+
+    # Object columns, e.g., strings, cannot be memory-mapped
+    if any(dtype == object for dtype in df.dtypes):
+        return df
+
+    _remove_old_entries(cache_folder, cache_entry_prefix, cache_entry_name)
+    _store_columns(df, cache_folder, cache_entry_name)
+
+    return df
+
+
+def read_csr_cached(csv_path, build_csr_function, matrix_name, cache_folder=None, **read_csv_kwargs):
+    """
+    Returns the CSR matrix built by build_csr_function from the DataFrame of pandas.read_csv(csv_path, **read_csv_kwargs).
+    The first call saves its indptr, indices and data as .npy files in the cache folder, the following calls, from any
+    process, memory-map them copy-on-write, without parsing the CSV nor converting the matrix from COO to CSR.
+    The cache entry is keyed as in read_csv_cached and by matrix_name, which must identify build_csr_function.
+
+    :param build_csr_function:  function of the DataFrame returning the matrix, converted to CSR
+    :param matrix_name:         name of the matrix built by build_csr_function
+    :param cache_folder:        default is a "__csv_cache__" folder next to the CSV
+    :param read_csv_kwargs:     arguments of pandas.read_csv
+    :return:                    csr_matrix
+    """
+
+    if cache_folder is None:
+        cache_folder = _get_default_cache_folder(csv_path)
+
+    cache_entry_prefix, cache_entry_name = _get_cache_entry_name(csv_path, read_csv_kwargs, matrix_name=matrix_name)
+    cache_entry_folder = os.path.join(cache_folder, cache_entry_name)
+
+    if os.path.isdir(cache_entry_folder):
+        return _load_csr(cache_entry_folder)
+
+    csr_matrix = sps.csr_matrix(build_csr_function(pd.read_csv(csv_path, **read_csv_kwargs)))
+
+    _remove_old_entries(cache_folder, cache_entry_prefix, cache_entry_name)
+    _store_entry(cache_folder, cache_entry_name,
+                 {"indptr": csr_matrix.indptr, "indices": csr_matrix.indices, "data": csr_matrix.data},
+                 {"shape": [int(dimension) for dimension in csr_matrix.shape]})
+
+    return csr_matrix
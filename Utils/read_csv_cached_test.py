@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 18/10/26
+"""
+
+import unittest, os, shutil, tempfile
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sps
+
+from Utils.read_csv_cached import read_csv_cached, read_csr_cached
+
+
+def write_csv(csv_path, random_seed, n_rows=2000):
+
+    random_state = np.random.RandomState(random_seed)
+
+    # Duplicated couples are summed when the matrix is built
+    pd.DataFrame({"row": random_state.randint(0, 300, n_rows),
+                  "col": random_state.randint(0, 100, n_rows),
+                  "data": random_state.randint(1, 5, n_rows)}).to_csv(csv_path, index=False)
+
+
+def build_csr(df):
+    return sps.csr_matrix((df["data"].values, (df["row"].values, df["col"].values)), dtype=np.int32)
+
+
+class MyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.folder_path = tempfile.mkdtemp()
+        self.csv_path = os.path.join(self.folder_path, "data.csv")
+        write_csv(self.csv_path, 0)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder_path, ignore_errors=True)
+
+
+    def test_read_csv_cached_same_as_read_csv(self):
+
+        df = pd.read_csv(self.csv_path)
+
+        for _ in range(2):
+            df_cached = read_csv_cached(self.csv_path)
+            self.assertTrue(df_cached.equals(df))
+
+
+    def test_read_csr_cached_same_as_built(self):
+
+        n_build_calls = []
+
+        def build_csr_counted(df):
+            n_build_calls.append(1)
+            return build_csr(df)
+
+        csr_matrix = build_csr(pd.read_csv(self.csv_path))
+
+        for _ in range(3):
+            csr_matrix_cached = read_csr_cached(self.csv_path, build_csr_counted, "test")
+
+            self.assertEqual(csr_matrix_cached.format, "csr")
+            self.assertEqual(csr_matrix_cached.dtype, csr_matrix.dtype)
+            self.assertEqual(csr_matrix_cached.shape, csr_matrix.shape)
+            self.assertTrue(np.array_equal(csr_matrix_cached.indptr, csr_matrix.indptr))
+            self.assertTrue(np.array_equal(csr_matrix_cached.indices, csr_matrix.indices))
+            self.assertTrue(np.array_equal(csr_matrix_cached.data, csr_matrix.data))
+
+            # Changes of the returned matrix must not change the cache
+            csr_matrix_cached.data[:] = 0
+
+        self.assertEqual(len(n_build_calls), 1)
+
+
+    def test_read_csr_cached_stale_entry(self):
+
+        read_csr_cached(self.csv_path, build_csr, "test")
+
+        write_csv(self.csv_path, 1, n_rows=3000)
+        csr_matrix = build_csr(pd.read_csv(self.csv_path))
+
+        csr_matrix_cached = read_csr_cached(self.csv_path, build_csr, "test")
+
+        self.assertTrue(np.array_equal(csr_matrix_cached.toarray(), csr_matrix.toarray()))
+
+
+
+if __name__ == '__main__':
+
+    unittest.main()
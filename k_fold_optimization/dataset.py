@@ -4,27 +4,30 @@ import numpy as np
 import pandas as pd
 from scipy import sparse as sps
 
+from Utils.k_fold_split import k_fold_split_generator
+from Utils.read_csv_cached import read_csv_cached
+
 
 def load_dataset(base_folder="./Data"):
     def _load_dataset():
-        ICM = pd.read_csv(os.path.join(base_folder, "data_ICM_channel.csv"),
-                          sep=",",
-                          names=["row", "col", "data"],
-                          header=0,
-                          dtype={"row": np.int32, "col": np.int32, "data": np.float}
-                          )
-        targets = pd.read_csv(os.path.join(base_folder, "data_target_users_test.csv"),
+        ICM = read_csv_cached(os.path.join(base_folder, "data_ICM_channel.csv"),
                               sep=",",
-                              names=["user_id"],
+                              names=["row", "col", "data"],
                               header=0,
-                              dtype={"user_id": np.int32}
+                              dtype={"row": np.int32, "col": np.int32, "data": np.float}
+                              )
+        targets = read_csv_cached(os.path.join(base_folder, "data_target_users_test.csv"),
+                                  sep=",",
+                                  names=["user_id"],
+                                  header=0,
+                                  dtype={"user_id": np.int32}
+                                  )
+        URM = read_csv_cached(os.path.join(base_folder, "data_train.csv"),
+                              sep=",",
+                              names=["row", "col", "data"],
+                              header=0,
+                              dtype={"row": np.int32, "col": np.int32, "data": np.int32}
                               )
-        URM = pd.read_csv(os.path.join(base_folder, "data_train.csv"),
-                          sep=",",
-                          names=["row", "col", "data"],
-                          header=0,
-                          dtype={"row": np.int32, "col": np.int32, "data": np.int32}
-                          )
 
         return URM, ICM, targets
 
@@ -64,26 +67,10 @@ def give_me_k_folds(k):
     URM_coo, ICM_coo, targets = load_dataset(base_folder="./Data")
     ICM_csr = ICM_coo.tocsr()
 
-    n_interactions = URM_coo.nnz
-    n_interactions_per_fold = int(URM_coo.nnz / k) + 1
-    temp = np.arange(k).repeat(n_interactions_per_fold)
-    np.random.seed(0)
-    np.random.shuffle(temp)
-    assignment_to_fold = temp[:n_interactions]
-
     URM_trains = []
     ICM_trains = []
     URM_tests = []
-    for i in range(k):
-        train_mask = assignment_to_fold != i
-        test_mask = assignment_to_fold == i
-        URM_train_csr = sps.csr_matrix((URM_coo.data[train_mask],
-                                        (URM_coo.row[train_mask], URM_coo.col[train_mask])),
-                                       shape=URM_coo.shape)
-        URM_test_csr = sps.csr_matrix((URM_coo.data[test_mask],
-                                       (URM_coo.row[test_mask], URM_coo.col[test_mask])),
-                                      shape=URM_coo.shape)
-
+    for URM_train_csr, URM_test_csr in k_fold_split_generator(URM_coo, k, seed=0):
         URM_trains.append(URM_train_csr)
         ICM_trains.append(ICM_csr)
         URM_tests.append(URM_test_csr)
@@ -96,8 +83,11 @@ def give_me_randomized_k_folds_with_val_percentage(k, validation_percentage):
     ICM_trains = []
     URM_tests = []
 
+    URM_coo, ICM_coo, targets = load_dataset(base_folder="./Data")
+    ICM_csr = ICM_coo.tocsr()
+
     for _ in range(k):
-        URM_train_csr, URM_test_csr, ICM_csr, targets = give_me_splitted_dataset(validation_percentage)
+        URM_train_csr, URM_test_csr = split_train_test(URM_coo, validation_percentage)
 
         URM_trains.append(URM_train_csr)
         ICM_trains.append(ICM_csr)
@@ -1,4 +1,5 @@
 import numpy as np
+import scipy.sparse as sps
 
 
 def precision(recommended_items, relevant_items):
@@ -23,27 +24,73 @@ def MAP(recommended_items, relevant_items):
     return map_score
 
 
-def evaluate_algorithm(URM_test, recommender_object):
-    cumulative_precision = 0.0
-    cumulative_recall = 0.0
-    cumulative_MAP = 0.0
+def _get_relevance_batch(URM_test, user_id_array, recommended_items_batch):
+    """
+    :param recommended_items_batch: int array (n_users, cutoff), positions beyond the recommendation list are -1
+    :return:                        boolean array (n_users, cutoff), True if the recommended item is in the test data
+    """
 
-    num_eval = 0
+    URM_test_batch = URM_test[user_id_array]
+    n_items = URM_test.shape[1]
 
-    for user_id in range(URM_test.shape[0]):
+    # Each (user, item) couple is encoded in a single key, sorted to allow a binary search
+    test_row = np.repeat(np.arange(len(user_id_array), dtype=np.int64), np.ediff1d(URM_test_batch.indptr))
+    test_key = np.sort(test_row * n_items + URM_test_batch.indices)
 
-        relevant_items = URM_test.indices[URM_test.indptr[user_id]:URM_test.indptr[user_id + 1]]
+    recommended_key = np.arange(len(user_id_array), dtype=np.int64)[:, None] * n_items + recommended_items_batch
+    test_position = np.minimum(np.searchsorted(test_key, recommended_key), len(test_key) - 1)
 
-        if len(relevant_items) > 0:
-            recommended_items = recommender_object.recommend(user_id)
-            num_eval += 1
+    return np.logical_and(test_key[test_position] == recommended_key, recommended_items_batch >= 0)
 
-            cumulative_precision += precision(recommended_items, relevant_items)
-            cumulative_recall += recall(recommended_items, relevant_items)
-            cumulative_MAP += MAP(recommended_items, relevant_items)
 
-    cumulative_precision /= num_eval
-    cumulative_recall /= num_eval
-    cumulative_MAP /= num_eval
+def evaluate_algorithm(URM_test, recommender_object, block_size=1000):
+    """
+    Computes precision, recall and MAP of the users with at least one test interaction.
+    The users are scored in blocks of block_size and the metrics are computed on the whole block with array
+    operations, the values are the same as the ones given by precision, recall and MAP on each user.
+    """
+
+    URM_test = sps.csr_matrix(URM_test)
+
+    n_test_items = np.ediff1d(URM_test.indptr)
+    users_to_evaluate = np.arange(URM_test.shape[0])[n_test_items > 0]
+
+    precision_list, recall_list, MAP_list = [], [], []
+
+    for block_start in range(0, len(users_to_evaluate), block_size):
+
+        user_id_array = users_to_evaluate[block_start:block_start + block_size]
+        recommended_items_list = recommender_object.recommend(user_id_array)
+
+        n_recommended = np.array([len(recommended_items) for recommended_items in recommended_items_list])
+        cutoff = n_recommended.max()
+
+        recommended_items_batch = np.full((len(user_id_array), cutoff), -1, dtype=np.int64)
+
+        for user_index, recommended_items in enumerate(recommended_items_list):
+            recommended_items_batch[user_index, :n_recommended[user_index]] = recommended_items
+
+        is_relevant = _get_relevance_batch(URM_test, user_id_array, recommended_items_batch)
+        n_relevant_items = n_test_items[user_id_array]
+
+        precision_list.append(np.sum(is_relevant, axis=1, dtype=np.float32) / n_recommended)
+        recall_list.append(np.sum(is_relevant, axis=1, dtype=np.float32) / n_relevant_items)
+
+        # Cumulative sum: precision at 1, at 2, at 3 ...
+        p_at_k = is_relevant * np.cumsum(is_relevant, axis=1, dtype=np.float32) / (1 + np.arange(cutoff))
+        p_at_k_sum = np.sum(p_at_k, axis=1)
+
+        # numpy sums are not sequential, padding changes the order of the additions of the shorter lists
+        for user_index in np.arange(len(user_id_array))[n_recommended < cutoff]:
+            p_at_k_sum[user_index] = np.sum(p_at_k[user_index, :n_recommended[user_index]])
+
+        MAP_list.append(p_at_k_sum / np.minimum(n_relevant_items, n_recommended))
+
+    num_eval = len(users_to_evaluate)
+
+    # cumsum adds the values one after the other, as the per user loop did
+    cumulative_precision = np.cumsum(np.concatenate(precision_list))[-1] / num_eval
+    cumulative_recall = np.cumsum(np.concatenate(recall_list))[-1] / num_eval
+    cumulative_MAP = np.cumsum(np.concatenate(MAP_list))[-1] / num_eval
 
     return cumulative_precision, cumulative_recall, cumulative_MAP
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 18/10/26
+"""
+
+import unittest
+
+import numpy as np
+import scipy.sparse as sps
+
+from k_fold_optimization.evaluate import evaluate_algorithm
+from Recommenders.Hybrids.BaseHybridRatings import BaseHybridRatings
+from Recommenders.GraphBased.RP3betaRecommender import RP3betaRecommender
+from Recommenders.EASE_R.EASE_R_Recommender import EASE_R_Recommender
+from Recommenders.KNN.ItemKNNCFRecommender import ItemKNNCFRecommender
+
+
+def get_URM(n_users=600, n_items=200, density=0.05, random_seed=42):
+
+    URM = sps.random(n_users, n_items, density=density, format="csr", dtype=np.float32,
+                     random_state=np.random.RandomState(random_seed))
+    URM.data = np.ones_like(URM.data)
+
+    return URM
+
+
+class MyTestCase(unittest.TestCase):
+
+    def test_hybrid_ratings_same_for_all_block_sizes(self):
+
+        URM = get_URM()
+        URM_train, URM_test = sps.csr_matrix(sps.triu(URM, k=1)), sps.csr_matrix(sps.tril(URM))
+
+        recommender = BaseHybridRatings(URM_train,
+                                        RP3betaRecommender(URM_train, verbose=False),
+                                        EASE_R_Recommender(URM_train),
+                                        ItemKNNCFRecommender(URM_train, verbose=False))
+        recommender.fit(alpha=0.6, beta=0.3, gamma=0.1, alpha1=0.8, beta1=0.3, topK1=50)
+
+        result_single_user = evaluate_algorithm(URM_test, recommender, block_size=1)
+
+        for block_size in [7, 1000]:
+            result_block = evaluate_algorithm(URM_test, recommender, block_size=block_size)
+
+            self.assertTrue(np.allclose(result_block, result_single_user, atol=1e-6),
+                            "Block size {} gives {}, one user at a time gives {}".format(block_size, result_block, result_single_user))
+
+
+
+if __name__ == '__main__':
+
+    unittest.main()
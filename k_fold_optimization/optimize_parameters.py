@@ -1,4 +1,7 @@
+import multiprocessing
 import os
+import traceback
+
 import pandas as pd
 import skopt
 from skopt.utils import use_named_args
@@ -55,8 +58,130 @@ def create_df(param_tuples, param_names, value_list, metric="MAP"):
     return df
 
 
+def _fit_and_evaluate_fold(URMrecommender_class, URM_train, URM_test, recommender, params):
+    """
+    Fits the recommender of a fold with params and returns its MAP on URM_test.
+    If recommender is None a new instance is built with params, otherwise the prebuilt one is fitted again.
+    """
+
+    if recommender is None:
+        recommender = URMrecommender_class(URM_train, **params)
+        recommender.fit()
+    else:
+        # Only the mixing weights are optimized, the scores of the components are computed once
+        recommender.fit(**params, use_score_cache=True)
+
+    _, _, MAP = k_fold_optimization.evaluate.evaluate_algorithm(URM_test, recommender)
+
+    return MAP
+
+
+def _fold_worker_loop(connection, URMrecommender_class, fold_list, URM_trains, URM_tests, reuse_recommender):
+    """
+    Body of a persistent fold worker, it holds the data and the recommender instances of the folds in fold_list
+    and, for each params dictionary it receives, sends back the list of their MAP
+    """
+
+    recommenders = {fold: URMrecommender_class(URM_trains[fold], fold) if reuse_recommender else None
+                    for fold in fold_list}
+
+    while True:
+        params = connection.recv()
+
+        if params is None:
+            break
+
+        try:
+            MAP_list = [_fit_and_evaluate_fold(URMrecommender_class, URM_trains[fold], URM_tests[fold],
+                                               recommenders[fold], params) for fold in fold_list]
+            connection.send((MAP_list, None))
+
+        except Exception:
+            connection.send((None, traceback.format_exc()))
+
+    for recommender in recommenders.values():
+        if recommender is not None and hasattr(recommender, "clear_score_cache"):
+            recommender.clear_score_cache()
+
+    connection.close()
+
+
+class FoldWorkerPool(object):
+    """
+    Pool of persistent processes which evaluate the k folds of a trial in parallel.
+    Each process keeps the URM_train, URM_test and recommender instance of its folds for all the trials,
+    so that the state of the recommender, e.g., a score cache, is reused by the following trials.
+    The processes are created with fork, therefore the data is shared with the parent rather than pickled.
+    """
+
+    def __init__(self, URMrecommender_class, URM_trains, URM_tests, n_processes, reuse_recommender):
+
+        n_folds = len(URM_trains)
+        n_processes = min(n_processes, n_folds)
+
+        context = multiprocessing.get_context("fork")
+
+        self._fold_list_per_process = [list(range(process_index, n_folds, n_processes))
+                                       for process_index in range(n_processes)]
+        self._connection_list = []
+        self._process_list = []
+
+        for fold_list in self._fold_list_per_process:
+            parent_connection, child_connection = context.Pipe()
+
+            process = context.Process(target=_fold_worker_loop,
+                                      args=(child_connection, URMrecommender_class, fold_list,
+                                            URM_trains, URM_tests, reuse_recommender),
+                                      daemon=True)
+            process.start()
+            child_connection.close()
+
+            self._connection_list.append(parent_connection)
+            self._process_list.append(process)
+
+        self._n_folds = n_folds
+
+    def evaluate(self, params):
+        """
+        :param params:  dictionary of hyperparameters
+        :return:        list of the MAP of each fold, in fold order
+        """
+
+        for connection in self._connection_list:
+            connection.send(params)
+
+        MAP_per_fold = [None] * self._n_folds
+        error_list = []
+
+        for connection, fold_list in zip(self._connection_list, self._fold_list_per_process):
+            MAP_list, error = connection.recv()
+
+            if error is not None:
+                error_list.append(error)
+            else:
+                for fold, MAP in zip(fold_list, MAP_list):
+                    MAP_per_fold[fold] = MAP
+
+        if len(error_list) > 0:
+            raise RuntimeError("FoldWorkerPool: evaluation failed in a worker process\n" + "\n".join(error_list))
+
+        return MAP_per_fold
+
+    def close(self):
+
+        for connection in self._connection_list:
+            connection.send(None)
+            connection.close()
+
+        for process in self._process_list:
+            process.join()
+
+        self._connection_list = []
+        self._process_list = []
+
+
 def optimize_parameters(URMrecommender_class: type, n_calls=100, k=5, validation_percentage=0.05, n_random_starts=None,
-                        seed=None, limit_at=1000, forest=False, xi=0.01):
+                        seed=None, limit_at=1000, forest=False, xi=0.01, n_processes=1):
     if n_random_starts is None:
         n_random_starts = int(0.5 * n_calls)
 
@@ -79,17 +204,38 @@ def optimize_parameters(URMrecommender_class: type, n_calls=100, k=5, validation
     assert (len(URM_trains) == len(URM_tests) and len(URM_tests) == len(ICM_trains))
     print("Starting optimization: N_folds={}, slim_name={}".format(len(URM_trains), names[URMrecommender_class]))
 
-    if URMrecommender_class == HybridRatings_IALS_hybrid_EASE_R_hybrid_SLIM_Rp3:
-        recommenders = []
+    # The folds are evaluated sequentially unless n_processes > 1 is requested, None uses all the cores
+    if n_processes is None:
+        n_processes = multiprocessing.cpu_count()
+
+    # The hybrid is built once for each fold and only fitted again with the new mixing weights
+    reuse_recommender = URMrecommender_class == HybridRatings_IALS_hybrid_EASE_R_hybrid_SLIM_Rp3
+
+    fold_worker_pool = None
+    recommenders = []
+
+    if n_processes > 1 and len(URM_trains) > 1:
+        print("Evaluating the folds in parallel with {} processes".format(min(n_processes, len(URM_trains))))
+        fold_worker_pool = FoldWorkerPool(URMrecommender_class, URM_trains, URM_tests, n_processes, reuse_recommender)
+
+        @use_named_args(space)
+        def objective(**params):
+            scores = [-MAP for MAP in fold_worker_pool.evaluate(params)]
+
+            print("Just Evaluated this: {}".format(params))
+            print("MAP: {}, diff: {}".format(sum(scores) / len(scores), max(scores) - min(scores)))
+
+            return sum(scores) / len(scores)
+
+    elif reuse_recommender:
         for i, URM_train_csr in enumerate(URM_trains):
             recommenders.append(URMrecommender_class(URM_train_csr, i))
 
         @use_named_args(space)
         def objective(**params):
             scores = []
-            for recommender, test in zip(recommenders, URM_tests):
-                recommender.fit(**params)
-                _, _, MAP = k_fold_optimization.evaluate.evaluate_algorithm(test, recommender)
+            for recommender, URM_train_csr, test in zip(recommenders, URM_trains, URM_tests):
+                MAP = _fit_and_evaluate_fold(URMrecommender_class, URM_train_csr, test, recommender, params)
                 scores.append(-MAP)
             print("Just Evaluated this: {}".format(params))
             return sum(scores) / len(scores)
@@ -114,38 +260,47 @@ def optimize_parameters(URMrecommender_class: type, n_calls=100, k=5, validation
     param_names = [v.name for v in spaces[URMrecommender_class]]
     xs, ys = read_df(name, param_names)
 
-    if not forest:
-        res_gp = skopt.gp_minimize(
-            objective,
-            space,
-            n_calls=n_calls,
-            n_random_starts=n_random_starts,
-            n_points=10000,
-            n_jobs=1,
-            # noise = 'gaussian',
-            noise=1e-5,
-            acq_func='gp_hedge',
-            acq_optimizer='auto',
-            random_state=None,
-            verbose=True,
-            n_restarts_optimizer=10,
-            xi=xi,
-            kappa=1.96,
-            x0=xs,
-            y0=ys,
-        )
-    else:
-        res_gp = skopt.forest_minimize(
-            objective,
-            space,
-            n_calls=n_calls,
-            n_random_starts=n_random_starts,
-            verbose=True,
-            x0=xs,
-            y0=ys,
-            acq_func="EI",
-            xi=xi
-        )
+    try:
+        if not forest:
+            res_gp = skopt.gp_minimize(
+                objective,
+                space,
+                n_calls=n_calls,
+                n_random_starts=n_random_starts,
+                n_points=10000,
+                n_jobs=1,
+                # noise = 'gaussian',
+                noise=1e-5,
+                acq_func='gp_hedge',
+                acq_optimizer='auto',
+                random_state=None,
+                verbose=True,
+                n_restarts_optimizer=10,
+                xi=xi,
+                kappa=1.96,
+                x0=xs,
+                y0=ys,
+            )
+        else:
+            res_gp = skopt.forest_minimize(
+                objective,
+                space,
+                n_calls=n_calls,
+                n_random_starts=n_random_starts,
+                verbose=True,
+                x0=xs,
+                y0=ys,
+                acq_func="EI",
+                xi=xi
+            )
+
+    finally:
+        if fold_worker_pool is not None:
+            fold_worker_pool.close()
+
+        for recommender in recommenders:
+            if hasattr(recommender, "clear_score_cache"):
+                recommender.clear_score_cache()
 
     print("Writing a total of {} points for {}. Newly added records: {}".format(len(res_gp.x_iters), name,
                                                                                 n_calls))
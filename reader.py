@@ -10,10 +10,12 @@ import numpy as np
 from tqdm import tqdm
 
 from Evaluation.Evaluator import EvaluatorHoldout
+from Utils.k_fold_split import k_fold_split_generator
+from Utils.read_csv_cached import read_csv_cached, read_csr_cached
 
 
-def load_urm():
-    df_original = load_urm_df()
+def _urm_df_to_csr(df_original):
+    df_original.columns = ["UserID", "ItemID", "Data"]
 
     user_id_list = df_original['UserID'].values
     item_id_list = df_original['ItemID'].values
@@ -25,12 +27,20 @@ def load_urm():
     return csr_matrix
 
 
+def load_urm():
+    urm_path = os.path.join(os.path.dirname(__file__), 'Data/data_train.csv')
+
+    # The CSR arrays are cached, the following calls neither parse the CSV nor build the matrix
+    return read_csr_cached(urm_path, _urm_df_to_csr, "URM", sep=',', header=0,
+                           dtype={0: np.int32, 1: np.int32, 2: np.int32})
+
+
 def load_target():
     target_path = os.path.join(os.path.dirname(__file__),
                                'Data/data_target_users_test.csv')
 
-    df_original = pd.read_csv(filepath_or_buffer=target_path, sep=',', header=0,
-                              dtype={'UserID': np.int32})
+    df_original = read_csv_cached(target_path, sep=',', header=0,
+                                  dtype={'UserID': np.int32})
 
     df_original.columns = ['UserID']
 
@@ -46,28 +56,33 @@ def load_target():
     return user_id_unique
 
 
-def load_icm(icm_file, weight=1):
-    icm_path = os.path.join(os.path.dirname(__file__), 'Data/')
-
-    df_original = pd.read_csv(filepath_or_buffer=icm_path + icm_file, sep=',', header=0,
-                              dtype={'ItemID': np.int32, 'Feature': np.int32, 'Data': np.int32})
-
+def _icm_df_to_csr(df_original):
     df_original.columns = ['ItemID', 'Feature', 'Data']
 
     item_id_list = df_original['ItemID'].values
     feature_id_list = df_original['Feature'].values
-    data_id_list = df_original['Data'].values * weight
+    data_id_list = df_original['Data'].values
 
     csr_matrix = sps.csr_matrix((data_id_list, (item_id_list, feature_id_list)))
 
     return csr_matrix
 
 
+def load_icm(icm_file, weight=1):
+    icm_path = os.path.join(os.path.dirname(__file__), 'Data/')
+
+    # The CSR arrays are cached without the weight, which scales all the values
+    csr_matrix = read_csr_cached(icm_path + icm_file, _icm_df_to_csr, "ICM", sep=',', header=0,
+                                 dtype={'ItemID': np.int32, 'Feature': np.int32, 'Data': np.int32})
+
+    return csr_matrix if weight == 1 else csr_matrix * weight
+
+
 def load_merged_icm(icm_file, weight=1):
     icm_path = os.path.join(os.path.dirname(__file__), 'Data/')
 
-    df_original = pd.read_csv(filepath_or_buffer=icm_path + icm_file, sep=',', header=0,
-                              dtype={'ItemID': np.int32, 'Feature': np.int32, 'Data': np.int32})
+    df_original = read_csv_cached(icm_path + icm_file, sep=',', header=0,
+                                  dtype={'ItemID': np.int32, 'Feature': np.int32, 'Data': np.int32})
 
     item_id_list = df_original['ItemID'].values
     channel_list = df_original['Channel'].values
@@ -142,8 +157,8 @@ def group_users_in_urm(URM_train, URM_test, group_to_test):
 
 def load_urm_df():
     urm_path = os.path.join(os.path.dirname(__file__), 'Data/data_train.csv')
-    df_original = pd.read_csv(filepath_or_buffer=urm_path, sep=',', header=0,
-                              dtype={0: np.int32, 1: np.int32, 2: np.int32})
+    df_original = read_csv_cached(urm_path, sep=',', header=0,
+                                  dtype={0: np.int32, 1: np.int32, 2: np.int32})
 
     df_original.columns = ["UserID", "ItemID", "Data"]
 
@@ -156,29 +171,18 @@ def load_urm_coo():
     return URM_coo
 
 
-def get_k_folds_URM(k=3):
-    URM_coo = load_urm_coo()
+def get_k_folds_URM_generator(k=3):
+    """
+    Yields the (URM_train, URM_test) couple of each fold, the fold assignment is stored on disk
+    """
+    return k_fold_split_generator(load_urm_coo(), k, seed=0)
 
-    n_interactions = URM_coo.nnz
-    n_interactions_per_fold = int(URM_coo.nnz / k) + 1
-    temp = np.arange(k).repeat(n_interactions_per_fold)
-    np.random.seed(0)
-    np.random.shuffle(temp)
-    assignment_to_fold = temp[:n_interactions]
 
+def get_k_folds_URM(k=3):
     URM_trains = []
     URM_tests = []
 
-    for i in tqdm(range(k), desc='Generating folds'):
-        train_mask = assignment_to_fold != i
-        test_mask = assignment_to_fold == i
-        URM_train_csr = sps.csr_matrix((URM_coo.data[train_mask],
-                                        (URM_coo.row[train_mask], URM_coo.col[train_mask])),
-                                       shape=URM_coo.shape)
-        URM_test_csr = sps.csr_matrix((URM_coo.data[test_mask],
-                                       (URM_coo.row[test_mask], URM_coo.col[test_mask])),
-                                      shape=URM_coo.shape)
-
+    for URM_train_csr, URM_test_csr in tqdm(get_k_folds_URM_generator(k=k), total=k, desc='Generating folds'):
         URM_trains.append(URM_train_csr)
         URM_tests.append(URM_test_csr)
 
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 18/10/26
+"""
+
+import time
+import numpy as np
+
+from reader import load_urm
+from Recommenders.MatrixFactorization.PureSVDRecommender import PureSVDRecommender
+from Recommenders.MatrixFactorization.IALSRecommender import IALSRecommender
+from Recommenders.MatrixFactorization.IVFInnerProductIndex import get_recall_at_cutoff
+
+
+def _time_recommend_topk(recommender, user_id_array, cutoff, block_size=1000):
+
+    ranking_list = []
+    start_time = time.time()
+
+    for block_start in range(0, len(user_id_array), block_size):
+        ranking_list.append(recommender.recommend_topk(user_id_array[block_start:block_start + block_size], cutoff=cutoff))
+
+    return np.concatenate(ranking_list), time.time() - start_time
+
+
+def _time_index_search(recommender, user_id_array, cutoff, block_size=1000):
+    """
+    Searches the approximate index alone, without the exact scoring of the users whose probed lists
+    hold less than cutoff items, so the recall is the one of the index
+    """
+
+    ranking_list = []
+    start_time = time.time()
+
+    for block_start in range(0, len(user_id_array), block_size):
+        block_user_id_array = user_id_array[block_start:block_start + block_size]
+        ranking, _ = recommender.approximate_index.search(recommender.USER_factors[block_user_id_array], cutoff,
+                                                          excluded_items_csr=recommender.URM_train[block_user_id_array])
+        ranking_list.append(ranking)
+
+    return np.concatenate(ranking_list), time.time() - start_time
+
+
+def run_benchmark(recommender, n_probe_list, cutoff=10, n_lists=None, random_seed=42):
+    """
+    For each n_probe reports the recall of the index alone, the share of users whose probed lists hold less than
+    cutoff items, which recommend_topk scores exactly, and the recall and time of recommend_topk with that fallback.
+    The calibrated default n_probe is also evaluated
+    """
+
+    user_id_array = np.arange(recommender.n_users)[np.ediff1d(recommender.URM_train.indptr) > 0]
+    n_items = recommender.ITEM_factors.shape[0]
+
+    recommender.clear_approximate_index()
+    ranking_exact, time_exact = _time_recommend_topk(recommender, user_id_array, cutoff)
+
+    start_time = time.time()
+    recommender.build_approximate_index(n_lists=n_lists, random_seed=random_seed, cutoff=cutoff)
+    time_build = time.time() - start_time
+
+    default_n_probe = recommender.approximate_index.n_probe
+
+    print("{}: exact {:.3f} ms/user, index with {} lists built and calibrated in {:.2f} sec, default n_probe {}".format(
+        recommender.RECOMMENDER_NAME, time_exact / len(user_id_array) * 1e3,
+        recommender.approximate_index.n_lists, time_build, default_n_probe))
+
+    for n_probe in sorted(set(n_probe_list) | {default_n_probe}):
+        recommender.approximate_index.n_probe = n_probe
+
+        ranking_index, time_index = _time_index_search(recommender, user_id_array, cutoff)
+        ranking_approximate, time_approximate = _time_recommend_topk(recommender, user_id_array, cutoff)
+
+        print("{}: n_probe {:4d}, index recall@{} {:.4f}, {:.3f} ms/user, speedup {:.1f}x, "
+              "exact fallback {:5.1f}% users, recommend_topk recall@{} {:.4f}, {:.3f} ms/user, speedup {:.1f}x".format(
+            recommender.RECOMMENDER_NAME, n_probe,
+            cutoff, get_recall_at_cutoff(ranking_exact, ranking_index, n_items),
+            time_index / len(user_id_array) * 1e3, time_exact / time_index,
+            np.mean(ranking_index[:, -1] == -1) * 100,
+            cutoff, get_recall_at_cutoff(ranking_exact, ranking_approximate, n_items),
+            time_approximate / len(user_id_array) * 1e3, time_exact / time_approximate))
+
+    recommender.clear_approximate_index()
+
+
+
+if __name__ == '__main__':
+
+    URM_all = load_urm()
+
+    n_probe_list = [1, 2, 5, 10, 20, 50]
+
+    recommender = PureSVDRecommender(URM_all)
+    recommender.fit(num_factors=28)
+    run_benchmark(recommender, n_probe_list)
+
+    recommender = IALSRecommender(URM_all)
+    recommender.fit(epochs=10, num_factors=50, alpha=10.0, reg=1e-3)
+    run_benchmark(recommender, n_probe_list)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 18/10/26
+"""
+
+import time
+import numpy as np
+import scipy.sparse as sps
+
+from Recommenders.Recommender_utils import similarityMatrixTopK, check_matrix
+
+
+def similarityMatrixTopK_loop(item_weights, k=100):
+    """
+    Previous column by column implementation of similarityMatrixTopK, used as reference
+    """
+
+    nitems = item_weights.shape[1]
+    k = min(k, nitems)
+
+    sparse_weights = not isinstance(item_weights, np.ndarray)
+
+    data, rows_indices, cols_indptr = [], [], []
+
+    if sparse_weights:
+        item_weights = check_matrix(item_weights, format='csc', dtype=np.float32)
+    else:
+        column_row_index = np.arange(nitems, dtype=np.int32)
+
+    for item_idx in range(nitems):
+
+        cols_indptr.append(len(data))
+
+        if sparse_weights:
+            start_position = item_weights.indptr[item_idx]
+            end_position = item_weights.indptr[item_idx+1]
+
+            column_data = item_weights.data[start_position:end_position]
+            column_row_index = item_weights.indices[start_position:end_position]
+
+        else:
+            column_data = item_weights[:,item_idx]
+
+        non_zero_data = column_data!=0
+
+        idx_sorted = np.argsort(column_data[non_zero_data])
+        top_k_idx = idx_sorted[-k:]
+
+        data.extend(column_data[non_zero_data][top_k_idx])
+        rows_indices.extend(column_row_index[non_zero_data][top_k_idx])
+
+    cols_indptr.append(len(data))
+
+    return sps.csc_matrix((data, rows_indices, cols_indptr), shape=(nitems, nitems), dtype=np.float32)
+
+
+
+def _time_function(function, item_weights, k):
+
+    start_time = time.time()
+    W_sparse = function(item_weights, k=k)
+
+    return W_sparse, time.time() - start_time
+
+
+
+if __name__ == '__main__':
+
+    n_items = 5000
+    topK = 100
+
+    random_state = np.random.RandomState(42)
+
+    input_dict = {
+        "dense": random_state.normal(size=(n_items, n_items)).astype(np.float32),
+        "sparse": sps.random(n_items, n_items, density=0.05, format="csc", dtype=np.float32, random_state=random_state),
+    }
+
+    for input_label, item_weights in input_dict.items():
+
+        W_sparse_loop, time_loop = _time_function(similarityMatrixTopK_loop, item_weights, topK)
+        W_sparse_vectorized, time_vectorized = _time_function(similarityMatrixTopK, item_weights, topK)
+
+        identical = (W_sparse_loop != W_sparse_vectorized).nnz == 0
+
+        print("similarityMatrixTopK {} {}x{}, topK {}: loop {:.2f} sec, vectorized {:.2f} sec, speedup {:.1f}x, identical output {}".format(
+            input_label, n_items, n_items, topK, time_loop, time_vectorized, time_loop / time_vectorized, identical))
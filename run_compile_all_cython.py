@@ -19,6 +19,7 @@ if __name__ == '__main__':
         "Recommenders/Similarity",
         "Recommenders/SLIM",
         "Recommenders/FeatureWeighting",
+        "Recommenders/GraphBased",
     ]
 
 
@@ -91,7 +91,7 @@ def read_data_split_and_search():
     # new function to evaluate 1 group of users (for now split at 50%)
     # evaluator_validation = group_users_in_urm(URM_train, URM_validation, 1)
 
-    evaluator_validation = EvaluatorHoldout(URM_validation, cutoff_list=cutoff_list)
+    evaluator_validation = EvaluatorHoldout(URM_validation, cutoff_list=cutoff_list, metrics_list=[metric_to_optimize])
 
     # COLLABORATIVE
     # runParameterSearch_Collaborative_partial = partial(runHyperparameterSearch_Collaborative,